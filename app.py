@@ -4,23 +4,46 @@ import datetime
 import logging
 import stripe
 import html
+import asyncio
+import io
 import time
-from typing import Dict, Optional
+from typing import Optional
 from fastapi import FastAPI, Request, HTTPException
+from fastapi.responses import PlainTextResponse
 from telegram import Update
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, filters, ContextTypes
+from telegram.ext import CommandHandler, CallbackQueryHandler, filters, ContextTypes
 from telegram.error import TimedOut
-from bot_core.db import get_pool, init_db, add_member, log_action
+from bot_core.db import (
+    get_pool, init_pool, close_pool, pool_stats, acquire, add_member, invalidate_member,
+    close_log_buffer, log_buffer_stats, get_daily_stats, get_plan_totals, backfill_rollups, extend_member_expiry
+)
+from bot_core.migrations import migrate
+from bot_core.metrics import Gauge, timed_handler, render as render_metrics, UPDATES_TOTAL, STRIPE_WEBHOOK_TOTAL
+from bot_core.base_bot import callback_branch
+from bot_core.tracing import close_exporter as close_trace_exporter
+from bot_core.profiler import profile, ProfilerBusy
 from bot_core.utils import create_invite_link, send_daily_report
-from bots.let_mebot import LetMeBot
-from bots.morevids_bot import MoreVidsBot
-from bots.onlytrns_bot import OnlyTrnsBot
-from bots.tswrldbot import TsWrldBot
-from bots.lust4trans_bot import Lust4transBot
+from bot_core.stripe_client import (
+    stripe_stats, invalidate_checkout_session, retrieve_subscription, shutdown as shutdown_stripe_client
+)
+from bot_core.stripe_inbox import store_event, start_workers, stop_workers, inbox_stats, requeue_dead_events, prune_events
+from bot_core.scheduler import Scheduler, job_status
+from bot_core.enforcement import enforce_expiry
+from bot_core.log_partitions import maintain_partitions
+from bot_core.stripe_sync import record_payment, reconcile_payments
+from bot_core import outbound
+from bot_core.notifications import NotificationAggregator
+from bot_core.registry import BotRegistry, load_bot_specs
+from bot_core.updates import (
+    enqueue_update, update_stats, QueueFull as UpdateQueueFull, UpdateDeduplicator, prune_update_ids
+)
 from config import (
-    STRIPE_WEBHOOK_SECRET, RENDER_EXTERNAL_URL, ADMIN_USER_ID,
-    LETMEBOT_TOKEN, MOREVIDS_TOKEN, ONLYTRNS_TOKEN, TSWRLDBOT_TOKEN, LUST4TRANS_TOKEN,
-    LUST4TRANS_PROMOTER_ID, TSWRLDBOT_PROMOTER_ID, CHANNEL_ID
+    STRIPE_WEBHOOK_SECRET, RENDER_EXTERNAL_URL, ADMIN_USER_ID, ADMIN_BOT_KEY,
+    LUST4TRANS_PROMOTER_ID, CHANNEL_ID,
+    BOT_STARTUP_CONCURRENCY, BOT_STARTUP_TIMEOUT,
+    DAILY_REPORT_HOUR, DAILY_REPORT_MINUTE, STRIPE_EVENT_PRUNE_INTERVAL, STRIPE_EVENT_RETENTION_DAYS,
+    ENFORCEMENT_INTERVAL, ENFORCEMENT_DRY_RUN, LOG_MAINTENANCE_INTERVAL, STRIPE_SYNC_INTERVAL,
+    UPDATE_DEDUP_BACKEND, NOTIFY_SWEEP_INTERVAL
 )
 import transaction_report
 
@@ -29,18 +52,26 @@ logger = logging.getLogger(__name__)
 
 app = FastAPI()
 
-BOT_CLASSES = {
-    "letmebot": {"cls": LetMeBot, "token": LETMEBOT_TOKEN},
-    "morevids": {"cls": MoreVidsBot, "token": MOREVIDS_TOKEN},
-    "onlytrns": {"cls": OnlyTrnsBot, "token": ONLYTRNS_TOKEN},
-    "tswrld": {"cls": TsWrldBot, "token": TSWRLDBOT_TOKEN},
-    "lust4trans": {"cls": Lust4transBot, "token": LUST4TRANS_TOKEN},
-}
-
-applications = {}
-
-# 중복 알림 방지용 캐시
-recent_notifications: Dict[str, float] = {}
+registry: Optional[BotRegistry] = None
+scheduler = Scheduler()
+notifier = NotificationAggregator(lambda key: registry.get_bot(key))
+update_dedup = UpdateDeduplicator()
+startup_timings = {}
+
+# scrape 시점에 현재 값을 읽는 gauge
+Gauge('db_pool_connections', 'DB pool connections by state', ['state'],
+      collect=lambda: [((state,), pool_stats()[state]) for state in ('size', 'idle', 'in_use', 'waiters')])
+Gauge('log_buffer_pending', 'daily_logs rows waiting for the next flush',
+      collect=lambda: [((), log_buffer_stats()['pending'])])
+Gauge('outbound_queue_depth', 'Outbound Telegram sends waiting in queue', ['priority'],
+      collect=lambda: [((priority,), depth) for priority, depth in outbound.outbound_stats()['queue_depth'].items()])
+Gauge('notification_pending_recipients', 'Recipients with aggregated notifications not yet sent',
+      collect=lambda: [((), notifier.pending_recipients())])
+Gauge('telegram_update_queue_depth', 'Updates waiting in each bot update_queue', ['bot'],
+      collect=lambda: [((key,), telegram_app.update_queue.qsize()) for key, telegram_app in registry.applications.items()])
+Gauge('telegram_updates_in_flight', 'Updates being processed per bot', ['bot'],
+      collect=lambda: [((key,), update_stats(telegram_app).get('in_flight', 0))
+                       for key, telegram_app in registry.applications.items()])
 
 
 def get_subscription_id_from_event(event_type: str, data_object: dict) -> Optional[str]:
@@ -63,49 +94,171 @@ def get_subscription_id_from_event(event_type: str, data_object: dict) -> Option
     return None
 
 
-@app.on_event("startup")
-async def startup_event():
-    pool = await get_pool()
-    await init_db(pool)
-    for key, cfg in BOT_CLASSES.items():
-        bot_instance = cfg["cls"]()
-        telegram_app = Application.builder().token(cfg["token"]).build()
-
-        telegram_app.add_handler(CommandHandler("start", bot_instance.start))
-        telegram_app.add_handler(CallbackQueryHandler(bot_instance.button_handler))
-
-        telegram_app.add_handler(CommandHandler("paid", paid_command))
-        telegram_app.add_handler(CommandHandler("kick", kick_command))
-
-        telegram_app.add_handler(CommandHandler("user", user_count_command,
-                                                filters=filters.User(user_id=ADMIN_USER_ID) |
-                                                filters.User(user_id=int(LUST4TRANS_PROMOTER_ID))))
-        telegram_app.add_handler(CommandHandler("stats", lust4trans_stats_command,
-                                                filters=filters.User(user_id=ADMIN_USER_ID) |
-                                                filters.User(user_id=int(LUST4TRANS_PROMOTER_ID))))
-
-        telegram_app.add_handler(CommandHandler("transactions", transaction_report.transactions_command))
-        telegram_app.add_handler(CommandHandler("sync_stripe", transaction_report.sync_stripe_command))
-
-        telegram_app.job_queue.run_daily(
-            send_daily_report,
-            time=datetime.time(hour=9, minute=0, tzinfo=datetime.timezone.utc)
-        )
+def _command(name, callback, **kwargs):
+    return CommandHandler(name, timed_handler(f"/{name}", callback), **kwargs)
+
+
+def configure_application(key, telegram_app, bot_instance):
+    # 모든 핸들러는 timed_handler로 감싸 /metrics에 지연/결과를 남김 (버튼은 callback 분기별)
+    telegram_app.add_handler(_command("start", bot_instance.start))
+    telegram_app.add_handler(CallbackQueryHandler(timed_handler(
+        lambda update: f"button:{callback_branch(update.callback_query.data)}", bot_instance.button_handler
+    )))
+
+    telegram_app.add_handler(_command("paid", paid_command))
+    telegram_app.add_handler(_command("kick", kick_command))
 
-        webhook_url = f"{RENDER_EXTERNAL_URL}/webhook/{key}"
+    telegram_app.add_handler(_command("user", user_count_command,
+                                      filters=filters.User(user_id=ADMIN_USER_ID) |
+                                      filters.User(user_id=int(LUST4TRANS_PROMOTER_ID))))
+    telegram_app.add_handler(_command("stats", lust4trans_stats_command,
+                                      filters=filters.User(user_id=ADMIN_USER_ID) |
+                                      filters.User(user_id=int(LUST4TRANS_PROMOTER_ID))))
+
+    telegram_app.add_handler(_command("transactions", transaction_report.transactions_command))
+    telegram_app.add_handler(_command("sync_stripe", transaction_report.sync_stripe_command))
+    telegram_app.add_handler(_command("stripe_inbox", stripe_inbox_command))
+    telegram_app.add_handler(_command("enforce", enforce_command))
+    telegram_app.add_handler(_command("rollups", rollups_command))
+    telegram_app.add_handler(_command("profile", profile_command))
+
+
+async def _ensure_webhook(key):
+    bot = registry.get_bot(key)
+    webhook_url = f"{RENDER_EXTERNAL_URL}/webhook/{key}"
+    started = time.perf_counter()
+    info = await bot.get_webhook_info()
+    if info.url == webhook_url:
+        logger.info(f"{key} webhook already set: {webhook_url}")
+    else:
+        await bot.set_webhook(url=webhook_url)
+        logger.info(f"{key} webhook set: {webhook_url}")
+    return {'webhook_ms': round((time.perf_counter() - started) * 1000, 1)}
+
+
+async def _ensure_webhook_bounded(semaphore, key):
+    async with semaphore:
         try:
-            await telegram_app.bot.set_webhook(url=webhook_url)
-            logger.info(f"{key} webhook set: {webhook_url}")
-        except TimedOut:
+            startup_timings[key] = await asyncio.wait_for(_ensure_webhook(key), timeout=BOT_STARTUP_TIMEOUT)
+        except (asyncio.TimeoutError, TimedOut):
             logger.warning(f"Webhook set timeout for {key}")
+            startup_timings[key] = {'error': 'timeout'}
         except Exception as e:
             logger.error(f"Webhook set failed for {key}: {e}")
+            startup_timings[key] = {'error': str(e)}
+
+
+async def _renewal_period_end(invoice, subscription_id):
+    """갱신된 기간의 끝(UTC naive datetime). invoice line의 period.end, 없으면 구독의 current_period_end"""
+    lines = (invoice.get('lines') or {}).get('data') or []
+    period_end = ((lines[0].get('period') or {}).get('end')) if lines else None
+    if not period_end and subscription_id:
+        try:
+            subscription = await retrieve_subscription(subscription_id)
+            period_end = subscription.get('current_period_end')
+        except Exception as e:
+            logger.error(f"Subscription lookup failed for {subscription_id}: {e}")
+    return datetime.datetime.utcfromtimestamp(period_end) if period_end else None
+
+
+async def notify_payment(bot_name, group_key, msg):
+    """관리자(+프로모터) 결제 알림. 같은 구독의 이벤트는 잠시 모았다가 한 메시지로 보냄"""
+    await notifier.add(ADMIN_BOT_KEY, ADMIN_USER_ID, group_key, msg)
+    promoter_id = get_promoter_id(bot_name)
+    if promoter_id:
+        await notifier.add(bot_name, promoter_id, group_key, msg)
 
-        await telegram_app.initialize()
-        await telegram_app.start()
-        applications[key] = {"app": telegram_app, "bot_instance": bot_instance}
 
-    logger.info(f"Registered applications keys: {list(applications.keys())}")
+def get_promoter_id(bot_name):
+    promoter_id = registry.spec(bot_name).get('promoter_id')
+    if promoter_id and promoter_id != ADMIN_USER_ID and bot_name in registry:
+        return promoter_id
+    return None
+
+
+async def daily_report_job():
+    await send_daily_report(registry.get_bot(ADMIN_BOT_KEY))
+
+
+async def stripe_event_prune_job():
+    deleted = await prune_events(await get_pool())
+    if deleted:
+        logger.info(f"Pruned {deleted} processed Stripe events older than {STRIPE_EVENT_RETENTION_DAYS} days")
+
+
+async def update_dedup_prune_job():
+    await prune_update_ids(await get_pool())
+
+
+async def stripe_sync_job():
+    await reconcile_payments(await get_pool())
+
+
+async def log_maintenance_job():
+    await maintain_partitions(await get_pool())
+
+
+def get_enforcement_bot(bot_name):
+    return registry.get_bot(bot_name) or registry.get_bot(ADMIN_BOT_KEY)
+
+
+async def notification_sweep_job():
+    await notifier.recover()
+
+
+async def expiry_enforcement_job():
+    await enforce_expiry(await get_pool(), get_enforcement_bot)
+
+
+@app.on_event("startup")
+async def startup_event():
+    global registry
+    pool = await init_pool()
+    await migrate(pool)
+
+    started = time.perf_counter()
+    registry = BotRegistry(load_bot_specs(), configure_application)
+    await registry.initialize()
+    transaction_report.set_bot_names(registry.keys())
+
+    # Application 초기화는 첫 webhook 요청 때
+    semaphore = asyncio.Semaphore(BOT_STARTUP_CONCURRENCY)
+    await asyncio.gather(*(_ensure_webhook_bounded(semaphore, key) for key in registry.keys()))
+
+    logger.info(f"Registered bots: {registry.keys()} "
+                f"in {(time.perf_counter() - started) * 1000:.0f}ms")
+    outbound.start()
+    # 이전 프로세스가 window 안에서 못 보낸 알림
+    await notifier.recover()
+    start_workers(handle_stripe_event)
+
+    scheduler.add_daily("daily_report", daily_report_job, hour=DAILY_REPORT_HOUR, minute=DAILY_REPORT_MINUTE)
+    scheduler.add_interval("stripe_event_prune", stripe_event_prune_job, STRIPE_EVENT_PRUNE_INTERVAL)
+    scheduler.add_interval("expiry_enforcement", expiry_enforcement_job, ENFORCEMENT_INTERVAL)
+    scheduler.add_interval("log_maintenance", log_maintenance_job, LOG_MAINTENANCE_INTERVAL)
+    scheduler.add_interval("stripe_sync", stripe_sync_job, STRIPE_SYNC_INTERVAL)
+    scheduler.add_interval("notification_sweep", notification_sweep_job, NOTIFY_SWEEP_INTERVAL)
+    if UPDATE_DEDUP_BACKEND == 'postgres':
+        scheduler.add_interval("update_dedup_prune", update_dedup_prune_job, 3600)
+    scheduler.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await scheduler.stop()
+    # 큐에 남은 Telegram update는 DB/outbound가 살아 있을 때 마저 처리
+    if registry is not None:
+        await registry.stop_applications()
+    await stop_workers()
+    await notifier.flush_all()
+    await outbound.stop()
+    if registry is not None:
+        await registry.shutdown()
+    shutdown_stripe_client()
+    transaction_report.shutdown()
+    await close_log_buffer()
+    await close_pool()
+    close_trace_exporter()
 
 
 @app.get("/health")
@@ -113,20 +266,77 @@ async def health():
     return "OK"
 
 
+@app.get("/health/db")
+async def health_db():
+    return {**pool_stats(), 'log_buffer': log_buffer_stats()}
+
+
+@app.get("/health/bots")
+async def health_bots():
+    return {
+        key: {**startup_timings.get(key, {}), 'initialize_ms': registry.init_timings.get(key)}
+        for key in registry.keys()
+    }
+
+
+@app.get("/health/updates")
+async def health_updates():
+    return {
+        'bots': {key: update_stats(telegram_app) for key, telegram_app in registry.applications.items()},
+        'dedup': update_dedup.snapshot(),
+    }
+
+
+@app.get("/health/outbound")
+async def health_outbound():
+    return {**outbound.outbound_stats(), 'notifications': notifier.stats}
+
+
+@app.get("/health/jobs")
+async def health_jobs():
+    return await job_status(await get_pool())
+
+
+@app.get("/health/stripe")
+async def health_stripe():
+    return stripe_stats()
+
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
 @app.post("/webhook/{bot_key}")
 async def telegram_webhook(request: Request, bot_key: str):
-    if bot_key not in applications:
+    if bot_key not in registry:
         logger.error(f"Unknown bot_key: {bot_key}")
         raise HTTPException(status_code=404)
 
-    telegram_app = applications[bot_key]["app"]
+    update_id = None
     try:
         json_data = await request.json()
+        update_id = json_data.get('update_id')
+        # Telegram 재전송분은 Application 생성/파싱 없이 바로 200
+        if update_id is not None and not await update_dedup.claim(bot_key, update_id):
+            UPDATES_TOTAL.inc(bot_key, 'duplicate')
+            return {"status": "duplicate"}
+        telegram_app = await registry.get_application(bot_key)
         update = Update.de_json(json_data, telegram_app.bot)
-        await telegram_app.process_update(update)
+        # 처리는 Application의 update 처리 태스크가 담당. 응답은 큐에 넣자마자 반환
+        enqueue_update(telegram_app, update)
+        UPDATES_TOTAL.inc(bot_key, 'enqueued')
         return {"status": "ok"}
+    except UpdateQueueFull:
+        logger.warning(f"Update queue full for {bot_key}, rejecting update")
+        UPDATES_TOTAL.inc(bot_key, 'queue_full')
+        await update_dedup.release(bot_key, update_id)
+        raise HTTPException(status_code=503)
     except Exception as e:
         logger.error(f"Telegram webhook error for {bot_key}: {e}")
+        UPDATES_TOTAL.inc(bot_key, 'error')
+        if update_id is not None:
+            await update_dedup.release(bot_key, update_id)
         raise HTTPException(status_code=400)
 
 
@@ -140,106 +350,107 @@ async def stripe_webhook(request: Request):
         )
     except Exception as e:
         logger.error(f"Stripe webhook signature verification failed: {e}")
+        STRIPE_WEBHOOK_TOTAL.inc('unknown', 'bad_signature')
         raise HTTPException(status_code=400)
 
+    try:
+        pool = await get_pool()
+        inserted = await store_event(pool, event['id'], event['type'], payload.decode('utf-8'))
+    except Exception as e:
+        # inbox 저장 실패 시 5xx를 돌려 Stripe가 재전송하도록 함
+        logger.error(f"Stripe event persist failed for {event.get('id')}: {e}")
+        STRIPE_WEBHOOK_TOTAL.inc(event['type'], 'persist_error')
+        raise HTTPException(status_code=500)
+
+    STRIPE_WEBHOOK_TOTAL.inc(event['type'], 'received' if inserted else 'duplicate')
+    if not inserted:
+        logger.info(f"Stripe event already received: {event['id']}")
+    return {"status": "received"}
+
+
+async def handle_stripe_event(event: dict) -> str:
+    """Inbox 워커가 호출하는 Stripe 이벤트 처리. 예외를 던지면 백오프 후 재시도됨"""
     event_type = event['type']
     data_object = event['data']['object']
     subscription_id = get_subscription_id_from_event(event_type, data_object)
-    current_time = time.time()
 
-    # 결제 성공 관련 이벤트는 중복 스킵하지 않음
-    if event_type not in ("checkout.session.completed", "invoice.payment_succeeded", "invoice.paid"):
-        if subscription_id and subscription_id in recent_notifications:
-            if current_time - recent_notifications[subscription_id] < 300:
-                logger.info(f"Skipping duplicate notification for {event_type} sub {subscription_id}")
-                return {"status": "skipped_duplicate"}
+    logger.info(f"Processing: {event_type} | sub_id: {subscription_id or 'N/A'}")
 
-    if subscription_id:
-        recent_notifications[subscription_id] = current_time
+    if event_type == "checkout.session.completed":
+        session = data_object
+        user_id = int(session['metadata'].get('user_id', 0))
+        bot_name = session['metadata'].get('bot_name', 'unknown')
+        plan = session['metadata'].get('plan', 'monthly')
+        sub_id = session.get('subscription')
+        customer_id = session['customer']
+        amount = session['amount_total'] / 100.0
 
-    try:
-        logger.info(f"Processing: {event_type} | sub_id: {subscription_id or 'N/A'}")
-
-        if event_type == "checkout.session.completed":
-            session = data_object
-            user_id = int(session['metadata'].get('user_id', 0))
-            bot_name = session['metadata'].get('bot_name', 'unknown')
-            plan = session['metadata'].get('plan', 'monthly')
-            sub_id = session.get('subscription')
-            customer_id = session['customer']
-            amount = session['amount_total'] / 100.0
-
-            if user_id and bot_name != 'unknown':
-                username = session['metadata'].get('username', f"user_{user_id}")
-                email = session.get('customer_details', {}).get('email', 'unknown')
-
-                expiry = None
-                is_lifetime = plan == 'lifetime'
-                if not is_lifetime:
-                    days = 7 if plan == 'weekly' else 30
-                    expiry = datetime.datetime.utcnow() + datetime.timedelta(days=days)
-
-                pool = await get_pool()
-                await add_member(
-                    pool, user_id, username, customer_id, sub_id,
-                    is_lifetime=is_lifetime, expiry=expiry, bot_name=bot_name, email=email
-                )
-                await log_action(pool, user_id, f'payment_stripe_{plan}', amount, bot_name)
+        # 완료된 세션 URL을 다시 내주지 않도록 캐시에서 제거
+        invalidate_checkout_session(user_id, bot_name, plan)
 
-                if bot_name in applications:
-                    bot = applications[bot_name]["app"].bot
-                    link, expiry_str = await create_invite_link(bot)
-                    await bot.send_message(
-                        user_id,
-                        f"✅ Payment successful!\n\nYour invite link (expires in 5 min):\n{link}\n\n{expiry_str}"
-                    )
+        if user_id and bot_name != 'unknown':
+            username = session['metadata'].get('username', f"user_{user_id}")
+            email = session.get('customer_details', {}).get('email', 'unknown')
 
-                email_display = f"• Email: {html.escape(email)}" if email and email != 'unknown' else ''
-                msg = (
-                    f"💳 **New Subscription (First Payment)**\n\n"
-                    f"• Bot: {bot_name.upper()}\n"
-                    f"• User: @{username} (ID: {user_id})\n"
-                    f"{email_display}\n"
-                    f"• Plan: {plan.capitalize()}\n"
-                    f"• Amount: ${amount:.2f}\n"
-                    f"• Time: {datetime.datetime.utcnow().strftime('%Y-%m-%d %H:%M UTC')}"
-                )
+            expiry = None
+            is_lifetime = plan == 'lifetime'
+            if not is_lifetime:
+                days = 7 if plan == 'weekly' else 30
+                expiry = datetime.datetime.utcnow() + datetime.timedelta(days=days)
+
+            pool = await get_pool()
+            await add_member(
+                pool, user_id, username, customer_id, sub_id,
+                is_lifetime=is_lifetime, expiry=expiry, bot_name=bot_name, email=email
+            )
+            # 같은 PaymentIntent가 /sync_stripe로 먼저 들어왔으면 중복 기록하지 않음
+            await record_payment(pool, session.get('payment_intent'), user_id, f'payment_stripe_{plan}',
+                                 amount, bot_name, currency=session.get('currency'))
 
+            if bot_name in registry:
+                bot = registry.get_bot(bot_name)
+                # DB 반영 후에는 재시도 시 중복 기록이 생기므로 여기서 실패를 삼킴
                 try:
-                    await applications["letmebot"]["app"].bot.send_message(ADMIN_USER_ID, msg, parse_mode='Markdown')
-                    logger.info(f"Admin notified - New Subscription - user:{user_id}")
+                    link, expiry_str = await create_invite_link(bot)
+                    await outbound.send_message(
+                        bot, user_id,
+                        f"✅ Payment successful!\n\nYour invite link (expires in 5 min):\n{link}\n\n{expiry_str}",
+                        priority=outbound.PRIORITY_USER
+                    )
                 except Exception as e:
-                    logger.error(f"Admin notify failed: {e}")
+                    logger.error(f"Invite link delivery failed - user:{user_id} bot:{bot_name}: {e}")
 
-                promoter_id = None
-                if bot_name == "lust4trans":
-                    promoter_id = int(LUST4TRANS_PROMOTER_ID or 0)
-                elif bot_name == "tswrld":
-                    promoter_id = int(TSWRLDBOT_PROMOTER_ID or 0)
+            email_display = f"• Email: {html.escape(email)}" if email and email != 'unknown' else ''
+            msg = (
+                f"💳 **New Subscription (First Payment)**\n\n"
+                f"• Bot: {bot_name.upper()}\n"
+                f"• User: @{username} (ID: {user_id})\n"
+                f"{email_display}\n"
+                f"• Plan: {plan.capitalize()}\n"
+                f"• Amount: ${amount:.2f}\n"
+                f"• Time: {datetime.datetime.utcnow().strftime('%Y-%m-%d %H:%M UTC')}"
+            )
 
-                if promoter_id and promoter_id != ADMIN_USER_ID and bot_name in applications:
-                    try:
-                        await applications[bot_name]["app"].bot.send_message(promoter_id, msg, parse_mode='Markdown')
-                    except Exception as e:
-                        logger.error(f"Promoter notify fail: {e}")
+            await notify_payment(bot_name, sub_id or f"user:{user_id}:{bot_name}", msg)
 
-        elif event_type in ("invoice.payment_succeeded", "invoice.paid"):
-            invoice = data_object
-            subscription_id = get_subscription_id_from_event(event_type, invoice)
+    elif event_type in ("invoice.payment_succeeded", "invoice.paid"):
+        invoice = data_object
+        subscription_id = get_subscription_id_from_event(event_type, invoice)
 
-            pool = await get_pool()
-            row = None
+        pool = await get_pool()
+        row = None
 
+        async with acquire(pool) as conn:
             # 1차 시도: subscription_id로 조회
             if subscription_id:
-                row = await pool.fetchrow(
+                row = await conn.fetchrow(
                     "SELECT user_id, bot_name, username, email FROM members WHERE stripe_subscription_id = $1",
                     subscription_id
                 )
 
             # 2차 시도: subscription 못 찾았거나 row 없으면 customer_id로 fallback 조회
             if not row and invoice.get('customer'):
-                row = await pool.fetchrow(
+                row = await conn.fetchrow(
                     "SELECT user_id, bot_name, username, email, stripe_subscription_id FROM members WHERE stripe_customer_id = $1",
                     invoice['customer']
                 )
@@ -247,119 +458,105 @@ async def stripe_webhook(request: Request):
                     logger.info(f"Found by customer fallback - updating sub_id from {subscription_id} to {row['stripe_subscription_id']}")
                     subscription_id = row['stripe_subscription_id']
 
-            if not row:
-                logger.warning(f"Member not found - sub:{subscription_id or 'N/A'} customer:{invoice.get('customer', 'N/A')}")
-                return {"status": "no_member_found"}
-
-            user_id = row['user_id']
-            bot_name = row['bot_name']
-            username = row['username'] or f"ID{user_id}"
-            email = row['email'] or 'unknown'
+        if not row:
+            logger.warning(f"Member not found - sub:{subscription_id or 'N/A'} customer:{invoice.get('customer', 'N/A')}")
+            return "no_member_found"
 
-            amount = invoice.get('amount_paid', 0) / 100.0
-            is_renewal = invoice.get('billing_reason') == 'subscription_cycle'
-
-            await log_action(pool, user_id, 'payment_stripe_renewal', amount, bot_name)
-
-            email_display = f"• Email: {html.escape(email)}" if email and email != 'unknown' else ''
-            msg = (
-                f"{'🔄 **Subscription Renewed**' if is_renewal else '💳 **Payment Succeeded**'}\n\n"
-                f"• Bot: {bot_name.upper()}\n"
-                f"• User: @{username} (ID: {user_id})\n"
-                f"{email_display}\n"
-                f"• Amount: ${amount:.2f}\n"
-                f"• Subscription: {str(subscription_id)[:12] if subscription_id else 'N/A'}...\n"
-                f"• Invoice: {invoice.get('id', 'N/A')[:12]}...\n"
-                f"• Event: {event_type}\n"
-                f"• Time: {datetime.datetime.utcnow().strftime('%Y-%m-%d %H:%M UTC')}"
-            )
+        user_id = row['user_id']
+        bot_name = row['bot_name']
+        username = row['username'] or f"ID{user_id}"
+        email = row['email'] or 'unknown'
 
-            try:
-                await applications["letmebot"]["app"].bot.send_message(ADMIN_USER_ID, msg, parse_mode='Markdown')
-                logger.info(f"✅ ADMIN NOTIFIED via {event_type} - ${amount} user:{user_id}")
-            except Exception as e:
-                logger.error(f"Admin notify failed for {event_type}: {e}")
+        amount = invoice.get('amount_paid', 0) / 100.0
+        is_renewal = invoice.get('billing_reason') == 'subscription_cycle'
 
-            promoter_id = None
-            if bot_name == "lust4trans":
-                promoter_id = int(LUST4TRANS_PROMOTER_ID or 0)
-            elif bot_name == "tswrld":
-                promoter_id = int(TSWRLDBOT_PROMOTER_ID or 0)
+        # 갱신 결제마다 expiry를 새 기간 끝으로 옮겨야 enforcement가 결제 중인 회원을 추방하지 않음
+        # (중복 이벤트여도 GREATEST라 안전하므로 중복 판정 전에 처리)
+        period_end = await _renewal_period_end(invoice, subscription_id)
+        if period_end:
+            await extend_member_expiry(pool, user_id, bot_name, period_end)
+        else:
+            logger.warning(f"No period end for invoice {invoice.get('id')} - expiry not extended (user:{user_id} bot:{bot_name})")
+
+        # invoice.paid와 invoice.payment_succeeded가 같은 결제로 둘 다 오므로 PaymentIntent 기준으로 한 번만 기록/알림
+        recorded = await record_payment(pool, invoice.get('payment_intent'), user_id, 'payment_stripe_renewal',
+                                        amount, bot_name, currency=invoice.get('currency'))
+        if not recorded:
+            return "duplicate_payment"
+
+        email_display = f"• Email: {html.escape(email)}" if email and email != 'unknown' else ''
+        msg = (
+            f"{'🔄 **Subscription Renewed**' if is_renewal else '💳 **Payment Succeeded**'}\n\n"
+            f"• Bot: {bot_name.upper()}\n"
+            f"• User: @{username} (ID: {user_id})\n"
+            f"{email_display}\n"
+            f"• Amount: ${amount:.2f}\n"
+            f"• Subscription: {str(subscription_id)[:12] if subscription_id else 'N/A'}...\n"
+            f"• Invoice: {invoice.get('id', 'N/A')[:12]}...\n"
+            f"• Event: {event_type}\n"
+            f"• Time: {datetime.datetime.utcnow().strftime('%Y-%m-%d %H:%M UTC')}"
+        )
 
-            if promoter_id and promoter_id != ADMIN_USER_ID and bot_name in applications:
-                try:
-                    await applications[bot_name]["app"].bot.send_message(promoter_id, msg, parse_mode='Markdown')
-                    logger.info(f"Promoter notified via {event_type}")
-                except Exception as e:
-                    logger.error(f"Promoter notify fail {promoter_id}: {e}")
+        await notify_payment(bot_name, subscription_id or f"user:{user_id}:{bot_name}", msg)
 
-        elif event_type == "customer.subscription.updated":
-            subscription = data_object
-            subscription_id = subscription.get('id')
-            if subscription_id:
-                previous_attrs = event.get('previous_attributes', {})
-                changed_keys = set(previous_attrs.keys())
+    elif event_type == "customer.subscription.updated":
+        subscription = data_object
+        subscription_id = subscription.get('id')
+        if subscription_id:
+            previous_attrs = event['data'].get('previous_attributes') or {}
+            changed_keys = set(previous_attrs.keys())
 
-                significant_changes = {'items', 'current_period_end', 'current_period_start', 'status', 'cancel_at'}
-                if not changed_keys or not (changed_keys & significant_changes):
-                    logger.info(f"Skipping minor subscription update for {subscription_id}")
-                    return {"status": "skipped_minor"}
+            significant_changes = {'items', 'current_period_end', 'current_period_start', 'status', 'cancel_at'}
+            if not changed_keys or not (changed_keys & significant_changes):
+                logger.info(f"Skipping minor subscription update for {subscription_id}")
+                return "skipped_minor"
 
-                pool = await get_pool()
-                row = await pool.fetchrow(
+            pool = await get_pool()
+            async with acquire(pool) as conn:
+                row = await conn.fetchrow(
                     "SELECT user_id, bot_name, username, email FROM members WHERE stripe_subscription_id = $1",
                     subscription_id
                 )
-                if row:
-                    user_id = row['user_id']
-                    bot_name = row['bot_name']
-                    username = row['username'] or f"ID{user_id}"
-                    email = row['email'] or 'unknown'
-
-                    amount = 0.0
-                    if subscription.get('items') and subscription['items'].get('data'):
-                        amount = subscription['items']['data'][0].get('price', {}).get('unit_amount', 0) / 100.0
-
-                    is_renewal = 'current_period_end' in changed_keys
-
-                    email_display = f"• Email: {html.escape(email)}" if email and email != 'unknown' else ''
-                    msg = (
-                        f"{'🔄 **Subscription Renewed**' if is_renewal else '💳 **Subscription Updated**'}\n\n"
-                        f"• Bot: {bot_name.upper()}\n"
-                        f"• User: @{username} (ID: {user_id})\n"
-                        f"{email_display}\n"
-                        f"• Amount: ${amount:.2f}\n"
-                        f"• Subscription: {subscription_id[:12]}...\n"
-                        f"• Changed: {', '.join(changed_keys)}\n"
-                        f"• Time: {datetime.datetime.utcnow().strftime('%Y-%m-%d %H:%M UTC')}"
+            if row:
+                user_id = row['user_id']
+                bot_name = row['bot_name']
+                username = row['username'] or f"ID{user_id}"
+                email = row['email'] or 'unknown'
+
+                amount = 0.0
+                if subscription.get('items') and subscription['items'].get('data'):
+                    amount = subscription['items']['data'][0].get('price', {}).get('unit_amount', 0) / 100.0
+
+                is_renewal = 'current_period_end' in changed_keys
+                if subscription.get('current_period_end'):
+                    await extend_member_expiry(
+                        pool, user_id, bot_name, datetime.datetime.utcfromtimestamp(subscription['current_period_end'])
                     )
 
-                    try:
-                        await applications["letmebot"]["app"].bot.send_message(ADMIN_USER_ID, msg, parse_mode='Markdown')
-                    except Exception:
-                        pass
-
-                    promoter_id = None
-                    if bot_name == "lust4trans":
-                        promoter_id = int(LUST4TRANS_PROMOTER_ID or 0)
-                    elif bot_name == "tswrld":
-                        promoter_id = int(TSWRLDBOT_PROMOTER_ID or 0)
-
-                    if promoter_id and promoter_id != ADMIN_USER_ID and bot_name in applications:
-                        try:
-                            await applications[bot_name]["app"].bot.send_message(promoter_id, msg, parse_mode='Markdown')
-                        except Exception as e:
-                            logger.error(f"Promoter notify fail {promoter_id}: {e}")
+                email_display = f"• Email: {html.escape(email)}" if email and email != 'unknown' else ''
+                msg = (
+                    f"{'🔄 **Subscription Renewed**' if is_renewal else '💳 **Subscription Updated**'}\n\n"
+                    f"• Bot: {bot_name.upper()}\n"
+                    f"• User: @{username} (ID: {user_id})\n"
+                    f"{email_display}\n"
+                    f"• Amount: ${amount:.2f}\n"
+                    f"• Subscription: {subscription_id[:12]}...\n"
+                    f"• Changed: {', '.join(changed_keys)}\n"
+                    f"• Time: {datetime.datetime.utcnow().strftime('%Y-%m-%d %H:%M UTC')}"
+                )
 
-                    logger.info(f"Significant subscription update sent - bot:{bot_name} user:{user_id}")
+                await notify_payment(bot_name, subscription_id, msg)
+                logger.info(f"Significant subscription update queued - bot:{bot_name} user:{user_id}")
 
-        elif event_type == "customer.subscription.created":
-            logger.info(f"New subscription created (no notification): {subscription_id}")
+    elif event_type == "checkout.session.expired":
+        metadata = data_object.get('metadata') or {}
+        if metadata.get('user_id'):
+            invalidate_checkout_session(int(metadata['user_id']), metadata.get('bot_name', 'unknown'), metadata.get('plan', 'monthly'))
 
-    except Exception as e:
-        logger.error(f"Webhook processing error: {e}")
+    elif event_type == "customer.subscription.created":
+        logger.info(f"New subscription created (no notification): {subscription_id}")
 
-    return {"status": "success"}
+    return "success"
 
 
 async def paid_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -378,16 +575,107 @@ async def paid_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         bot_name = args[1] if len(args) > 1 else 'letmebot'
 
         pool = await get_pool()
-        await pool.execute(
-            'UPDATE members SET active = TRUE WHERE user_id = $1 AND bot_name = $2',
-            target_user_id, bot_name
-        )
+        async with acquire(pool) as conn:
+            await conn.execute(
+                'UPDATE members SET active = TRUE WHERE user_id = $1 AND bot_name = $2',
+                target_user_id, bot_name
+            )
+        invalidate_member(target_user_id, bot_name)
         await update.message.reply_text(f"User {target_user_id} paid status updated for {bot_name}.")
     except Exception as e:
         logger.error(f"/paid error: {e}")
         await update.message.reply_text(f"Error: {str(e)}")
 
 
+async def stripe_inbox_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    if user_id != ADMIN_USER_ID:
+        await update.message.reply_text("Admin only command.")
+        return
+
+    try:
+        pool = await get_pool()
+        if context.args and context.args[0] == 'retry':
+            count = await requeue_dead_events(pool)
+            await update.message.reply_text(f"Requeued {count} dead Stripe events.")
+            return
+
+        stats = await inbox_stats(pool)
+        lines = [f"• {status}: {count}" for status, count in sorted(stats.items())]
+        await update.message.reply_text(
+            "Stripe event inbox\n\n" + ("\n".join(lines) if lines else "Empty") +
+            "\n\nUse /stripe_inbox retry to requeue dead events."
+        )
+    except Exception as e:
+        logger.error(f"/stripe_inbox error: {e}")
+        await update.message.reply_text(f"Error: {str(e)}")
+
+
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/profile [seconds] — event loop 스레드 샘플링 결과(collapsed stack)와 loop lag"""
+    user_id = update.effective_user.id
+    if user_id != ADMIN_USER_ID:
+        await update.message.reply_text("Admin only command.")
+        return
+
+    try:
+        seconds = float(context.args[0]) if context.args else 10
+    except ValueError:
+        await update.message.reply_text("Usage: /profile [seconds]")
+        return
+
+    try:
+        await update.message.reply_text(f"⏱ Profiling event loop for {seconds:g}s...")
+        result = await profile(seconds)
+        lag = result.lag_stats()
+        top = "\n".join(f"• {frame}: {count / result.samples:.0%}" for frame, count in result.top_frames(5))
+        filename = f"profile-{datetime.datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.collapsed.txt"
+        await context.bot.send_document(
+            chat_id=user_id,
+            document=io.BytesIO(result.collapsed().encode('utf-8')),
+            filename=filename,
+            caption=(
+                f"Event loop profile ({result.seconds:g}s, {result.samples} samples)\n"
+                f"• Busy: {result.busy_ratio:.0%}\n"
+                f"• Loop lag p50/p99/max: {lag['p50_ms']}/{lag['p99_ms']}/{lag['max_ms']} ms\n\n"
+                f"Top frames:\n{top or 'idle'}\n\n"
+                f"flamegraph.pl or speedscope.app can render the file."
+            )
+        )
+        logger.info(f"/profile {result.seconds:g}s: samples={result.samples} busy={result.busy_ratio:.2f} lag={lag}")
+    except ProfilerBusy:
+        await update.message.reply_text("Another profile is already running.")
+    except Exception as e:
+        logger.error(f"/profile error: {e}")
+        await update.message.reply_text(f"Error: {str(e)}")
+
+
+async def enforce_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    if user_id != ADMIN_USER_ID:
+        await update.message.reply_text("Admin only command.")
+        return
+
+    # /enforce → 설정값(ENFORCEMENT_DRY_RUN), /enforce dry → 집계만, /enforce run → 실제 추방
+    dry_run = ENFORCEMENT_DRY_RUN
+    if context.args:
+        dry_run = context.args[0] != 'run'
+    try:
+        stats = await enforce_expiry(await get_pool(), get_enforcement_bot, dry_run=dry_run)
+        await update.message.reply_text(
+            f"{'🧪 Dry run' if dry_run else '✅ Enforcement done'}\n\n"
+            f"• Scanned: {stats['scanned']}\n"
+            f"• Removed: {stats['removed']}\n"
+            f"• Kept (other active plan): {stats['kept_other_access']}\n"
+            f"• Failed: {stats['failed']}\n"
+            f"• Deactivated: {stats['deactivated']}\n"
+            f"• Time: {stats['elapsed_s']}s ({stats['per_second']}/s)"
+        )
+    except Exception as e:
+        logger.error(f"/enforce error: {e}")
+        await update.message.reply_text(f"Error: {str(e)}")
+
+
 async def kick_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     try:
@@ -403,26 +691,30 @@ async def kick_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         target_user_id = int(args[0])
 
         kicked = False
-        for key in applications.keys():
-            bot = applications[key]["app"].bot
+        # 모든 봇이 같은 채널을 관리하므로 한 봇이라도 성공하면 충분
+        for key in registry.keys():
+            bot = registry.get_bot(key)
             try:
-                await bot.ban_chat_member(
+                await outbound.send(
+                    bot, 'ban_chat_member', per_chat=False,
                     chat_id=CHANNEL_ID,
                     user_id=target_user_id
                 )
                 logger.info(f"강제 kick 성공 - User {target_user_id} from {key}")
                 kicked = True
+                break
             except Exception as e:
                 logger.error(f"kick 실패 - User {target_user_id} from {key}: {e}")
 
         pool = await get_pool()
-        rows = await pool.fetch(
-            'SELECT bot_name FROM members WHERE user_id = $1 AND active = TRUE',
-            target_user_id
-        )
+        async with acquire(pool) as conn:
+            rows = await conn.fetch(
+                'SELECT bot_name FROM members WHERE user_id = $1 AND active = TRUE',
+                target_user_id
+            )
 
         if rows:
-            async with pool.acquire() as conn:
+            async with acquire(pool) as conn:
                 for row in rows:
                     bot_name = row['bot_name']
                     await conn.execute(
@@ -430,6 +722,7 @@ async def kick_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
                         target_user_id, bot_name
                     )
             logger.info(f"DB active=FALSE 업데이트 완료 - User {target_user_id}")
+        invalidate_member(target_user_id)
 
         if kicked:
             await update.message.reply_text(
@@ -455,20 +748,10 @@ async def user_count_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         await update.message.reply_text("This command is for admin or Lust4trans promoter only.")
         return
 
-    pool = await get_pool()
-    today = datetime.datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-
-    count = await pool.fetchval(
-        '''
-        SELECT COUNT(DISTINCT user_id) 
-        FROM daily_logs 
-        WHERE bot_name = 'lust4trans' AND timestamp >= $1
-        ''',
-        today
-    )
+    stats = await get_daily_stats(await get_pool(), bot_name='lust4trans')
 
     await update.message.reply_text(
-        f"Today's unique users on Lust4trans bot: **{count or 0}**"
+        f"Today's unique users on Lust4trans bot: **{stats['unique_users']}**"
     )
 
 
@@ -479,47 +762,58 @@ async def lust4trans_stats_command(update: Update, context: ContextTypes.DEFAULT
         await update.message.reply_text("This command is for admin or Lust4trans promoter only.")
         return
 
-    pool = await get_pool()
-
-    weekly_count = await pool.fetchval(
-        '''
-        SELECT COUNT(DISTINCT user_id) 
-        FROM daily_logs 
-        WHERE bot_name = 'lust4trans' 
-        AND action = 'payment_stripe_weekly'
-        '''
-    )
-    monthly_count = await pool.fetchval(
-        '''
-        SELECT COUNT(DISTINCT user_id) 
-        FROM daily_logs 
-        WHERE bot_name = 'lust4trans' 
-        AND action = 'payment_stripe_monthly'
-        '''
-    )
-    lifetime_count = await pool.fetchval(
-        '''
-        SELECT COUNT(DISTINCT user_id) 
-        FROM daily_logs 
-        WHERE bot_name = 'lust4trans' 
-        AND action = 'payment_stripe_lifetime'
-        '''
-    )
+    totals = await get_plan_totals(await get_pool(), 'lust4trans')
+    empty = {'payments': 0, 'customers': 0, 'revenue': 0.0}
+    weekly = totals.get('weekly', empty)
+    monthly = totals.get('monthly', empty)
+    lifetime = totals.get('lifetime', empty)
+    renewal = totals.get('renewal', empty)
 
-    total_count = (weekly_count or 0) + (monthly_count or 0) + (lifetime_count or 0)
-    total_amount = (weekly_count or 0) * 11 + (monthly_count or 0) * 21 + (lifetime_count or 0) * 52
+    total_count = weekly['customers'] + monthly['customers'] + lifetime['customers']
+    total_amount = sum(plan['revenue'] for plan in totals.values())
 
     reply_text = (
         f"Lust4trans Stripe 결제 성공 고객 수 (전체 기간 누적)\n\n"
-        f"Weekly: {weekly_count or 0}명 (${(weekly_count or 0) * 11})\n"
-        f"Monthly: {monthly_count or 0}명 (${(monthly_count or 0) * 21})\n"
-        f"Lifetime: {lifetime_count or 0}명 (${(lifetime_count or 0) * 52})\n\n"
-        f"총: {total_count}명 (${total_amount})"
+        f"Weekly: {weekly['customers']}명 (${weekly['revenue']:.2f})\n"
+        f"Monthly: {monthly['customers']}명 (${monthly['revenue']:.2f})\n"
+        f"Lifetime: {lifetime['customers']}명 (${lifetime['revenue']:.2f})\n"
+        f"Renewal: {renewal['payments']}건 (${renewal['revenue']:.2f})\n\n"
+        f"총: {total_count}명 (${total_amount:.2f})"
     )
 
     await update.message.reply_text(reply_text)
 
 
+async def rollups_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    if user_id != ADMIN_USER_ID:
+        await update.message.reply_text("Admin only command.")
+        return
+
+    # /rollups → 전체 재계산, /rollups 2024-01-01 → 해당 날짜 이후 일별 통계만 재계산
+    since = None
+    if context.args:
+        try:
+            since = datetime.datetime.strptime(context.args[0], "%Y-%m-%d")
+        except ValueError:
+            await update.message.reply_text("Usage: /rollups [YYYY-MM-DD]")
+            return
+    try:
+        started = time.perf_counter()
+        requested = since
+        since, days = await backfill_rollups(await get_pool(), since=since)
+        # 보관된 파티션 구간은 결제 외 로그가 없어 기존 집계를 유지
+        note = f"\n• Archived days before {since:%Y-%m-%d} kept" if since and since != requested else ""
+        await update.message.reply_text(
+            f"✅ Rollups rebuilt {'from ' + f'{since:%Y-%m-%d}' if since else '(full history)'}\n\n"
+            f"• Days: {days}{note}\n"
+            f"• Time: {time.perf_counter() - started:.1f}s"
+        )
+    except Exception as e:
+        logger.error(f"/rollups error: {e}")
+        await update.message.reply_text(f"Error: {str(e)}")
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=int(os.getenv("PORT", 10000)))
@@ -0,0 +1,61 @@
+# benchmarks/bot_registry_bench.py
+"""봇 1개당 메모리/생성 비용 비교 (네트워크 호출 없음)
+
+    python -m benchmarks.bot_registry_bench --bots 50
+
+eager: 기존 방식 (봇마다 Application + 자체 HTTP 클라이언트 2개 + JobQueue)
+registry: BotRegistry (공유 커넥션 풀, Application은 webhook이 들어온 봇만 생성)
+"""
+import argparse
+import asyncio
+import gc
+import time
+import tracemalloc
+from telegram.ext import Application
+from bot_core.registry import BotRegistry
+
+FAKE_TOKEN = "123456:{:035d}"
+
+def _specs(count):
+    return {
+        f"bench{i}": {'bot_name': f"bench{i}", 'token': FAKE_TOKEN.format(i), 'has_monthly': True, 'has_lifetime': True}
+        for i in range(count)
+    }
+
+def _measure(label, count, build):
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    keep = build()
+    elapsed = time.perf_counter() - started
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<28} total {elapsed * 1000:8.1f}ms  {current / 1024:9.1f}KB  "
+          f"per bot {elapsed * 1000 / count:6.2f}ms  {current / 1024 / count:7.1f}KB  (peak {peak / 1024:.0f}KB)")
+    return keep
+
+def build_eager(specs):
+    return [Application.builder().token(spec['token']).build() for spec in specs.values()]
+
+def build_registry(specs, active_ratio):
+    registry = BotRegistry(specs, configure=lambda key, app, bot_instance: None)
+    active = list(specs)[:int(len(specs) * active_ratio)]
+    apps = [
+        Application.builder().bot(registry.get_bot(key)).updater(None).job_queue(None).build()
+        for key in active
+    ]
+    return registry, apps
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--bots', type=int, default=50)
+    parser.add_argument('--active-ratio', type=float, default=0.2, help="webhook을 받아 Application이 생성되는 봇 비율")
+    args = parser.parse_args()
+    specs = _specs(args.bots)
+
+    _measure("eager Application per bot", args.bots, lambda: build_eager(specs))
+    _measure("registry (all lazy)", args.bots, lambda: build_registry(specs, 0))
+    _measure(f"registry ({args.active_ratio:.0%} active)", args.bots, lambda: build_registry(specs, args.active_ratio))
+
+if __name__ == "__main__":
+    asyncio.run(main())
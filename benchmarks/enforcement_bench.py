@@ -0,0 +1,91 @@
+# benchmarks/enforcement_bench.py
+"""만료 회원 자동 추방 처리량 측정 (로컬 Postgres 필요, Telegram은 stub)
+
+    DATABASE_URL=postgresql://localhost/newpipe_bench python -m benchmarks.enforcement_bench --members 100000
+
+임시 스키마에 마이그레이션을 적용하고 만료 회원을 채운 뒤 enforce_expiry를 실행, 끝나면 스키마를 지움
+"""
+import argparse
+import asyncio
+import datetime
+import random
+import asyncpg
+from bot_core import outbound
+from bot_core.enforcement import enforce_expiry
+from bot_core.migrations import migrate
+from config import DATABASE_URL
+
+SCHEMA = "bench_enforcement"
+BOT_NAMES = ['letmebot', 'morevids', 'onlytrns', 'tswrld', 'lust4trans']
+
+
+class StubBot:
+    """ban/unban 호출마다 latency만큼 대기하는 가짜 Bot"""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = 0
+
+    async def ban_chat_member(self, chat_id, user_id, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+
+    async def unban_chat_member(self, chat_id, user_id, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+
+
+async def seed(pool, count, expired_ratio):
+    now = datetime.datetime.utcnow()
+    records = []
+    for i in range(count):
+        expired = random.random() < expired_ratio
+        expiry = now - datetime.timedelta(days=random.randint(2, 60)) if expired else now + datetime.timedelta(days=random.randint(1, 30))
+        records.append((i + 1, random.choice(BOT_NAMES), f"user_{i + 1}", False, expiry, True))
+    async with pool.acquire() as conn:
+        await conn.copy_records_to_table(
+            'members', records=records,
+            columns=['user_id', 'bot_name', 'username', 'is_lifetime', 'expiry', 'active']
+        )
+        await conn.execute('ANALYZE members')
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--members', type=int, default=100_000)
+    parser.add_argument('--expired-ratio', type=float, default=0.5)
+    parser.add_argument('--latency', type=float, default=0.02, help="가짜 Telegram 호출 지연(초)")
+    parser.add_argument('--rate', type=float, default=1000, help="초당 ban/unban 호출 한도")
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args()
+
+    admin = await asyncpg.connect(DATABASE_URL)
+    await admin.execute(f'DROP SCHEMA IF EXISTS {SCHEMA} CASCADE')
+    await admin.execute(f'CREATE SCHEMA {SCHEMA}')
+    pool = await asyncpg.create_pool(DATABASE_URL, min_size=2, max_size=10, server_settings={'search_path': SCHEMA})
+    try:
+        await migrate(pool)
+        await seed(pool, args.members, args.expired_ratio)
+        bot = StubBot(args.latency)
+        # 실제 Telegram 한도 대신 --rate 기준으로 측정
+        outbound.set_global_rate(args.rate)
+        outbound.start(workers=args.concurrency)
+        stats = await enforce_expiry(
+            pool, lambda bot_name: bot, dry_run=args.dry_run, grace_hours=24,
+            batch_size=args.batch_size, concurrency=args.concurrency, rate=args.rate
+        )
+        print(f"members={args.members} expired_ratio={args.expired_ratio} latency={args.latency}s "
+              f"rate={args.rate}/s concurrency={args.concurrency}")
+        print(f"scanned={stats['scanned']} removed={stats['removed']} deactivated={stats['deactivated']} "
+              f"failed={stats['failed']} telegram_calls={bot.calls}")
+        print(f"elapsed={stats['elapsed_s']}s throughput={stats['per_second']} members/s")
+    finally:
+        await outbound.stop()
+        await pool.close()
+        await admin.execute(f'DROP SCHEMA IF EXISTS {SCHEMA} CASCADE')
+        await admin.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,235 @@
+# benchmarks/stripe_replay.py
+"""저장된(또는 합성한) Stripe 이벤트를 실제 핸들러로 다시 처리하면서 처리량/지연 측정
+(로컬 Postgres 필요, Telegram/Stripe는 stub)
+
+    # 합성 이벤트 5000건
+    DATABASE_URL=postgresql://localhost/newpipe_bench python -m benchmarks.stripe_replay --synthetic 5000
+    # 운영 DB에서 복사해 온 stripe_event_store로 리플레이
+    DATABASE_URL=postgresql://localhost/newpipe_bench python -m benchmarks.stripe_replay \\
+        --source-dsn postgresql://localhost/newpipe_copy --type invoice.paid --limit 2000
+
+임시 스키마에 마이그레이션을 적용하고 app.handle_stripe_event를 --concurrency개 워커로 호출, 끝나면 스키마를 지움.
+같은 고객의 이벤트는 항상 같은 워커가 원래 순서대로 처리 (운영처럼 checkout이 갱신/변경보다 먼저 반영되도록).
+Stripe API는 stripe_client.call을 stub으로 바꿔 --stripe-latency만큼 대기 (invoice에 기간 정보가 없을 때의 구독 조회 등)
+"""
+import argparse
+import asyncio
+import datetime
+import random
+import statistics
+import time
+import zlib
+from collections import defaultdict
+from types import SimpleNamespace
+import asyncpg
+import app as webhook_app
+from bot_core import outbound, stripe_client
+from bot_core.db import init_pool, close_pool
+from bot_core.migrations import migrate
+from bot_core.stripe_inbox import iter_stored_events
+from config import DATABASE_URL
+
+SCHEMA = "bench_stripe_replay"
+BOT_NAMES = ['letmebot', 'morevids', 'onlytrns', 'tswrld', 'lust4trans']
+PLANS = ['weekly', 'monthly', 'lifetime']
+
+
+class StubBot:
+    """모든 Bot API 호출을 latency만큼 대기 후 성공 처리하는 가짜 Bot"""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = defaultdict(int)
+
+    def __getattr__(self, method):
+        async def call(**kwargs):
+            self.calls[method] += 1
+            await asyncio.sleep(self.latency)
+            return SimpleNamespace(invite_link=f"https://t.me/+stub{self.calls[method]}")
+        return call
+
+
+class StubStripeObject(dict):
+    """stripe.StripeObject처럼 dict 접근과 속성 접근을 모두 지원"""
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+
+class StubRegistry:
+    def __init__(self, bot):
+        self.bot = bot
+
+    def __contains__(self, key):
+        return True
+
+    def get_bot(self, key):
+        return self.bot
+
+    def spec(self, key):
+        return {}
+
+
+def synthetic_events(count):
+    """checkout 완료 → 이후 갱신(invoice.paid)/구독 변경/만료 세션 순서로 섞인 이벤트 생성"""
+    now = int(time.time())
+    checkouts, followups = [], []
+    for i in range(count):
+        kind = random.random()
+        if kind < 0.5 or not checkouts:
+            user_id = 10_000 + i
+            bot_name = random.choice(BOT_NAMES)
+            plan = random.choice(PLANS)
+            sub_id = None if plan == 'lifetime' else f"sub_bench{i}"
+            checkouts.append({
+                'id': f"evt_bench{i}", 'type': 'checkout.session.completed', 'created': now,
+                'data': {'object': {
+                    'id': f"cs_bench{i}", 'customer': f"cus_bench{i}", 'subscription': sub_id,
+                    'payment_intent': f"pi_bench{i}" if plan == 'lifetime' else None,
+                    'amount_total': 2100, 'currency': 'usd',
+                    'customer_details': {'email': f"user{i}@example.com"},
+                    'metadata': {'user_id': str(user_id), 'bot_name': bot_name, 'plan': plan, 'username': f"user_{user_id}"},
+                }},
+            })
+            continue
+        source = random.choice(checkouts)['data']['object']
+        if kind < 0.8 and source['subscription']:
+            followups.append({
+                'id': f"evt_bench{i}", 'type': 'invoice.paid', 'created': now,
+                'data': {'object': {
+                    'id': f"in_bench{i}", 'subscription': source['subscription'], 'customer': source['customer'],
+                    'payment_intent': f"pi_bench{i}", 'amount_paid': 2100, 'currency': 'usd',
+                    'billing_reason': 'subscription_cycle',
+                }},
+            })
+        elif kind < 0.9 and source['subscription']:
+            followups.append({
+                'id': f"evt_bench{i}", 'type': 'customer.subscription.updated', 'created': now,
+                'data': {
+                    'object': {'id': source['subscription'], 'customer': source['customer'],
+                               'items': {'data': [{'price': {'unit_amount': 2100}}]}},
+                    'previous_attributes': {'current_period_end': now},
+                },
+            })
+        else:
+            followups.append({
+                'id': f"evt_bench{i}", 'type': 'checkout.session.expired', 'created': now,
+                'data': {'object': {'id': f"cs_expired{i}", 'customer': source['customer'], 'metadata': source['metadata']}},
+            })
+    return checkouts + followups
+
+
+async def load_stored_events(dsn, event_type, since, limit):
+    pool = await asyncpg.create_pool(dsn, min_size=1, max_size=2)
+    try:
+        return [event async for event in iter_stored_events(pool, event_type=event_type, since=since, limit=limit)]
+    finally:
+        await pool.close()
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def _order_key(event):
+    """순서를 지켜야 하는 단위 (고객 → 구독 → 유저 → 이벤트 자체)"""
+    obj = event['data']['object']
+    metadata = obj.get('metadata') or {}
+    key = obj.get('customer') or obj.get('subscription')
+    if not key and event['type'].startswith('customer.subscription.'):
+        key = obj.get('id')
+    if not key and metadata.get('user_id'):
+        key = f"{metadata.get('bot_name')}:{metadata['user_id']}"
+    return key or event['id']
+
+
+async def replay(events, concurrency):
+    # 키별로 워커를 고정해 같은 고객의 이벤트가 동시에/뒤바뀐 순서로 처리되지 않게 함
+    shards = [[] for _ in range(concurrency)]
+    for event in events:
+        shards[zlib.crc32(_order_key(event).encode()) % concurrency].append(event)
+    latencies = defaultdict(list)
+    results = defaultdict(lambda: defaultdict(int))
+
+    async def worker(shard):
+        for event in shard:
+            started = time.perf_counter()
+            try:
+                result = await webhook_app.handle_stripe_event(event)
+            except Exception as e:
+                result = f"error:{type(e).__name__}"
+            latencies[event['type']].append((time.perf_counter() - started) * 1000)
+            results[event['type']][result] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(shard) for shard in shards))
+    return time.perf_counter() - started, latencies, results
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--synthetic', type=int, default=0, help="합성 이벤트 수 (0이면 --source-dsn의 stripe_event_store 사용)")
+    parser.add_argument('--source-dsn', default=DATABASE_URL, help="stripe_event_store를 읽을 DB")
+    parser.add_argument('--type', default=None, help="특정 이벤트 타입만 리플레이")
+    parser.add_argument('--since', default=None, help="YYYY-MM-DD 이후 받은 이벤트만")
+    parser.add_argument('--limit', type=int, default=None)
+    parser.add_argument('--concurrency', type=int, default=4, help="동시 처리 워커 수 (운영: STRIPE_WORKER_CONCURRENCY)")
+    parser.add_argument('--telegram-latency', type=float, default=0.05, help="가짜 Telegram 호출 지연(초)")
+    parser.add_argument('--stripe-latency', type=float, default=0.2, help="가짜 Stripe API 호출 지연(초)")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        events = synthetic_events(args.synthetic)
+    else:
+        since = datetime.datetime.strptime(args.since, "%Y-%m-%d") if args.since else None
+        events = await load_stored_events(args.source_dsn, args.type, since, args.limit)
+    if not events:
+        print("no events to replay")
+        return
+
+    admin = await asyncpg.connect(DATABASE_URL)
+    await admin.execute(f'DROP SCHEMA IF EXISTS {SCHEMA} CASCADE')
+    await admin.execute(f'CREATE SCHEMA {SCHEMA}')
+
+    # 핸들러가 쓰는 전역 상태를 stub으로 교체
+    bot = StubBot(args.telegram_latency)
+    webhook_app.registry = StubRegistry(bot)
+
+    async def stub_stripe_call(name, fn, *fn_args, timeout=None, **kwargs):
+        stripe_calls[name] += 1
+        await asyncio.sleep(args.stripe_latency)
+        return StubStripeObject(id=f"stub_{name}", url="https://checkout.stripe.com/stub", data=[], has_more=False,
+                                current_period_end=int(time.time()) + 30 * 86400)
+    stripe_calls = defaultdict(int)
+    stripe_client.call = stub_stripe_call
+
+    pool = await init_pool(server_settings={'search_path': SCHEMA})
+    try:
+        await migrate(pool)
+        outbound.set_global_rate(10_000)
+        outbound.start()
+        elapsed, latencies, results = await replay(events, args.concurrency)
+        await webhook_app.notifier.flush_all()
+
+        print(f"events={len(events)} concurrency={args.concurrency} "
+              f"telegram_latency={args.telegram_latency}s stripe_latency={args.stripe_latency}s")
+        print(f"elapsed={elapsed:.2f}s throughput={len(events) / elapsed:.1f} events/s")
+        print(f"{'type':<36} {'count':>7} {'p50 ms':>9} {'p99 ms':>9} {'mean ms':>9}  results")
+        for event_type, values in sorted(latencies.items()):
+            outcome = ', '.join(f"{k}={v}" for k, v in sorted(results[event_type].items()))
+            print(f"{event_type:<36} {len(values):>7} {_percentile(values, 50):>9.1f} "
+                  f"{_percentile(values, 99):>9.1f} {statistics.fmean(values):>9.1f}  {outcome}")
+        print(f"telegram calls: {dict(bot.calls)}")
+        print(f"stripe calls: {dict(stripe_calls)}")
+    finally:
+        await outbound.stop()
+        await close_pool()
+        await admin.execute(f'DROP SCHEMA IF EXISTS {SCHEMA} CASCADE')
+        await admin.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
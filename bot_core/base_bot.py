@@ -1,19 +1,33 @@
 # bot_core/base_bot.py
 import datetime
 import logging
-import stripe
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-from bot_core.db import get_pool, log_action, get_member_status, add_member
+from bot_core.db import get_pool, acquire, log_action, get_member_status, add_member, invalidate_member
 from bot_core.texts import get_text
 from bot_core.keyboards import main_menu_keyboard, plans_keyboard, payment_keyboard
-from config import STRIPE_SECRET_KEY, CRYPTO_ADDRESS, CRYPTO_QR_URL, PLAN_PRICES
+from bot_core.stripe_client import get_or_create_checkout_session
+from bot_core.metrics import DB_QUERY_SECONDS
+from bot_core.tracing import span
+from config import CRYPTO_ADDRESS, CRYPTO_QR_URL, PLAN_PRICES
 
-stripe.api_key = STRIPE_SECRET_KEY
 logger = logging.getLogger(__name__)
 
+# 메트릭 라벨용 button_handler 분기 이름 (callback_data 그대로 쓰면 값이 늘어날 수 있어 분기 단위로 묶음)
+_CALLBACK_BRANCHES = ('change_language', 'plans', 'status', 'help', 'select_weekly', 'select_monthly',
+                      'select_lifetime', 'back_to_main')
+_CALLBACK_PREFIXES = ('lang_', 'pay_paypal_', 'pay_crypto_', 'pay_stripe_')
+
+def callback_branch(data):
+    if data in _CALLBACK_BRANCHES:
+        return data
+    for prefix in _CALLBACK_PREFIXES:
+        if data and data.startswith(prefix):
+            return prefix.rstrip('_')
+    return 'other'
+
 class BaseBot:
-    def __init__(self, bot_name, token, price_monthly=None, price_lifetime=None, price_weekly=None, welcome_video=None, paypal_monthly=None, paypal_lifetime=None, paypal_weekly=None, has_monthly=True, has_lifetime=True, has_weekly=False, portal_return_url=None):
+    def __init__(self, bot_name, token, price_monthly=None, price_lifetime=None, price_weekly=None, welcome_video=None, paypal_monthly=None, paypal_lifetime=None, paypal_weekly=None, has_monthly=True, has_lifetime=True, has_weekly=False, portal_return_url=None, plan_prices=None, promoter_id=None):
         self.bot_name = bot_name
         self.token = token
         self.price_monthly = price_monthly
@@ -27,19 +41,24 @@ class BaseBot:
         self.has_lifetime = has_lifetime
         self.has_weekly = has_weekly
         self.portal_return_url = portal_return_url
+        self.plan_prices = plan_prices or PLAN_PRICES.get(bot_name, {})
+        self.promoter_id = promoter_id
 
     async def get_user_language(self, user_id):
-        pool = await get_pool()
-        row = await get_member_status(pool, user_id, self.bot_name)
+        # 하위 db.get_member_status span과의 차이가 풀 대기 시간 (캐시 적중이면 하위 span 없음)
+        async with span('get_user_language'):
+            pool = await get_pool()
+            row = await get_member_status(pool, user_id, self.bot_name)
         return row.get('language', "EN") if row else "EN"
 
     async def set_user_language(self, user_id, lang):
         pool = await get_pool()
-        async with pool.acquire() as conn:
+        async with acquire(pool) as conn, DB_QUERY_SECONDS.time('set_user_language'):
             await conn.execute(
                 'INSERT INTO members (user_id, language, bot_name) VALUES ($1, $2, $3) ON CONFLICT (user_id, bot_name) DO UPDATE SET language=$2',
                 user_id, lang, self.bot_name
             )
+        invalidate_member(user_id, self.bot_name)
 
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         pool = await get_pool()
@@ -104,7 +123,7 @@ class BaseBot:
             return
 
         if query.data == 'plans':
-            prices = PLAN_PRICES.get(self.bot_name, {'weekly': 'N/A', 'monthly': 'N/A', 'lifetime': 'N/A'})
+            prices = {'weekly': 'N/A', 'monthly': 'N/A', 'lifetime': 'N/A', **self.plan_prices}
             text = "Choose Your Plan\n\n"
             if self.has_weekly:
                 text += f"• Weekly: {prices['weekly']}/week\n"
@@ -220,7 +239,8 @@ class BaseBot:
             mode = 'subscription' if plan in ['weekly', 'monthly'] else 'payment'
             try:
                 username = query.from_user.username or f"user_{query.from_user.id}"
-                session = stripe.checkout.Session.create(
+                checkout_url = await get_or_create_checkout_session(
+                    query.from_user.id, self.bot_name, plan,
                     payment_method_types=['card'],
                     line_items=[{'price': price_id, 'quantity': 1}],
                     mode=mode,
@@ -234,7 +254,7 @@ class BaseBot:
                     }
                 )
                 buttons = [
-                    [InlineKeyboardButton("💳 Pay Now", url=session.url)],
+                    [InlineKeyboardButton("💳 Pay Now", url=checkout_url)],
                     [InlineKeyboardButton("Help", url="https://t.me/mbrypie")]
                 ]
                 await query.edit_message_text(
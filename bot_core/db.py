@@ -1,58 +1,89 @@
 # bot_core/db.py
+import asyncio
 import asyncpg
 import datetime
-from config import DATABASE_URL
+import decimal
+import logging
+from bot_core.cache import TTLCache
+from bot_core.metrics import DB_QUERY_SECONDS
+from config import (
+    DATABASE_URL, DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, DB_STATEMENT_CACHE_SIZE,
+    DB_ACQUIRE_TIMEOUT, DB_COMMAND_TIMEOUT, DB_MAX_INACTIVE_CONNECTION_LIFETIME,
+    MEMBER_CACHE_SIZE, MEMBER_CACHE_TTL,
+    LOG_BUFFER_MAX_ROWS, LOG_BUFFER_FLUSH_INTERVAL, LOG_BUFFER_MAX_PENDING, ROLLUP_USER_SET_DAYS
+)
+
+logger = logging.getLogger(__name__)
+
+# 프로세스 전체에서 공유하는 커넥션 풀 (startup에서 생성, shutdown에서 종료)
+_pool = None
+_pool_lock = asyncio.Lock()
+
+async def init_pool(dsn=DATABASE_URL, server_settings=None):
+    # server_settings: 벤치마크/리플레이에서 search_path를 임시 스키마로 돌릴 때 사용
+    global _pool
+    async with _pool_lock:
+        if _pool is None:
+            _pool = await asyncpg.create_pool(
+                dsn,
+                min_size=DB_POOL_MIN_SIZE,
+                max_size=DB_POOL_MAX_SIZE,
+                statement_cache_size=DB_STATEMENT_CACHE_SIZE,
+                command_timeout=DB_COMMAND_TIMEOUT,
+                max_inactive_connection_lifetime=DB_MAX_INACTIVE_CONNECTION_LIFETIME,
+                server_settings=server_settings,
+            )
+            logger.info(f"DB pool created (min={DB_POOL_MIN_SIZE}, max={DB_POOL_MAX_SIZE})")
+    return _pool
 
 async def get_pool():
-    return await asyncpg.create_pool(DATABASE_URL, min_size=1, max_size=10)
+    # startup 전에 호출되는 경우(스크립트 등)에도 동작하도록 lazy 생성
+    if _pool is None:
+        return await init_pool()
+    return _pool
 
-async def init_db(pool):
-    async with pool.acquire() as conn:
-        await conn.execute('''
-            CREATE TABLE IF NOT EXISTS members (
-                user_id BIGINT,
-                bot_name TEXT NOT NULL,
-                username TEXT,
-                email TEXT,
-                stripe_customer_id TEXT,
-                stripe_subscription_id TEXT,
-                is_lifetime BOOLEAN DEFAULT FALSE,
-                expiry TIMESTAMP,
-                active BOOLEAN DEFAULT TRUE,
-                language TEXT DEFAULT 'EN',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                kick_scheduled_at TIMESTAMP,
-                PRIMARY KEY (user_id, bot_name)
-            );
-        ''')
-        await conn.execute('''
-            CREATE TABLE IF NOT EXISTS daily_logs (
-                id SERIAL PRIMARY KEY,
-                user_id BIGINT,
-                action TEXT,
-                amount DECIMAL DEFAULT 0,
-                bot_name TEXT,
-                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-        ''')
+async def close_pool():
+    global _pool
+    async with _pool_lock:
+        if _pool is not None:
+            pool, _pool = _pool, None
+            await pool.close()
+            logger.info("DB pool closed")
 
-        await conn.execute('''
-            ALTER TABLE members
-            ADD COLUMN IF NOT EXISTS email TEXT;
-        ''')
-        await conn.execute('''
-            ALTER TABLE members
-            ADD COLUMN IF NOT EXISTS kick_scheduled_at TIMESTAMP;
-        ''')
-        await conn.execute('''
-            ALTER TABLE daily_logs
-            ADD COLUMN IF NOT EXISTS bot_name TEXT;
-        ''')
+# (user_id, bot_name) -> 활성 member row (없으면 None도 캐시)
+_member_cache = TTLCache(maxsize=MEMBER_CACHE_SIZE, ttl=MEMBER_CACHE_TTL)
+_NOT_CACHED = object()
+
+def invalidate_member(user_id, bot_name=None):
+    if bot_name is None:
+        _member_cache.pop_where(lambda key: key[0] == user_id)
+    else:
+        _member_cache.pop((user_id, bot_name))
+
+def acquire(pool):
+    return pool.acquire(timeout=DB_ACQUIRE_TIMEOUT)
+
+def pool_stats():
+    if _pool is None:
+        return {'size': 0, 'idle': 0, 'in_use': 0, 'waiters': 0, 'min_size': DB_POOL_MIN_SIZE, 'max_size': DB_POOL_MAX_SIZE}
+    size = _pool.get_size()
+    idle = _pool.get_idle_size()
+    # asyncpg는 대기자 수를 공개하지 않으므로 내부 큐의 getter 수로 계산
+    getters = getattr(getattr(_pool, '_queue', None), '_getters', ())
+    waiters = sum(1 for fut in getters if not fut.done())
+    return {
+        'size': size,
+        'idle': idle,
+        'in_use': size - idle,
+        'waiters': waiters,
+        'min_size': _pool.get_min_size(),
+        'max_size': _pool.get_max_size(),
+    }
 
 async def add_member(pool, user_id, username, customer_id=None, subscription_id=None, is_lifetime=False, expiry=None, bot_name='unknown', email='unknown'):
     if expiry is None:
         expiry = None if is_lifetime else (datetime.datetime.utcnow() + datetime.timedelta(days=30))
-    async with pool.acquire() as conn:
+    async with acquire(pool) as conn, DB_QUERY_SECONDS.time('add_member'):
         await conn.execute('''
             INSERT INTO members (
                 user_id, bot_name, username, email, stripe_customer_id, stripe_subscription_id,
@@ -65,46 +96,283 @@ async def add_member(pool, user_id, username, customer_id=None, subscription_id=
                 stripe_subscription_id = COALESCE(EXCLUDED.stripe_subscription_id, members.stripe_subscription_id),
                 is_lifetime = members.is_lifetime OR EXCLUDED.is_lifetime,
                 expiry = EXCLUDED.expiry,
-                active = TRUE
+                active = TRUE,
+                kick_scheduled_at = NULL
         ''', user_id, bot_name, username, email, customer_id, subscription_id, is_lifetime, expiry)
+    invalidate_member(user_id, bot_name)
 
-async def log_action(pool, user_id, action, amount=0, bot_name='unknown'):
-    async with pool.acquire() as conn:
-        await conn.execute('''
-            INSERT INTO daily_logs (user_id, action, amount, bot_name)
-            VALUES ($1, $2, $3, $4)
-        ''', user_id, action, amount, bot_name)
+async def extend_member_expiry(pool, user_id, bot_name, expiry):
+    """구독 갱신: expiry를 앞으로만 옮김 (invoice.paid와 subscription.updated가 둘 다 와도 안전)"""
+    async with acquire(pool) as conn, DB_QUERY_SECONDS.time('extend_member_expiry'):
+        result = await conn.execute('''
+            UPDATE members
+            SET expiry = GREATEST(COALESCE(expiry, $3), $3),
+                active = TRUE,
+                kick_scheduled_at = NULL
+            WHERE user_id = $1 AND bot_name = $2 AND NOT is_lifetime
+        ''', user_id, bot_name, expiry)
+    invalidate_member(user_id, bot_name)
+    return int(result.split()[-1]) > 0
+
+LOG_COLUMNS = ['user_id', 'action', 'amount', 'bot_name', 'timestamp']
+
+# daily_logs 행을 rollup 테이블에 누적. {source}는 l(user_id, action, amount, bot_name, timestamp)을 내는 FROM 절.
+# stats_daily: (day, bot_name, plan)별 이벤트 수/고유 유저/매출. plan ''은 봇 전체, bot_name '*'은 전체 봇 합계.
+# 고유 유저는 stats_daily_users에 처음 들어간 유저만 세서 증분으로 유지. {user_floor}는 고유 유저로 셀 날짜 조건
+_ROLLUP_DAILY_SQL = '''
+    WITH src AS (
+        SELECT l.user_id, l.timestamp::date AS day, COALESCE(l.bot_name, 'unknown') AS bot_name,
+               COALESCE(l.amount, 0) AS amount,
+               CASE WHEN l.action LIKE 'payment_stripe_%' THEN substr(l.action, 16) END AS plan
+        FROM {source}
+    ),
+    keyed AS (
+        SELECT day, bot_name, '' AS plan, user_id, amount FROM src
+        UNION ALL
+        SELECT day, bot_name, plan, user_id, amount FROM src WHERE plan IS NOT NULL
+        UNION ALL
+        SELECT day, '*', '', user_id, amount FROM src
+    ),
+    new_users AS (
+        INSERT INTO stats_daily_users (day, bot_name, plan, user_id)
+        SELECT DISTINCT day, bot_name, plan, user_id FROM keyed WHERE user_id IS NOT NULL{user_floor}
+        ON CONFLICT DO NOTHING
+        RETURNING day, bot_name, plan
+    )
+    INSERT INTO stats_daily AS s (day, bot_name, plan, events, unique_users, revenue)
+    SELECT k.day, k.bot_name, k.plan, k.events, COALESCE(n.users, 0), k.revenue
+    FROM (SELECT day, bot_name, plan, COUNT(*) AS events, SUM(amount) AS revenue FROM keyed GROUP BY 1, 2, 3) k
+    LEFT JOIN (SELECT day, bot_name, plan, COUNT(*) AS users FROM new_users GROUP BY 1, 2, 3) n
+        USING (day, bot_name, plan)
+    ON CONFLICT (day, bot_name, plan) DO UPDATE SET
+        events = s.events + EXCLUDED.events,
+        unique_users = s.unique_users + EXCLUDED.unique_users,
+        revenue = s.revenue + EXCLUDED.revenue
+'''
+
+# stats_plan_totals: (bot_name, plan)별 전체 기간 결제 수/결제 고객 수/매출
+_ROLLUP_PLAN_SQL = '''
+    WITH pay AS (
+        SELECT l.user_id, COALESCE(l.bot_name, 'unknown') AS bot_name, substr(l.action, 16) AS plan,
+               COALESCE(l.amount, 0) AS amount
+        FROM {source}
+        WHERE l.action LIKE 'payment_stripe_%'
+    ),
+    new_customers AS (
+        INSERT INTO stats_plan_customers (bot_name, plan, user_id)
+        SELECT DISTINCT bot_name, plan, user_id FROM pay WHERE user_id IS NOT NULL
+        ON CONFLICT DO NOTHING
+        RETURNING bot_name, plan
+    )
+    INSERT INTO stats_plan_totals AS t (bot_name, plan, payments, customers, revenue)
+    SELECT p.bot_name, p.plan, p.payments, COALESCE(c.customers, 0), p.revenue
+    FROM (SELECT bot_name, plan, COUNT(*) AS payments, SUM(amount) AS revenue FROM pay GROUP BY 1, 2) p
+    LEFT JOIN (SELECT bot_name, plan, COUNT(*) AS customers FROM new_customers GROUP BY 1, 2) c
+        USING (bot_name, plan)
+    ON CONFLICT (bot_name, plan) DO UPDATE SET
+        payments = t.payments + EXCLUDED.payments,
+        customers = t.customers + EXCLUDED.customers,
+        revenue = t.revenue + EXCLUDED.revenue
+'''
+
+_ARRAY_SOURCE = '''unnest($1::BIGINT[], $2::TEXT[], $3::NUMERIC[], $4::TEXT[], $5::TIMESTAMP[])
+             AS l(user_id, action, amount, bot_name, timestamp)'''
+_SINCE_SOURCE = '(SELECT * FROM daily_logs WHERE timestamp >= $1) l'
+# 증분 반영 시 유저 집합이 정리된(prune_rollup_users) 날짜는 고유 유저를 올리지 않음
+# (늦게 들어온 과거 날짜 로그 때문에 이미 센 유저가 다시 세어지지 않도록, 이벤트 수/매출은 그대로 반영)
+_RECENT_USERS_ONLY = f" AND day >= CURRENT_DATE - {int(ROLLUP_USER_SET_DAYS)}"
+
+async def apply_rollups(conn, records):
+    """LOG_COLUMNS 순서의 records를 rollup에 반영. daily_logs INSERT와 같은 트랜잭션에서 호출할 것"""
+    if not records:
+        return
+    columns = [list(col) for col in zip(*records)]
+    with DB_QUERY_SECONDS.time('rollup_daily'):
+        await conn.execute(_ROLLUP_DAILY_SQL.format(source=_ARRAY_SOURCE, user_floor=_RECENT_USERS_ONLY), *columns)
+    if any(action and action.startswith('payment_stripe_') for action in columns[1]):
+        with DB_QUERY_SECONDS.time('rollup_plan'):
+            await conn.execute(_ROLLUP_PLAN_SQL.format(source=_ARRAY_SOURCE), *columns)
+
+async def insert_logs(conn, records):
+    """LOG_COLUMNS 순서의 records를 COPY로 daily_logs에 넣고 rollup 반영. 호출 측 트랜잭션 안에서 사용"""
+    with DB_QUERY_SECONDS.time('copy_logs'):
+        await conn.copy_records_to_table('daily_logs', records=records, columns=LOG_COLUMNS)
+    await apply_rollups(conn, records)
+
+async def backfill_rollups(pool, since=None):
+    """daily_logs에서 rollup 재계산. since(datetime) 이후 일별 통계만 다시 만들고 그 이전 날짜는 유지.
+    보관(archive)된 파티션은 결제 외 로그가 지워졌으므로 since는 마지막 보관 구간 끝 이후로 당겨짐
+    (그 이전 날짜의 기존 집계를 지우지 않도록). 플랜별 누적은 결제 로그가 지워지지 않으므로 항상 전체 재계산.
+    실제로 적용한 since(None이면 전체)와 일 수를 반환"""
+    async with acquire(pool) as conn, DB_QUERY_SECONDS.time('backfill_rollups'):
+        async with conn.transaction():
+            # 로그 기록 경로와 같은 순서로 잠가서 재계산 중 들어온 로그는 커밋 후 증분으로 반영되게 함
+            await conn.execute(
+                'LOCK TABLE stats_daily_users, stats_daily, stats_plan_customers, stats_plan_totals IN EXCLUSIVE MODE'
+            )
+            archived_until = await conn.fetchval('SELECT MAX(range_end) FROM daily_logs_archives')
+            if archived_until is not None and (since is None or since < archived_until):
+                since = archived_until
+            if since is None:
+                await conn.execute('DELETE FROM stats_daily_users')
+                await conn.execute('DELETE FROM stats_daily')
+                await conn.execute(_ROLLUP_DAILY_SQL.format(source='daily_logs l', user_floor=''))
+            else:
+                await conn.execute('DELETE FROM stats_daily_users WHERE day >= $1', since.date())
+                await conn.execute('DELETE FROM stats_daily WHERE day >= $1', since.date())
+                await conn.execute(_ROLLUP_DAILY_SQL.format(source=_SINCE_SOURCE, user_floor=''), since)
+            await conn.execute('DELETE FROM stats_plan_customers')
+            await conn.execute('DELETE FROM stats_plan_totals')
+            await conn.execute(_ROLLUP_PLAN_SQL.format(source='daily_logs l'))
+            days = await conn.fetchval('SELECT COUNT(DISTINCT day) FROM stats_daily')
+    return since, days
+
+class LogBuffer:
+    """daily_logs 행을 모았다가 COPY 한 번으로 기록. 크기/시간 기준으로 flush"""
+
+    def __init__(self, max_rows=LOG_BUFFER_MAX_ROWS, interval=LOG_BUFFER_FLUSH_INTERVAL, max_pending=LOG_BUFFER_MAX_PENDING):
+        self.max_rows = max_rows
+        self.interval = interval
+        self.max_pending = max_pending
+        self._rows = []
+        self._lock = asyncio.Lock()
+        self._task = None
+        self._flush_task = None  # 크기 기준 flush (참조를 들고 있어야 끝나기 전에 GC되지 않음)
+        self.stats = {'buffered': 0, 'flushed': 0, 'flushes': 0, 'dropped': 0, 'errors': 0}
+
+    def append(self, record):
+        self._rows.append(record)
+        self.stats['buffered'] += 1
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._flush_loop(), name="log-buffer")
+        if len(self._rows) >= self.max_rows and (self._flush_task is None or self._flush_task.done()):
+            self._flush_task = asyncio.create_task(self.flush(), name="log-buffer-flush")
+
+    async def _flush_loop(self):
+        while self._rows:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    async def flush(self):
+        async with self._lock:
+            if not self._rows:
+                return 0
+            rows, self._rows = self._rows, []
+            try:
+                pool = await get_pool()
+                async with acquire(pool) as conn:
+                    async with conn.transaction():
+                        await insert_logs(conn, rows)
+            except Exception as e:
+                # 다음 flush에서 다시 시도. 장애가 길어지면 오래된 것부터 버림
+                self.stats['errors'] += 1
+                self._rows = rows + self._rows
+                overflow = len(self._rows) - self.max_pending
+                if overflow > 0:
+                    del self._rows[:overflow]
+                    self.stats['dropped'] += overflow
+                logger.error(f"daily_logs flush failed ({len(rows)} rows kept): {e}")
+                return 0
+            self.stats['flushed'] += len(rows)
+            self.stats['flushes'] += 1
+            return len(rows)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+        if self._flush_task is not None:
+            await self._flush_task
+        await self.flush()
+
+_log_buffer = LogBuffer()
+
+def log_record(user_id, action, amount, bot_name, timestamp=None):
+    return (user_id, action, decimal.Decimal(str(amount or 0)), bot_name, timestamp or datetime.datetime.utcnow())
+
+async def log_action(pool, user_id, action, amount=0, bot_name='unknown', durable=None):
+    """durable=True면 바로 INSERT 후 반환, 아니면 버퍼에 넣고 즉시 반환. 기본값: 결제 액션만 durable"""
+    if durable is None:
+        durable = action.startswith('payment_')
+    record = log_record(user_id, action, amount, bot_name)
+    if not durable:
+        _log_buffer.append(record)
+        return
+    async with acquire(pool) as conn:
+        async with conn.transaction():
+            with DB_QUERY_SECONDS.time('insert_log'):
+                await conn.execute('''
+                    INSERT INTO daily_logs (user_id, action, amount, bot_name, timestamp)
+                    VALUES ($1, $2, $3, $4, $5)
+                ''', *record)
+            await apply_rollups(conn, [record])
+
+async def flush_logs():
+    return await _log_buffer.flush()
+
+async def close_log_buffer():
+    await _log_buffer.close()
+
+def log_buffer_stats():
+    return {**_log_buffer.stats, 'pending': len(_log_buffer._rows)}
 
 async def get_member_status(pool, user_id, bot_name):
-    async with pool.acquire() as conn:
+    key = (user_id, bot_name)
+    cached = _member_cache.get(key, _NOT_CACHED)
+    if cached is not _NOT_CACHED:
+        return cached
+    async with acquire(pool) as conn, DB_QUERY_SECONDS.time('get_member_status'):
         row = await conn.fetchrow('SELECT * FROM members WHERE user_id = $1 AND bot_name = $2 AND active = TRUE', user_id, bot_name)
-    return dict(row) if row else None
+    member = dict(row) if row else None
+    _member_cache.set(key, member)
+    return member
+
+# members_active_expiry_idx로 처리되도록 expiry에 함수를 씌우지 않은 범위 조건 (tests/test_expiry_indexes.py에서 EXPLAIN 확인)
+NEAR_EXPIRY_SQL = '''
+    SELECT user_id, username, bot_name, (expiry::date - CURRENT_DATE) AS days_left
+    FROM members
+    WHERE active = TRUE AND NOT is_lifetime
+      AND ((expiry >= CURRENT_DATE + 1 AND expiry < CURRENT_DATE + 2)
+        OR (expiry >= CURRENT_DATE + 3 AND expiry < CURRENT_DATE + 4))
+'''
+
+EXPIRED_TODAY_SQL = '''
+    SELECT user_id, username, bot_name FROM members
+    WHERE active = TRUE AND NOT is_lifetime
+      AND expiry >= CURRENT_DATE AND expiry < CURRENT_DATE + 1
+'''
 
 async def get_near_expiry(pool):
-    async with pool.acquire() as conn:
-        rows = await conn.fetch('''
-            SELECT user_id, username, bot_name, (expiry::date - CURRENT_DATE) AS days_left
-            FROM members
-            WHERE active = TRUE AND NOT is_lifetime AND (expiry::date - CURRENT_DATE) IN (1, 3)
-        ''')
+    async with acquire(pool) as conn, DB_QUERY_SECONDS.time('get_near_expiry'):
+        rows = await conn.fetch(NEAR_EXPIRY_SQL)
     return [(r['user_id'], r['username'] or f"ID{r['user_id']}", r['bot_name'], r['days_left']) for r in rows]
 
 async def get_expired_today(pool):
-    async with pool.acquire() as conn:
-        rows = await conn.fetch('''
-            SELECT user_id, username, bot_name FROM members
-            WHERE active = TRUE AND NOT is_lifetime AND expiry::date = CURRENT_DATE
-        ''')
+    async with acquire(pool) as conn, DB_QUERY_SECONDS.time('get_expired_today'):
+        rows = await conn.fetch(EXPIRED_TODAY_SQL)
     return [(r['user_id'], r['username'] or f"ID{r['user_id']}", r['bot_name']) for r in rows]
 
-async def get_daily_stats(pool):
-    today = datetime.datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-    async with pool.acquire() as conn:
+async def get_daily_stats(pool, bot_name='*', day=None):
+    """stats_daily rollup 한 행 조회. bot_name '*'은 전체 봇 합계"""
+    day = day or datetime.datetime.utcnow().date()
+    async with acquire(pool) as conn, DB_QUERY_SECONDS.time('get_daily_stats'):
         row = await conn.fetchrow('''
-            SELECT 
-                COUNT(DISTINCT user_id) AS unique_users,
-                COALESCE(SUM(amount) FILTER (WHERE action LIKE 'payment_stripe%'), 0) AS total_revenue
-            FROM daily_logs
-            WHERE timestamp >= $1
-        ''', today)
-    return {'unique_users': row['unique_users'] or 0, 'total_revenue': float(row['total_revenue'] or 0)}
+            SELECT unique_users, revenue FROM stats_daily
+            WHERE day = $1 AND bot_name = $2 AND plan = ''
+        ''', day, bot_name)
+    if not row:
+        return {'unique_users': 0, 'total_revenue': 0.0}
+    return {'unique_users': row['unique_users'], 'total_revenue': float(row['revenue'])}
+
+async def get_plan_totals(pool, bot_name):
+    """{plan: {'payments', 'customers', 'revenue'}} — 전체 기간 누적"""
+    async with acquire(pool) as conn, DB_QUERY_SECONDS.time('get_plan_totals'):
+        rows = await conn.fetch(
+            'SELECT plan, payments, customers, revenue FROM stats_plan_totals WHERE bot_name = $1', bot_name
+        )
+    return {r['plan']: {'payments': r['payments'], 'customers': r['customers'], 'revenue': float(r['revenue'])} for r in rows}
+
+async def prune_rollup_users(pool, keep_days):
+    """고유 유저 판정용 집합에서 오래된 날짜 삭제 (집계값은 stats_daily에 남아 있음)"""
+    async with acquire(pool) as conn, DB_QUERY_SECONDS.time('prune_rollup_users'):
+        result = await conn.execute('DELETE FROM stats_daily_users WHERE day < CURRENT_DATE - $1::int', keep_days)
+    return int(result.split()[-1])
@@ -0,0 +1,136 @@
+# bot_core/enforcement.py
+import asyncio
+import datetime
+import logging
+import time
+from telegram.error import BadRequest
+from bot_core import outbound
+from bot_core.db import acquire, invalidate_member
+from bot_core.ratelimit import TokenBucket
+from config import (
+    CHANNEL_ID, ENFORCEMENT_DRY_RUN, ENFORCEMENT_GRACE_HOURS, ENFORCEMENT_BATCH_SIZE,
+    ENFORCEMENT_CONCURRENCY, ENFORCEMENT_RATE, ENFORCEMENT_UNBAN
+)
+
+logger = logging.getLogger(__name__)
+
+# 만료+유예가 지났거나 kick_scheduled_at이 지난 활성 회원. 같은 유저가 다른 봇에서
+# 아직 유효한 구독이 있으면(채널이 하나라서) 추방하지 않고 해당 행만 비활성화.
+# 두 조건을 따로 훑어서 각각 partial index(members_active_expiry_idx / members_kick_scheduled_idx)
+# 순서대로 keyset 페이징: ($1 기준 시각, ($2, $3, $4) 마지막 키, $5 limit, $6 cutoff)
+_DUE_MEMBERS_SQL = '''
+    SELECT m.user_id, m.bot_name, m.{column} AS due_at,
+           EXISTS (
+               SELECT 1 FROM members o
+               WHERE o.user_id = m.user_id AND o.bot_name <> m.bot_name AND o.active = TRUE
+                 AND (o.is_lifetime OR o.expiry >= $6)
+           ) AS has_other_access
+    FROM members m
+    WHERE m.active = TRUE AND {condition}
+      AND (m.{column}, m.user_id, m.bot_name) > ($2, $3, $4)
+    ORDER BY m.{column}, m.user_id, m.bot_name
+    LIMIT $5
+'''
+
+_DUE_PASSES = [
+    ('expiry', _DUE_MEMBERS_SQL.format(column='expiry', condition='NOT m.is_lifetime AND m.expiry < $1')),
+    # 위에서 이미 훑은 만료 회원은 제외
+    ('kick_scheduled_at', _DUE_MEMBERS_SQL.format(
+        column='kick_scheduled_at',
+        condition='m.kick_scheduled_at <= $1 AND NOT (NOT m.is_lifetime AND m.expiry IS NOT NULL AND m.expiry < $6)',
+    )),
+]
+
+# SELECT 이후 갱신(invoice.paid로 expiry 연장)된 회원은 비활성화하지 않도록 조건을 다시 확인
+_DEACTIVATE_SQL = '''
+    UPDATE members SET active = FALSE, kick_scheduled_at = $3
+    FROM unnest($1::bigint[], $2::text[]) AS due(user_id, bot_name)
+    WHERE members.user_id = due.user_id AND members.bot_name = due.bot_name AND members.active = TRUE
+      AND ((NOT members.is_lifetime AND members.expiry < $4) OR members.kick_scheduled_at <= $3)
+'''
+
+
+async def _remove_from_channel(bot, user_id, bucket, unban):
+    """True: 채널에서 제거됨(또는 이미 없음), False: 실패 → 다음 실행에서 재시도"""
+    try:
+        await bucket.acquire()
+        await outbound.send(bot, 'ban_chat_member', priority=outbound.PRIORITY_BULK, per_chat=False,
+                            chat_id=CHANNEL_ID, user_id=user_id)
+        if unban:
+            await bucket.acquire()
+            await outbound.send(bot, 'unban_chat_member', priority=outbound.PRIORITY_BULK, per_chat=False,
+                                chat_id=CHANNEL_ID, user_id=user_id, only_if_banned=True)
+        return True
+    except BadRequest as e:
+        # 채널에 없는 유저 등은 더 할 일이 없으므로 처리 완료로 봄
+        logger.info(f"Enforcement: user {user_id} not removable ({e}), marking inactive")
+        return True
+    except Exception as e:
+        logger.error(f"Enforcement: failed to remove user {user_id}: {e}")
+        return False
+
+
+async def enforce_expiry(pool, get_bot, dry_run=ENFORCEMENT_DRY_RUN, grace_hours=ENFORCEMENT_GRACE_HOURS,
+                         batch_size=ENFORCEMENT_BATCH_SIZE, concurrency=ENFORCEMENT_CONCURRENCY,
+                         rate=ENFORCEMENT_RATE, unban=ENFORCEMENT_UNBAN):
+    """만료 회원을 배치로 골라 채널에서 제거하고 배치당 UPDATE 한 번으로 비활성화"""
+    started = time.perf_counter()
+    now = datetime.datetime.utcnow()
+    cutoff = now - datetime.timedelta(hours=grace_hours)
+    bucket = TokenBucket(rate)
+    semaphore = asyncio.Semaphore(concurrency)
+    stats = {'dry_run': dry_run, 'scanned': 0, 'removed': 0, 'kept_other_access': 0, 'failed': 0, 'deactivated': 0}
+
+    async def process(row):
+        bot = get_bot(row['bot_name'])
+        if bot is None:
+            logger.error(f"Enforcement: no bot for {row['bot_name']}, user {row['user_id']}")
+            return False
+        async with semaphore:
+            return await _remove_from_channel(bot, row['user_id'], bucket, unban)
+
+    for column, due_sql in _DUE_PASSES:
+        bound = cutoff if column == 'expiry' else now
+        last_key = (datetime.datetime.min, -1, '')
+        while True:
+            async with acquire(pool) as conn:
+                rows = await conn.fetch(due_sql, bound, *last_key, batch_size, cutoff)
+            if not rows:
+                break
+            last_key = (rows[-1]['due_at'], rows[-1]['user_id'], rows[-1]['bot_name'])
+            await _process_batch(rows, process, stats, pool, dry_run, now, cutoff)
+
+    elapsed = time.perf_counter() - started
+    stats['elapsed_s'] = round(elapsed, 2)
+    stats['per_second'] = round(stats['scanned'] / elapsed, 1) if elapsed > 0 else 0.0
+    logger.info(f"Expiry enforcement finished: {stats}")
+    return stats
+
+
+async def _process_batch(rows, process, stats, pool, dry_run, now, cutoff):
+    stats['scanned'] += len(rows)
+
+    to_remove = [row for row in rows if not row['has_other_access']]
+    stats['kept_other_access'] += len(rows) - len(to_remove)
+    if dry_run:
+        stats['removed'] += len(to_remove)
+        return
+
+    results = await asyncio.gather(*(process(row) for row in to_remove))
+    done = [row for row in rows if row['has_other_access']]
+    for row, ok in zip(to_remove, results):
+        if ok:
+            done.append(row)
+            stats['removed'] += 1
+        else:
+            stats['failed'] += 1
+
+    if done:
+        async with acquire(pool) as conn:
+            result = await conn.execute(
+                _DEACTIVATE_SQL,
+                [row['user_id'] for row in done], [row['bot_name'] for row in done], now, cutoff
+            )
+        stats['deactivated'] += int(result.split()[-1])
+        for row in done:
+            invalidate_member(row['user_id'], row['bot_name'])
@@ -0,0 +1,48 @@
+# bot_core/export.py
+# 워커 프로세스에서 실행되는 거래 내역 파일 생성. 이벤트 루프/봇 코드를 import하지 않도록 pandas/openpyxl만 사용
+import gzip
+import pandas as pd
+from openpyxl import Workbook
+
+# DB에서 스풀한 원본 CSV 컬럼 순서 (transaction_report의 SELECT와 동일)
+RAW_COLUMNS = ['timestamp', 'amount', 'action', 'bot_name', 'email', 'telegram_user_id', 'telegram_username']
+OUTPUT_COLUMNS = ['payment_time_edmonton', 'amount', 'success', 'payment_type', 'bot_name', 'email', 'telegram_user_id', 'telegram_username']
+XLSX_MAX_ROWS = 1_048_575  # 헤더 제외 시트 최대 행 수
+
+def _format_chunk(df, tz):
+    ts = pd.to_datetime(df['timestamp'], format='ISO8601')
+    df['payment_time_edmonton'] = ts.dt.tz_localize('UTC').dt.tz_convert(tz).dt.strftime('%Y-%m-%d %H:%M:%S')
+    df['amount'] = pd.to_numeric(df['amount'])
+    df['success'] = 'Success'
+    df['payment_type'] = df['action'].str.startswith('payment_stripe_renewal').map({True: 'Renewal', False: 'New'})
+    df['email'] = df['email'].mask(df['email'] == 'unknown', '')
+    return df[OUTPUT_COLUMNS]
+
+def _read_chunks(raw_path, chunksize):
+    return pd.read_csv(
+        raw_path, names=RAW_COLUMNS, header=None, chunksize=chunksize,
+        dtype={'action': str, 'bot_name': str, 'email': str, 'telegram_username': str},
+        keep_default_na=False,
+    )
+
+def build_export(raw_path, out_path, fmt='xlsx', tz='America/Edmonton', chunksize=50_000):
+    """raw_path(헤더 없는 CSV)를 청크 단위로 변환해 out_path에 xlsx 또는 csv.gz로 기록. 기록한 행 수 반환"""
+    rows = 0
+    if fmt == 'xlsx':
+        # write_only 모드는 행을 바로 디스크로 흘려보내서 메모리가 행 수에 비례하지 않음
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet('Transactions')
+        ws.append(OUTPUT_COLUMNS)
+        for chunk in _read_chunks(raw_path, chunksize):
+            for row in _format_chunk(chunk, tz).itertuples(index=False, name=None):
+                ws.append(row)
+            rows += len(chunk)
+        wb.save(out_path)
+    else:
+        with gzip.open(out_path, 'wt', newline='') as f:
+            for chunk in _read_chunks(raw_path, chunksize):
+                _format_chunk(chunk, tz).to_csv(f, index=False, header=rows == 0)
+                rows += len(chunk)
+            if rows == 0:
+                f.write(','.join(OUTPUT_COLUMNS) + '\n')
+    return rows
@@ -0,0 +1,105 @@
+# bot_core/log_partitions.py
+import asyncio
+import datetime
+import gzip
+import logging
+import os
+import re
+import shutil
+from bot_core.db import acquire, prune_rollup_users
+from config import LOG_PARTITION_MONTHS_AHEAD, LOG_RETENTION_DAYS, LOG_ARCHIVE_DIR, ROLLUP_USER_SET_DAYS
+
+logger = logging.getLogger(__name__)
+
+# daily_logs_pYYYYMM — migration 6의 daily_logs_ensure_partition()과 같은 규칙
+_PARTITION_RE = re.compile(r'^daily_logs_p(\d{4})(\d{2})$')
+
+def _month_start(dt, offset=0):
+    month = dt.year * 12 + (dt.month - 1) + offset
+    return datetime.datetime(month // 12, month % 12 + 1, 1)
+
+async def ensure_partitions(pool, months_ahead=LOG_PARTITION_MONTHS_AHEAD):
+    """이번 달부터 months_ahead개월 뒤까지 파티션이 없으면 생성. 새로 만든 파티션 이름 목록 반환"""
+    now = datetime.datetime.utcnow()
+    created = []
+    async with acquire(pool) as conn:
+        for offset in range(months_ahead + 1):
+            name = await conn.fetchval(
+                'SELECT daily_logs_ensure_partition($1)', _month_start(now, offset).date()
+            )
+            if name:
+                created.append(name)
+    return created
+
+async def list_partitions(pool):
+    """(name, range_start, range_end, archived) 목록. DEFAULT 파티션은 제외"""
+    async with acquire(pool) as conn:
+        rows = await conn.fetch('''
+            SELECT c.relname AS name, a.partition_name IS NOT NULL AS archived
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            LEFT JOIN daily_logs_archives a ON a.partition_name = c.relname
+            WHERE i.inhparent = 'daily_logs'::regclass
+            ORDER BY c.relname
+        ''')
+    partitions = []
+    for r in rows:
+        match = _PARTITION_RE.match(r['name'])
+        if not match:
+            continue
+        start = datetime.datetime(int(match.group(1)), int(match.group(2)), 1)
+        partitions.append((r['name'], start, _month_start(start, 1), r['archived']))
+    return partitions
+
+def _gzip_file(src, dst):
+    with open(src, 'rb') as f, gzip.open(dst, 'wb') as gz:
+        shutil.copyfileobj(f, gz, length=1024 * 1024)
+
+async def _export_partition(conn, name, path):
+    """COPY TO STDOUT을 파일로 받고(asyncpg가 executor에서 씀) 압축은 스레드에서 — 한 달치 파티션을
+    압축하는 동안 event loop가 webhook/Stripe 처리를 계속하도록"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    raw_path = path + '.csv.tmp'
+    tmp_path = path + '.tmp'
+    try:
+        status = await conn.copy_from_table(name, output=raw_path, format='csv', header=True)
+        await asyncio.to_thread(_gzip_file, raw_path, tmp_path)
+    finally:
+        if os.path.exists(raw_path):
+            os.remove(raw_path)
+    # 끝까지 쓴 파일만 최종 이름으로 (중간에 죽으면 다음 실행에서 다시 export)
+    os.replace(tmp_path, path)
+    return int(status.split()[-1])
+
+async def archive_partitions(pool, retention_days=LOG_RETENTION_DAYS, archive_dir=LOG_ARCHIVE_DIR):
+    """보존 기간이 지난 달 파티션을 gzip CSV로 보관한 뒤 결제 외 행(start 등)을 삭제.
+    결제 행은 통계/정산에 계속 쓰이므로 남겨둠. retention_days <= 0이면 비활성화"""
+    if retention_days <= 0:
+        return []
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=retention_days)
+    archived = []
+    for name, start, end, done in await list_partitions(pool):
+        if done or end > cutoff:
+            continue
+        path = os.path.join(archive_dir, f"{name}.csv.gz")
+        async with acquire(pool) as conn:
+            row_count = await _export_partition(conn, name, path)
+            async with conn.transaction():
+                # action이 NULL인 행은 NOT LIKE에 걸리지 않으므로 따로 포함
+                result = await conn.execute(f"DELETE FROM {name} WHERE action IS NULL OR action NOT LIKE 'payment_%'")
+                deleted = int(result.split()[-1])
+                await conn.execute('''
+                    INSERT INTO daily_logs_archives (partition_name, range_start, range_end, path, row_count, deleted_count)
+                    VALUES ($1, $2, $3, $4, $5, $6)
+                ''', name, start, end, path, row_count, deleted)
+        logger.info(f"Archived {name}: {row_count} rows to {path}, deleted {deleted} non-payment rows")
+        archived.append({'partition': name, 'path': path, 'rows': row_count, 'deleted': deleted})
+    return archived
+
+async def maintain_partitions(pool):
+    created = await ensure_partitions(pool)
+    if created:
+        logger.info(f"Created daily_logs partitions: {created}")
+    archived = await archive_partitions(pool)
+    pruned = await prune_rollup_users(pool, ROLLUP_USER_SET_DAYS)
+    return {'created': created, 'archived': archived, 'pruned_rollup_users': pruned}
@@ -0,0 +1,189 @@
+# bot_core/metrics.py
+"""Prometheus text format 메트릭 (외부 의존성 없음)
+
+기록은 dict 조회 + 정수 덧셈 수준이라 핫패스에 그대로 둬도 됨. 라벨 값은 핸들러/쿼리/메서드 이름처럼
+개수가 정해진 것만 쓸 것 (user_id 같은 값을 라벨로 쓰면 시계열이 무한히 늘어남)
+"""
+import bisect
+import functools
+import time
+from bot_core.tracing import span as trace_span, annotate as trace_annotate
+
+# 초 단위 (5ms ~ 30s)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_metrics = []
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(
+        f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34)).replace(chr(10), " ")}"'
+        for name, value in zip(names, values)
+    )
+    return '{' + pairs + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        _metrics.append(self)
+
+    def inc(self, *label_values, amount=1):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for values, count in self._values.items():
+            lines.append(f"{self.name}{_format_labels(self.labels, values)} {_format_value(count)}")
+        return lines
+
+
+class Gauge:
+    """collect가 있으면 scrape 시점에 [(label_values, value), ...]를 받아 출력 (풀/큐 크기 등)"""
+
+    def __init__(self, name, help, labels=(), collect=None):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.collect = collect
+        self._values = {}
+        _metrics.append(self)
+
+    def set(self, value, *label_values):
+        self._values[label_values] = value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        items = self._values.items()
+        if self.collect is not None:
+            try:
+                items = list(self.collect())
+            except Exception:
+                items = []
+        for values, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labels, values)} {_format_value(value)}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ('histogram', 'label_values', 'started', 'span')
+
+    def __init__(self, histogram, label_values):
+        self.histogram = histogram
+        self.label_values = label_values
+        self.span = None
+
+    def __enter__(self):
+        if self.histogram.span_prefix:
+            self.span = trace_span(f"{self.histogram.span_prefix}.{'.'.join(map(str, self.label_values))}")
+            self.span.__enter__()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.started, *self.label_values)
+        if self.span is not None:
+            self.span.__exit__(exc_type, exc, tb)
+        return False
+
+    # async with acquire(pool) as conn, HISTOGRAM.time(...) 형태로도 쓸 수 있게 (커넥션을 얻은 뒤부터 측정)
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
+
+
+class Histogram:
+    # span_prefix가 있으면 time() 구간을 현재 trace의 span('<prefix>.<label>')으로도 기록
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS, span_prefix=None):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.span_prefix = span_prefix
+        self._series = {}  # label_values -> [bucket별 개수(+Inf 포함, 누적 아님), sum, count]
+        _metrics.append(self)
+
+    def observe(self, value, *label_values):
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def time(self, *label_values):
+        """with histogram.time('label'): ... 블록의 경과 시간(초)을 기록"""
+        return _Timer(self, label_values)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        bucket_labels = self.labels + ('le',)
+        for values, (counts, total, count) in self._series.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(bucket_labels, values + (_format_value(bound),))} {cumulative}")
+            labels = _format_labels(self.labels, values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+def timed_handler(name, callback):
+    """PTB 핸들러 콜백을 감싸 telegram_handler_* 에 기록. name이 callable이면 update마다 라벨을 정함"""
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        label = name(update) if callable(name) else name
+        trace_annotate(handler=label)
+        started = time.perf_counter()
+        outcome = 'error'
+        try:
+            with trace_span(f"handler.{label}"):
+                result = await callback(update, context)
+            outcome = 'ok'
+            return result
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - started, label)
+            HANDLER_TOTAL.inc(label, outcome)
+    return wrapper
+
+
+def render():
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+# 공용 메트릭 — 각 모듈은 여기 정의된 객체에 기록만 함
+HANDLER_SECONDS = Histogram('telegram_handler_seconds', 'Telegram handler latency', ['handler'])
+HANDLER_TOTAL = Counter('telegram_handler_total', 'Telegram handler invocations', ['handler', 'outcome'])
+UPDATE_QUEUE_WAIT_SECONDS = Histogram('telegram_update_queue_wait_seconds', 'Time from webhook enqueue to handler start', ['bot'])
+UPDATES_TOTAL = Counter('telegram_updates_total', 'Telegram webhook updates by result', ['bot', 'result'])
+TELEGRAM_API_SECONDS = Histogram('telegram_api_seconds', 'Telegram Bot API request latency', ['method'])
+TELEGRAM_API_TOTAL = Counter('telegram_api_total', 'Telegram Bot API requests', ['method', 'outcome'])
+OUTBOUND_WAIT_SECONDS = Histogram('outbound_queue_wait_seconds', 'Outbound send queue wait before first attempt', ['priority'])
+OUTBOUND_TOTAL = Counter('outbound_sends_total', 'Outbound queued Telegram sends by result', ['method', 'outcome'])
+STRIPE_EVENT_SECONDS = Histogram('stripe_event_seconds', 'Stripe event handler latency', ['type'])
+STRIPE_EVENTS_TOTAL = Counter('stripe_events_total', 'Stripe events processed by result', ['type', 'outcome'])
+STRIPE_WEBHOOK_TOTAL = Counter('stripe_webhook_total', 'Stripe webhook deliveries', ['type', 'result'])
+STRIPE_API_SECONDS = Histogram('stripe_api_seconds', 'Stripe API call latency', ['operation'])
+STRIPE_API_TOTAL = Counter('stripe_api_total', 'Stripe API calls', ['operation', 'outcome'])
+DB_QUERY_SECONDS = Histogram('db_query_seconds', 'Named DB query latency', ['query'],
+                             buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 10.0),
+                             span_prefix='db')
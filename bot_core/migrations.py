@@ -0,0 +1,448 @@
+# bot_core/migrations.py
+import asyncpg
+import logging
+from bot_core.db import acquire
+
+logger = logging.getLogger(__name__)
+
+# 여러 replica가 동시에 뜰 때 한 곳만 마이그레이션하도록 잡는 advisory lock 키
+SCHEMA_LOCK_KEY = 734_100_001
+
+# (version, description, statements) — 순서대로 한 번씩만 적용. 이미 배포된 버전은 수정하지 말고 새 버전을 추가할 것
+MIGRATIONS = [
+    (1, "base schema", [
+        '''
+        CREATE TABLE IF NOT EXISTS members (
+            user_id BIGINT,
+            bot_name TEXT NOT NULL,
+            username TEXT,
+            email TEXT,
+            stripe_customer_id TEXT,
+            stripe_subscription_id TEXT,
+            is_lifetime BOOLEAN DEFAULT FALSE,
+            expiry TIMESTAMP,
+            active BOOLEAN DEFAULT TRUE,
+            language TEXT DEFAULT 'EN',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            kick_scheduled_at TIMESTAMP,
+            PRIMARY KEY (user_id, bot_name)
+        );
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS daily_logs (
+            id SERIAL PRIMARY KEY,
+            user_id BIGINT,
+            action TEXT,
+            amount DECIMAL DEFAULT 0,
+            bot_name TEXT,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        ''',
+        # schema_version 도입 전 DB 호환용
+        'ALTER TABLE members ADD COLUMN IF NOT EXISTS email TEXT;',
+        'ALTER TABLE members ADD COLUMN IF NOT EXISTS kick_scheduled_at TIMESTAMP;',
+        'ALTER TABLE daily_logs ADD COLUMN IF NOT EXISTS bot_name TEXT;',
+    ]),
+    (2, "stripe event inbox", [
+        '''
+        CREATE TABLE IF NOT EXISTS stripe_events (
+            id TEXT PRIMARY KEY,
+            type TEXT NOT NULL,
+            payload JSONB NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INT NOT NULL DEFAULT 0,
+            next_attempt_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            locked_until TIMESTAMP,
+            last_error TEXT,
+            received_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            processed_at TIMESTAMP
+        );
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS stripe_events_due_idx
+        ON stripe_events (next_attempt_at)
+        WHERE status IN ('pending', 'processing');
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS stripe_events_processed_idx
+        ON stripe_events (processed_at)
+        WHERE status = 'done';
+        ''',
+    ]),
+    (3, "lookup indexes for members and daily_logs", [
+        '''
+        CREATE INDEX IF NOT EXISTS members_stripe_subscription_idx
+        ON members (stripe_subscription_id)
+        WHERE stripe_subscription_id IS NOT NULL;
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS members_stripe_customer_idx
+        ON members (stripe_customer_id)
+        WHERE stripe_customer_id IS NOT NULL;
+        ''',
+        # 만료 조회(get_near_expiry / get_expired_today)용: 활성 비-lifetime 회원만
+        '''
+        CREATE INDEX IF NOT EXISTS members_active_expiry_idx
+        ON members (expiry)
+        WHERE active = TRUE AND NOT is_lifetime;
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS daily_logs_bot_action_ts_idx
+        ON daily_logs (bot_name, action, timestamp);
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS daily_logs_timestamp_idx
+        ON daily_logs (timestamp);
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS daily_logs_payments_ts_idx
+        ON daily_logs (timestamp)
+        WHERE action LIKE 'payment_stripe%';
+        ''',
+    ]),
+    (4, "scheduled job runs", [
+        '''
+        CREATE TABLE IF NOT EXISTS job_runs (
+            job_name TEXT PRIMARY KEY,
+            last_slot TIMESTAMP,
+            lease_owner TEXT,
+            lease_until TIMESTAMP,
+            last_started_at TIMESTAMP,
+            last_success_at TIMESTAMP,
+            last_duration_ms DOUBLE PRECISION,
+            last_error TEXT,
+            run_count BIGINT NOT NULL DEFAULT 0,
+            failure_count BIGINT NOT NULL DEFAULT 0
+        );
+        ''',
+    ]),
+    (5, "expiry enforcement index", [
+        '''
+        CREATE INDEX IF NOT EXISTS members_kick_scheduled_idx
+        ON members (kick_scheduled_at)
+        WHERE active = TRUE AND kick_scheduled_at IS NOT NULL;
+        ''',
+    ]),
+    (6, "monthly partitioned daily_logs", [
+        # 기존 테이블은 legacy로 돌려놓고 같은 이름의 파티션 테이블로 옮김. 시퀀스는 id 연속성을 위해 재사용
+        'ALTER SEQUENCE daily_logs_id_seq OWNED BY NONE;',
+        'ALTER SEQUENCE daily_logs_id_seq AS BIGINT;',
+        'ALTER TABLE daily_logs RENAME TO daily_logs_legacy;',
+        'ALTER TABLE daily_logs_legacy DROP CONSTRAINT IF EXISTS daily_logs_pkey;',
+        'DROP INDEX IF EXISTS daily_logs_bot_action_ts_idx;',
+        'DROP INDEX IF EXISTS daily_logs_timestamp_idx;',
+        'DROP INDEX IF EXISTS daily_logs_payments_ts_idx;',
+        '''
+        CREATE TABLE daily_logs (
+            id BIGINT NOT NULL DEFAULT nextval('daily_logs_id_seq'),
+            user_id BIGINT,
+            action TEXT,
+            amount DECIMAL DEFAULT 0,
+            bot_name TEXT,
+            timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (id, timestamp)
+        ) PARTITION BY RANGE (timestamp);
+        ''',
+        # 미리 만든 파티션 범위를 벗어난 행이 INSERT 실패하지 않도록 받아두는 곳 (정상이면 비어 있음)
+        'CREATE TABLE daily_logs_default PARTITION OF daily_logs DEFAULT;',
+        '''
+        CREATE OR REPLACE FUNCTION daily_logs_ensure_partition(p_month DATE) RETURNS TEXT AS $$
+        DECLARE
+            start_ts TIMESTAMP := date_trunc('month', p_month);
+            end_ts TIMESTAMP := date_trunc('month', p_month) + INTERVAL '1 month';
+            part TEXT := 'daily_logs_p' || to_char(p_month, 'YYYYMM');
+        BEGIN
+            IF to_regclass(part) IS NOT NULL THEN
+                RETURN NULL;
+            END IF;
+            EXECUTE format('CREATE TABLE %I (LIKE daily_logs INCLUDING DEFAULTS)', part);
+            -- DEFAULT 파티션에 이미 들어간 같은 달 행은 새 파티션으로 옮긴 뒤 attach
+            EXECUTE format(
+                'WITH moved AS (DELETE FROM daily_logs_default WHERE timestamp >= $1 AND timestamp < $2 RETURNING *) '
+                'INSERT INTO %I SELECT * FROM moved', part
+            ) USING start_ts, end_ts;
+            EXECUTE format('ALTER TABLE daily_logs ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)', part, start_ts, end_ts);
+            RETURN part;
+        END;
+        $$ LANGUAGE plpgsql;
+        ''',
+        # 기존 데이터가 있는 달부터 3개월 뒤까지 파티션 생성
+        '''
+        DO $$
+        DECLARE
+            m DATE := date_trunc('month', COALESCE((SELECT MIN(timestamp) FROM daily_logs_legacy), CURRENT_TIMESTAMP));
+        BEGIN
+            WHILE m <= date_trunc('month', CURRENT_TIMESTAMP) + INTERVAL '3 months' LOOP
+                PERFORM daily_logs_ensure_partition(m);
+                m := m + INTERVAL '1 month';
+            END LOOP;
+        END;
+        $$;
+        ''',
+        '''
+        INSERT INTO daily_logs (id, user_id, action, amount, bot_name, timestamp)
+        SELECT id, user_id, action, amount, bot_name, COALESCE(timestamp, CURRENT_TIMESTAMP)
+        FROM daily_logs_legacy;
+        ''',
+        'DROP TABLE daily_logs_legacy;',
+        'ALTER SEQUENCE daily_logs_id_seq OWNED BY daily_logs.id;',
+        # 부모에 만든 인덱스는 모든 파티션(이후 attach되는 것 포함)에 자동 생성됨
+        '''
+        CREATE INDEX IF NOT EXISTS daily_logs_bot_action_ts_idx
+        ON daily_logs (bot_name, action, timestamp);
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS daily_logs_timestamp_idx
+        ON daily_logs (timestamp);
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS daily_logs_payments_ts_idx
+        ON daily_logs (timestamp)
+        WHERE action LIKE 'payment_stripe%';
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS daily_logs_archives (
+            partition_name TEXT PRIMARY KEY,
+            range_start TIMESTAMP NOT NULL,
+            range_end TIMESTAMP NOT NULL,
+            path TEXT NOT NULL,
+            row_count BIGINT NOT NULL,
+            deleted_count BIGINT NOT NULL,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        ''',
+    ]),
+    (7, "revenue and visitor rollups", [
+        '''
+        CREATE TABLE IF NOT EXISTS stats_daily (
+            day DATE NOT NULL,
+            bot_name TEXT NOT NULL,
+            plan TEXT NOT NULL,
+            events BIGINT NOT NULL DEFAULT 0,
+            unique_users BIGINT NOT NULL DEFAULT 0,
+            revenue NUMERIC NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, bot_name, plan)
+        );
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS stats_daily_users (
+            day DATE NOT NULL,
+            bot_name TEXT NOT NULL,
+            plan TEXT NOT NULL,
+            user_id BIGINT NOT NULL,
+            PRIMARY KEY (day, bot_name, plan, user_id)
+        );
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS stats_plan_totals (
+            bot_name TEXT NOT NULL,
+            plan TEXT NOT NULL,
+            payments BIGINT NOT NULL DEFAULT 0,
+            customers BIGINT NOT NULL DEFAULT 0,
+            revenue NUMERIC NOT NULL DEFAULT 0,
+            PRIMARY KEY (bot_name, plan)
+        );
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS stats_plan_customers (
+            bot_name TEXT NOT NULL,
+            plan TEXT NOT NULL,
+            user_id BIGINT NOT NULL,
+            PRIMARY KEY (bot_name, plan, user_id)
+        );
+        ''',
+        # 기존 daily_logs 전체로 초기 집계 (작성 당시 rollup SQL 그대로 — db.py의 SQL이 바뀌어도 변하지 않도록)
+        '''
+        WITH src AS (
+            SELECT l.user_id, l.timestamp::date AS day, COALESCE(l.bot_name, 'unknown') AS bot_name,
+                   COALESCE(l.amount, 0) AS amount,
+                   CASE WHEN l.action LIKE 'payment_stripe_%' THEN substr(l.action, 16) END AS plan
+            FROM daily_logs l
+        ),
+        keyed AS (
+            SELECT day, bot_name, '' AS plan, user_id, amount FROM src
+            UNION ALL
+            SELECT day, bot_name, plan, user_id, amount FROM src WHERE plan IS NOT NULL
+            UNION ALL
+            SELECT day, '*', '', user_id, amount FROM src
+        ),
+        new_users AS (
+            INSERT INTO stats_daily_users (day, bot_name, plan, user_id)
+            SELECT DISTINCT day, bot_name, plan, user_id FROM keyed WHERE user_id IS NOT NULL
+            ON CONFLICT DO NOTHING
+            RETURNING day, bot_name, plan
+        )
+        INSERT INTO stats_daily AS s (day, bot_name, plan, events, unique_users, revenue)
+        SELECT k.day, k.bot_name, k.plan, k.events, COALESCE(n.users, 0), k.revenue
+        FROM (SELECT day, bot_name, plan, COUNT(*) AS events, SUM(amount) AS revenue FROM keyed GROUP BY 1, 2, 3) k
+        LEFT JOIN (SELECT day, bot_name, plan, COUNT(*) AS users FROM new_users GROUP BY 1, 2, 3) n
+            USING (day, bot_name, plan)
+        ON CONFLICT (day, bot_name, plan) DO UPDATE SET
+            events = s.events + EXCLUDED.events,
+            unique_users = s.unique_users + EXCLUDED.unique_users,
+            revenue = s.revenue + EXCLUDED.revenue
+        ''',
+        '''
+        WITH pay AS (
+            SELECT l.user_id, COALESCE(l.bot_name, 'unknown') AS bot_name, substr(l.action, 16) AS plan,
+                   COALESCE(l.amount, 0) AS amount
+            FROM daily_logs l
+            WHERE l.action LIKE 'payment_stripe_%'
+        ),
+        new_customers AS (
+            INSERT INTO stats_plan_customers (bot_name, plan, user_id)
+            SELECT DISTINCT bot_name, plan, user_id FROM pay WHERE user_id IS NOT NULL
+            ON CONFLICT DO NOTHING
+            RETURNING bot_name, plan
+        )
+        INSERT INTO stats_plan_totals AS t (bot_name, plan, payments, customers, revenue)
+        SELECT p.bot_name, p.plan, p.payments, COALESCE(c.customers, 0), p.revenue
+        FROM (SELECT bot_name, plan, COUNT(*) AS payments, SUM(amount) AS revenue FROM pay GROUP BY 1, 2) p
+        LEFT JOIN (SELECT bot_name, plan, COUNT(*) AS customers FROM new_customers GROUP BY 1, 2) c
+            USING (bot_name, plan)
+        ON CONFLICT (bot_name, plan) DO UPDATE SET
+            payments = t.payments + EXCLUDED.payments,
+            customers = t.customers + EXCLUDED.customers,
+            revenue = t.revenue + EXCLUDED.revenue
+        ''',
+    ]),
+    (8, "stripe payment reconciliation", [
+        '''
+        CREATE TABLE IF NOT EXISTS stripe_payments (
+            payment_intent_id TEXT PRIMARY KEY,
+            user_id BIGINT,
+            bot_name TEXT,
+            action TEXT,
+            amount NUMERIC,
+            currency TEXT,
+            created_at TIMESTAMP,
+            source TEXT NOT NULL,
+            recorded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_synced_at TIMESTAMP
+        );
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS stripe_sync_state (
+            name TEXT PRIMARY KEY,
+            high_water BIGINT NOT NULL,
+            last_run_at TIMESTAMP,
+            last_fetched INT,
+            last_inserted INT
+        );
+        ''',
+    ]),
+    (9, "raw stripe event store", [
+        # payload: encoding이 'zlib'이면 압축된 원본 JSON, 'json'이면 압축 없는 UTF-8 JSON
+        '''
+        CREATE TABLE IF NOT EXISTS stripe_event_store (
+            id TEXT PRIMARY KEY,
+            type TEXT NOT NULL,
+            received_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            payload BYTEA NOT NULL,
+            encoding TEXT NOT NULL DEFAULT 'zlib'
+        );
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS stripe_event_store_type_received_idx
+        ON stripe_event_store (type, received_at);
+        ''',
+        # inbox에 아직 남아 있는 이벤트로 초기 채움
+        '''
+        INSERT INTO stripe_event_store (id, type, received_at, payload, encoding)
+        SELECT id, type, COALESCE(received_at, CURRENT_TIMESTAMP), convert_to(payload::text, 'UTF8'), 'json'
+        FROM stripe_events
+        ON CONFLICT (id) DO NOTHING;
+        ''',
+    ]),
+    (10, "telegram update dedup", [
+        '''
+        CREATE TABLE IF NOT EXISTS telegram_updates (
+            bot_key TEXT NOT NULL,
+            update_id BIGINT NOT NULL,
+            received_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (bot_key, update_id)
+        );
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS telegram_updates_received_idx
+        ON telegram_updates (received_at);
+        ''',
+    ]),
+    (11, "pending admin notifications", [
+        # NotificationAggregator가 coalescing window 동안 모으는 알림. 전송 후 삭제
+        '''
+        CREATE TABLE IF NOT EXISTS pending_notifications (
+            id BIGSERIAL PRIMARY KEY,
+            bot_key TEXT NOT NULL,
+            chat_id BIGINT NOT NULL,
+            group_key TEXT NOT NULL,
+            text TEXT NOT NULL,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            claimed_until TIMESTAMP
+        );
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS pending_notifications_recipient_idx
+        ON pending_notifications (bot_key, chat_id, id);
+        ''',
+    ]),
+    (12, "pending notification retry backoff", [
+        # 일시 오류로 못 보낸 알림은 attempts를 올리고 next_attempt_at까지 claim/sweep 대상에서 빠짐
+        '''
+        ALTER TABLE pending_notifications
+            ADD COLUMN IF NOT EXISTS attempts INT NOT NULL DEFAULT 0,
+            ADD COLUMN IF NOT EXISTS next_attempt_at TIMESTAMP;
+        ''',
+    ]),
+    (13, "purge null-action rows from archived log partitions", [
+        # 이전 archive_partitions가 남긴 행 (archive 파일에는 이미 들어 있음)
+        '''
+        DELETE FROM daily_logs l
+        USING daily_logs_archives a
+        WHERE l.action IS NULL AND l.timestamp >= a.range_start AND l.timestamp < a.range_end;
+        ''',
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+async def _current_version(conn):
+    try:
+        return await conn.fetchval('SELECT COALESCE(MAX(version), 0) FROM schema_version')
+    except asyncpg.UndefinedTableError:
+        return 0
+
+async def migrate(pool):
+    """스키마를 최신 버전으로 올림. 이미 최신이면 DDL 없이 조회 1회로 끝남"""
+    async with acquire(pool) as conn:
+        version = await _current_version(conn)
+        if version >= LATEST_VERSION:
+            logger.info(f"DB schema is current (version {version})")
+            return version
+
+        await conn.execute('SELECT pg_advisory_lock($1)', SCHEMA_LOCK_KEY)
+        try:
+            await conn.execute('''
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    version INT PRIMARY KEY,
+                    description TEXT,
+                    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+            ''')
+            # 락을 기다리는 동안 다른 replica가 이미 적용했을 수 있음
+            version = await _current_version(conn)
+            for target, description, statements in MIGRATIONS:
+                if target <= version:
+                    continue
+                async with conn.transaction():
+                    for sql in statements:
+                        await conn.execute(sql)
+                    await conn.execute(
+                        'INSERT INTO schema_version (version, description) VALUES ($1, $2)',
+                        target, description
+                    )
+                version = target
+                logger.info(f"Applied DB migration {target}: {description}")
+        finally:
+            await conn.execute('SELECT pg_advisory_unlock($1)', SCHEMA_LOCK_KEY)
+    return version
@@ -0,0 +1,191 @@
+# bot_core/notifications.py
+import asyncio
+import logging
+from collections import OrderedDict
+from telegram.error import BadRequest, Forbidden
+from bot_core import outbound
+from bot_core.db import get_pool, acquire
+from config import (
+    NOTIFY_COALESCE_WINDOW, NOTIFY_DIGEST_THRESHOLD, NOTIFY_CLAIM_TIMEOUT, NOTIFY_MAX_ATTEMPTS,
+    NOTIFY_BACKOFF_BASE, NOTIFY_BACKOFF_MAX
+)
+
+logger = logging.getLogger(__name__)
+
+# Telegram 메시지 최대 4096자, 여유를 둠
+MAX_MESSAGE_LENGTH = 4000
+DIGEST_SEPARATOR = "\n\n————————\n\n"
+
+
+def merge_messages(base, extra):
+    """base에 없는 줄만 뒤에 붙여서 합침 (빈 줄은 비교 대상에서 제외)"""
+    existing = set(line for line in base.split('\n') if line.strip())
+    new_lines = [line for line in extra.split('\n') if line.strip() and line not in existing]
+    return base + ('\n' + '\n'.join(new_lines) if new_lines else '')
+
+
+def _chunk(parts, header):
+    """parts: [(text, 행 id 목록)] → 메시지 길이 안에서 합친 [(text, 그 메시지에 담긴 행 id 목록)]"""
+    chunks, current, current_ids = [], header, []
+    for part, ids in parts:
+        candidate = current + (DIGEST_SEPARATOR if current != header else '') + part
+        if len(candidate) > MAX_MESSAGE_LENGTH and current != header:
+            chunks.append((current, current_ids))
+            current, current_ids = header + part, list(ids)
+        else:
+            current, current_ids = candidate, current_ids + ids
+    chunks.append((current, current_ids))
+    return chunks
+
+
+# 수신자별로 아직 보내지 않은 알림 claim. 다른 replica가 처리 중(claimed_until 미경과)인 행은 건너뜀
+_CLAIM_SQL = '''
+    UPDATE pending_notifications SET claimed_until = NOW() + $3 * INTERVAL '1 second'
+    WHERE id IN (
+        SELECT id FROM pending_notifications
+        WHERE bot_key = $1 AND chat_id = $2 AND (claimed_until IS NULL OR claimed_until < NOW())
+          AND (next_attempt_at IS NULL OR next_attempt_at <= NOW())
+        ORDER BY id
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING id, group_key, text
+'''
+
+# 일시 오류: claim을 풀고 backoff 뒤 sweep에서 다시 보냄. 최대 횟수를 넘긴 행은 삭제하고 id 반환
+_RETRY_SQL = '''
+    UPDATE pending_notifications
+    SET claimed_until = NULL, attempts = attempts + 1,
+        next_attempt_at = NOW() + LEAST($2 * POWER(2, attempts), $3) * INTERVAL '1 second'
+    WHERE id = ANY($1::bigint[])
+'''
+_EXHAUSTED_SQL = 'DELETE FROM pending_notifications WHERE id = ANY($1::bigint[]) AND attempts >= $2 RETURNING id'
+
+
+class NotificationAggregator:
+    """수신자별로 window 동안 알림을 모아 같은 구독(group_key)은 한 메시지로, 많으면 digest로 전송.
+    모으는 동안 알림은 pending_notifications에 있으므로 재시작/크래시에도 유실되지 않음 (메시지마다 보낸 행만 삭제).
+    BadRequest/Forbidden처럼 다시 보내도 같은 결과인 오류는 바로 버리고, 일시 오류는 backoff하며 재시도"""
+
+    def __init__(self, get_bot, window=NOTIFY_COALESCE_WINDOW, digest_threshold=NOTIFY_DIGEST_THRESHOLD,
+                 claim_timeout=NOTIFY_CLAIM_TIMEOUT):
+        self._get_bot = get_bot
+        self.window = window
+        self.digest_threshold = digest_threshold
+        self.claim_timeout = claim_timeout
+        self._timers = {}  # (bot_key, chat_id) -> flush 예약 태스크
+        self.stats = {'received': 0, 'sent_messages': 0, 'merged': 0, 'digests': 0, 'failed': 0, 'dropped': 0}
+
+    async def add(self, bot_key, chat_id, group_key, text):
+        """알림을 기록하고 window 뒤 flush 예약. Stripe 이벤트 처리 안에서 호출되므로 inbox 행이 done이 되기 전에 저장됨"""
+        async with acquire(await get_pool()) as conn:
+            await conn.execute(
+                'INSERT INTO pending_notifications (bot_key, chat_id, group_key, text) VALUES ($1, $2, $3, $4)',
+                bot_key, chat_id, group_key, text
+            )
+        self.stats['received'] += 1
+        self._schedule((bot_key, chat_id))
+
+    def _schedule(self, recipient, delay=None):
+        if recipient not in self._timers:
+            self._timers[recipient] = asyncio.create_task(self._flush_later(recipient, self.window if delay is None else delay))
+
+    def pending_recipients(self):
+        return len(self._timers)
+
+    async def _flush_later(self, recipient, delay):
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            return
+        await self.flush(recipient)
+
+    async def flush(self, recipient):
+        self._timers.pop(recipient, None)
+        bot_key, chat_id = recipient
+        pool = await get_pool()
+        async with acquire(pool) as conn:
+            rows = await conn.fetch(_CLAIM_SQL, bot_key, chat_id, self.claim_timeout)
+        if not rows:
+            return
+        bot = self._get_bot(bot_key)
+        if bot is None:
+            logger.error(f"Notification dropped, no bot {bot_key} for chat {chat_id}")
+            await self._delete(pool, [r['id'] for r in rows])
+            return
+
+        # group_key -> (합친 text, 행 id 목록)
+        groups = OrderedDict()
+        for r in rows:
+            if r['group_key'] in groups:
+                text, ids = groups[r['group_key']]
+                groups[r['group_key']] = (merge_messages(text, r['text']), ids + [r['id']])
+                self.stats['merged'] += 1
+            else:
+                groups[r['group_key']] = (r['text'], [r['id']])
+
+        if len(groups) >= self.digest_threshold:
+            header = f"📦 **{len(groups)} payment notifications**\n\n"
+            messages = _chunk(list(groups.values()), header)
+            self.stats['digests'] += 1
+        else:
+            messages = list(groups.values())
+
+        # 메시지마다 따로 처리해서 한 건의 영구 오류가 나머지를 막거나, 보낸 메시지가 재전송되지 않게 함
+        sent, failed, dropped = [], [], []
+        for text, ids in messages:
+            try:
+                await self._send(bot, chat_id, text)
+                self.stats['sent_messages'] += 1
+                sent.extend(ids)
+            except (BadRequest, Forbidden) as e:
+                self.stats['dropped'] += 1
+                dropped.extend(ids)
+                logger.error(f"Notification to {chat_id} via {bot_key} dropped: {e}\n{text}")
+            except Exception as e:
+                self.stats['failed'] += 1
+                failed.extend(ids)
+                logger.error(f"Notification to {chat_id} via {bot_key} failed: {e}")
+        if sent or dropped:
+            await self._delete(pool, sent + dropped)
+        if failed:
+            async with acquire(pool) as conn:
+                async with conn.transaction():
+                    await conn.execute(_RETRY_SQL, failed, NOTIFY_BACKOFF_BASE, NOTIFY_BACKOFF_MAX)
+                    exhausted = await conn.fetch(_EXHAUSTED_SQL, failed, NOTIFY_MAX_ATTEMPTS)
+            if exhausted:
+                self.stats['dropped'] += len(exhausted)
+                logger.error(f"Notification to {chat_id} via {bot_key}: gave up on {len(exhausted)} after {NOTIFY_MAX_ATTEMPTS} attempts")
+        logger.info(f"Notified {chat_id} via {bot_key}: {len(groups)} subscriptions, "
+                    f"{len(messages)} messages ({len(failed)} rows retrying, {len(dropped)} dropped)")
+
+    async def _send(self, bot, chat_id, text):
+        try:
+            await outbound.send_message(bot, chat_id, text, priority=outbound.PRIORITY_ADMIN, parse_mode='Markdown')
+        except BadRequest as e:
+            # username의 '_' 등으로 Markdown 파싱이 실패하면 서식 없이 한 번 더
+            if "can't parse entities" not in str(e).lower():
+                raise
+            await outbound.send_message(bot, chat_id, text, priority=outbound.PRIORITY_ADMIN)
+
+    async def _delete(self, pool, ids):
+        async with acquire(pool) as conn:
+            await conn.execute('DELETE FROM pending_notifications WHERE id = ANY($1::bigint[])', ids)
+
+    async def recover(self):
+        """재시작 전에 못 보낸 알림(또는 claim이 만료된 알림)의 수신자마다 flush 예약. startup/주기 sweep에서 호출"""
+        async with acquire(await get_pool()) as conn:
+            rows = await conn.fetch('''
+                SELECT DISTINCT bot_key, chat_id FROM pending_notifications
+                WHERE (claimed_until IS NULL OR claimed_until < NOW())
+                  AND (next_attempt_at IS NULL OR next_attempt_at <= NOW())
+            ''')
+        for r in rows:
+            self._schedule((r['bot_key'], r['chat_id']), delay=0)
+        return len(rows)
+
+    async def flush_all(self):
+        for task in list(self._timers.values()):
+            task.cancel()
+        recipients = list(self._timers)
+        self._timers.clear()
+        await asyncio.gather(*(self.flush(recipient) for recipient in recipients))
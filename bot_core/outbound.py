@@ -0,0 +1,246 @@
+# bot_core/outbound.py
+import asyncio
+import datetime
+import itertools
+import logging
+import time
+from telegram.error import RetryAfter, NetworkError, TimedOut, BadRequest, Forbidden
+from bot_core.cache import TTLCache
+from bot_core.metrics import OUTBOUND_WAIT_SECONDS, OUTBOUND_TOTAL
+from bot_core.tracing import span
+from bot_core.ratelimit import TokenBucket
+from config import (
+    OUTBOUND_WORKERS, OUTBOUND_GLOBAL_RATE, OUTBOUND_PER_CHAT_RATE, OUTBOUND_GROUP_RATE,
+    OUTBOUND_MAX_RETRIES, OUTBOUND_QUEUE_SIZE
+)
+
+logger = logging.getLogger(__name__)
+
+# 숫자가 작을수록 먼저 전송: 유저 초대 링크 > 관리자 알림 > 리포트/일괄 작업
+PRIORITY_USER = 0
+PRIORITY_ADMIN = 1
+PRIORITY_BULK = 2
+_PRIORITY_NAMES = {PRIORITY_USER: 'user', PRIORITY_ADMIN: 'admin', PRIORITY_BULK: 'bulk'}
+
+_queue = None
+_workers = []
+_seq = itertools.count()
+_global_bucket = TokenBucket(OUTBOUND_GLOBAL_RATE)
+_chat_buckets = TTLCache(maxsize=10000, ttl=300)
+_depth = {name: 0 for name in _PRIORITY_NAMES.values()}
+_delayed = {}  # 재시도/채팅별 한도 대기 중인 태스크 -> _Request
+_sending = set()  # 워커가 지금 전송 중인 _Request
+_stats = {'calls': 0, 'sent': 0, 'failed': 0, 'retried': 0, 'rate_limited': 0,
+          'wait_ms_total': 0.0, 'wait_ms_max': 0.0, 'send_ms_total': 0.0, 'send_ms_max': 0.0}
+
+
+class OutboundStopped(Exception):
+    """종료 시 아직 전송하지 못한 요청"""
+
+
+class _Request:
+    __slots__ = ('bot', 'method', 'kwargs', 'priority', 'per_chat', 'future', 'enqueued_at', 'attempts', 'seq')
+
+    def __init__(self, bot, method, kwargs, priority, per_chat):
+        self.bot = bot
+        self.method = method
+        self.kwargs = kwargs
+        self.priority = priority
+        self.per_chat = per_chat
+        self.future = asyncio.get_running_loop().create_future()
+        self.enqueued_at = time.monotonic()
+        self.attempts = 0
+        # 다시 큐에 넣어도 처음 순서를 유지 (같은 채팅 메시지 순서 보장)
+        self.seq = next(_seq)
+
+
+def _chat_bucket(chat_id):
+    bucket = _chat_buckets.get(chat_id)
+    if bucket is None:
+        # 음수 chat_id는 그룹/채널
+        rate = OUTBOUND_GROUP_RATE if isinstance(chat_id, int) and chat_id < 0 else OUTBOUND_PER_CHAT_RATE
+        bucket = TokenBucket(rate, capacity=1)
+        _chat_buckets.set(chat_id, bucket)
+    return bucket
+
+
+def _put(request):
+    _queue.put_nowait((request.priority, request.seq, request))
+    _depth[_PRIORITY_NAMES[request.priority]] += 1
+
+
+async def _execute(request):
+    await _global_bucket.acquire()
+
+    started = time.perf_counter()
+    try:
+        return await getattr(request.bot, request.method)(**request.kwargs)
+    finally:
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        _stats['calls'] += 1
+        _stats['send_ms_total'] += elapsed_ms
+        _stats['send_ms_max'] = max(_stats['send_ms_max'], elapsed_ms)
+
+
+async def _retry_later(request, delay):
+    await asyncio.sleep(delay)
+    if request.future.done():
+        return
+    try:
+        _put(request)
+    except asyncio.QueueFull as e:
+        _fail(request, e)
+
+
+def _delay(request, delay):
+    """대기 중에도 워커가 다른 요청을 처리하도록 재등록은 별도 태스크에서"""
+    task = asyncio.create_task(_retry_later(request, delay))
+    _delayed[task] = request
+    task.add_done_callback(lambda t: _delayed.pop(t, None))
+
+
+async def _worker_loop():
+    while True:
+        _, _, request = await _queue.get()
+        _depth[_PRIORITY_NAMES[request.priority]] -= 1
+        if request.future.cancelled():
+            continue
+        # 채팅별 한도가 찬 요청은 워커를 붙잡지 않고 토큰이 찰 때쯤 다시 큐에 넣음
+        # (한 채팅으로 몰린 전송이 워커를 전부 차지해 유저 초대 링크가 막히지 않도록)
+        chat_id = request.kwargs.get('chat_id')
+        if request.per_chat and chat_id is not None:
+            wait = _chat_bucket(chat_id).try_acquire()
+            if wait > 0:
+                _delay(request, wait)
+                continue
+        if request.attempts == 0:
+            wait_ms = (time.monotonic() - request.enqueued_at) * 1000
+            _stats['wait_ms_total'] += wait_ms
+            _stats['wait_ms_max'] = max(_stats['wait_ms_max'], wait_ms)
+            OUTBOUND_WAIT_SECONDS.observe(wait_ms / 1000, _PRIORITY_NAMES[request.priority])
+        request.attempts += 1
+        _sending.add(request)
+        try:
+            result = await _execute(request)
+            _stats['sent'] += 1
+            OUTBOUND_TOTAL.inc(request.method, 'sent')
+            if not request.future.done():
+                request.future.set_result(result)
+        except asyncio.CancelledError:
+            # 종료 중 전송하다 취소된 요청도 호출 측이 기다리지 않도록 실패 처리
+            _stopped(request)
+            raise
+        except (BadRequest, Forbidden) as e:
+            # PTB에서는 NetworkError의 하위 클래스지만 재시도해도 결과가 같은 영구 오류 (chat not found, blocked 등)
+            _fail(request, e)
+        except (RetryAfter, TimedOut, NetworkError) as e:
+            if request.attempts > OUTBOUND_MAX_RETRIES:
+                _fail(request, e)
+                continue
+            if isinstance(e, RetryAfter):
+                _stats['rate_limited'] += 1
+                delay = e.retry_after.total_seconds() if isinstance(e.retry_after, datetime.timedelta) else float(e.retry_after)
+            else:
+                delay = min(2 ** request.attempts, 30)
+            _stats['retried'] += 1
+            OUTBOUND_TOTAL.inc(request.method, 'retried')
+            logger.warning(f"Telegram {request.method} to {request.kwargs.get('chat_id')} retry in {delay:.0f}s: {e}")
+            _delay(request, delay)
+        except Exception as e:
+            _fail(request, e)
+        finally:
+            _sending.discard(request)
+
+
+def _stopped(request):
+    if not request.future.done():
+        request.future.set_exception(OutboundStopped(f"{request.method} not sent before shutdown"))
+
+
+def _cancel_delayed():
+    for task, request in list(_delayed.items()):
+        task.cancel()
+        _stopped(request)
+
+
+def _fail(request, error):
+    _stats['failed'] += 1
+    OUTBOUND_TOTAL.inc(request.method, 'failed')
+    logger.error(f"Telegram {request.method} to {request.kwargs.get('chat_id')} failed after {request.attempts} attempts: {error}")
+    if not request.future.done():
+        request.future.set_exception(error)
+
+
+def set_global_rate(rate):
+    global _global_bucket
+    _global_bucket = TokenBucket(rate)
+
+
+def start(workers=OUTBOUND_WORKERS):
+    global _queue
+    if _workers:
+        return
+    if _queue is None:
+        _queue = asyncio.PriorityQueue(maxsize=OUTBOUND_QUEUE_SIZE)
+    for i in range(workers):
+        _workers.append(asyncio.create_task(_worker_loop(), name=f"outbound-{i}"))
+
+
+async def stop(drain_timeout=10):
+    # 대기 중인 재시도는 취소하되, 결과를 기다리는 호출 측이 멈추지 않도록 future를 실패 처리
+    _cancel_delayed()
+    if _queue is not None and _workers:
+        try:
+            await asyncio.wait_for(_drain(), timeout=drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Outbound queue not drained on shutdown ({_queue.qsize()} left)")
+    for task in _workers:
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+    # drain 중에 새로 생긴 지연 요청(채팅별 한도/재시도)과 drain 시간 안에 못 보낸 요청도 실패 처리
+    _cancel_delayed()
+    while _queue is not None and not _queue.empty():
+        _, _, request = _queue.get_nowait()
+        _depth[_PRIORITY_NAMES[request.priority]] -= 1
+        _stopped(request)
+
+
+async def _drain():
+    # 큐가 비고 워커가 전송 중인 요청까지 끝나야 완료
+    while _queue.qsize() or _sending:
+        await asyncio.sleep(0.1)
+
+
+def enqueue(bot, method, priority=PRIORITY_ADMIN, per_chat=True, **kwargs):
+    """전송을 큐에 넣고 결과 future를 반환 (기다리지 않아도 됨)"""
+    start()
+    request = _Request(bot, method, kwargs, priority, per_chat)
+    _put(request)
+    return request.future
+
+
+async def send(bot, method, priority=PRIORITY_ADMIN, per_chat=True, **kwargs):
+    """큐를 거쳐 Bot API를 호출하고 결과를 기다림. 재시도 후에도 실패하면 예외"""
+    # 실제 호출은 워커 태스크에서 일어나므로 호출 측 trace에는 큐 대기+전송 전체를 한 span으로 남김
+    async with span(f"outbound.{method}"):
+        return await enqueue(bot, method, priority=priority, per_chat=per_chat, **kwargs)
+
+
+async def send_message(bot, chat_id, text, priority=PRIORITY_ADMIN, **kwargs):
+    return await send(bot, 'send_message', priority=priority, chat_id=chat_id, text=text, **kwargs)
+
+
+def outbound_stats():
+    sent_or_failed = _stats['sent'] + _stats['failed']
+    return {
+        'queue_depth': dict(_depth),
+        'sent': _stats['sent'],
+        'failed': _stats['failed'],
+        'retried': _stats['retried'],
+        'rate_limited': _stats['rate_limited'],
+        'avg_wait_ms': round(_stats['wait_ms_total'] / sent_or_failed, 1) if sent_or_failed else 0.0,
+        'max_wait_ms': round(_stats['wait_ms_max'], 1),
+        'avg_send_ms': round(_stats['send_ms_total'] / _stats['calls'], 1) if _stats['calls'] else 0.0,
+        'max_send_ms': round(_stats['send_ms_max'], 1),
+    }
@@ -0,0 +1,137 @@
+# bot_core/profiler.py
+"""운영 중인 event loop를 대상으로 하는 샘플링 프로파일러 (/profile 명령)
+
+별도 스레드가 interval마다 sys._current_frames()로 loop 스레드의 스택을 읽어 집계하므로
+loop 쪽에는 계측 코드가 들어가지 않음. 결과는 collapsed stack 형식("a;b;c 개수" 한 줄씩)이라
+flamegraph.pl / speedscope / inferno에 그대로 넣으면 flamegraph가 됨.
+동시에 loop.call_later 콜백이 예정 시각보다 얼마나 늦게 실행되는지(event loop lag)를 측정
+"""
+import asyncio
+import collections
+import os
+import sys
+import threading
+from config import PROFILER_INTERVAL, PROFILER_LAG_INTERVAL, PROFILER_MAX_SECONDS
+
+# loop가 할 일이 없어 selector에서 대기 중인 샘플 (busy 비율 계산에서 제외)
+_IDLE_LEAVES = {('selectors.py', 'select'), ('selectors.py', 'poll'), ('selectors.py', '_select')}
+
+_running = threading.Lock()
+
+
+class ProfilerBusy(Exception):
+    """이미 다른 프로파일링이 진행 중"""
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+def _collapse(frame):
+    labels = []
+    leaf = (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name)
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    return ';'.join(labels), leaf
+
+
+class _Sampler(threading.Thread):
+    def __init__(self, thread_id, interval):
+        super().__init__(name="profiler-sampler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self.idle = 0
+        self._halt = threading.Event()
+
+    def run(self):
+        interval = self.interval
+        while not self._halt.wait(interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack, leaf = _collapse(frame)
+            del frame
+            self.stacks[stack] += 1
+            self.samples += 1
+            if leaf in _IDLE_LEAVES:
+                self.idle += 1
+
+    def stop(self):
+        self._halt.set()
+        self.join()
+
+
+async def _measure_lag(loop, interval, deadline):
+    """call_later(interval) 콜백의 실제 실행 시각 - 예정 시각 (ms)"""
+    lags = []
+    while loop.time() < deadline:
+        fired = loop.create_future()
+        expected = loop.time() + interval
+        loop.call_later(interval, lambda f=fired: f.done() or f.set_result(loop.time()))
+        actual = await fired
+        lags.append(max(0.0, (actual - expected) * 1000))
+    return lags
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class ProfileResult:
+    def __init__(self, seconds, interval, stacks, samples, idle, lags):
+        self.seconds = seconds
+        self.interval = interval
+        self.stacks = stacks
+        self.samples = samples
+        self.idle = idle
+        self.lags = lags
+
+    @property
+    def busy_ratio(self):
+        return (self.samples - self.idle) / self.samples if self.samples else 0.0
+
+    def lag_stats(self):
+        return {
+            'checks': len(self.lags),
+            'p50_ms': round(_percentile(self.lags, 50), 1),
+            'p99_ms': round(_percentile(self.lags, 99), 1),
+            'max_ms': round(max(self.lags), 1) if self.lags else 0.0,
+        }
+
+    def top_frames(self, limit=10):
+        """leaf 기준 self 샘플 상위 (idle 대기 제외)"""
+        leaves = collections.Counter()
+        for stack, count in self.stacks.items():
+            leaf = stack.rsplit(';', 1)[-1]
+            if tuple(leaf.split(':', 1)) not in _IDLE_LEAVES:
+                leaves[leaf] += count
+        return leaves.most_common(limit)
+
+    def collapsed(self):
+        return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+async def profile(seconds, interval=PROFILER_INTERVAL, lag_interval=PROFILER_LAG_INTERVAL):
+    """현재 event loop 스레드를 seconds초 동안 샘플링. 동시에 하나만 실행 가능 (아니면 ProfilerBusy)"""
+    seconds = max(1.0, min(float(seconds), PROFILER_MAX_SECONDS))
+    if not _running.acquire(blocking=False):
+        raise ProfilerBusy()
+    try:
+        loop = asyncio.get_running_loop()
+        sampler = _Sampler(threading.get_ident(), interval)
+        sampler.start()
+        try:
+            lags = await _measure_lag(loop, lag_interval, loop.time() + seconds)
+        finally:
+            sampler.stop()
+        return ProfileResult(seconds, interval, sampler.stacks, sampler.samples, sampler.idle, lags)
+    finally:
+        _running.release()
@@ -0,0 +1,39 @@
+# bot_core/ratelimit.py
+import asyncio
+import time
+
+
+class TokenBucket:
+    """초당 rate개, 최대 capacity개까지 모아 쓰는 토큰 버킷. 대기자는 도착 순서대로 통과"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, tokens=1):
+        self._refill()
+        return 0.0 if self._tokens >= tokens else (tokens - self._tokens) / self.rate
+
+    def try_acquire(self, tokens=1):
+        """토큰이 있으면 바로 소비하고 0, 없으면 기다려야 하는 시간(초)을 반환 (대기하지 않음)"""
+        delay = self.wait_time(tokens)
+        if delay <= 0:
+            self._tokens -= tokens
+        return delay
+
+    async def acquire(self, tokens=1):
+        async with self._lock:
+            while True:
+                delay = self.wait_time(tokens)
+                if delay <= 0:
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep(delay)
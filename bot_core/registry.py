@@ -0,0 +1,239 @@
+# bot_core/registry.py
+import asyncio
+import json
+import logging
+import os
+import time
+from telegram import Bot
+from telegram.ext import Application
+from telegram.request import HTTPXRequest
+from bot_core.base_bot import BaseBot
+from bot_core.metrics import TELEGRAM_API_SECONDS, TELEGRAM_API_TOTAL
+from bot_core.tracing import span
+from bot_core.updates import OrderedUpdateProcessor
+from config import (
+    BOT_REGISTRY_FILE, BOT_HTTP_POOL_SIZE, PLAN_PRICES, UPDATE_QUEUE_SIZE, UPDATE_CONCURRENCY,
+    LETMEBOT_TOKEN, LETMEBOT_PRICE_WEEKLY, LETMEBOT_PRICE_MONTHLY, LETMEBOT_PRICE_LIFETIME,
+    LETMEBOT_PORTAL_RETURN_URL, PAYPAL_LETME_WEEKLY, PAYPAL_LETME_MONTHLY, PAYPAL_LETME_LIFETIME,
+    MOREVIDS_TOKEN, MOREVIDS_PRICE_WEEKLY, MOREVIDS_PRICE_MONTHLY, MOREVIDS_PRICE_LIFETIME,
+    MOREVIDS_PORTAL_RETURN_URL, PAYPAL_MOREVIDS_WEEKLY, PAYPAL_MOREVIDS_MONTHLY, PAYPAL_MOREVIDS_LIFETIME,
+    WELCOME_VIDEO_MOREVIDS,
+    ONLYTRNS_TOKEN, ONLYTRNS_PRICE_LIFETIME, ONLYTRNS_PORTAL_RETURN_URL, PAYPAL_ONLYTRNS, WELCOME_VIDEO_ONLYTRNS,
+    TSWRLDBOT_TOKEN, TSWRLDBOT_PRICE_LIFETIME, TSWRLDBOT_PORTAL_RETURN_URL, PAYPAL_TSWRLD, WELCOME_VIDEO_TSWRLD,
+    TSWRLDBOT_PROMOTER_ID,
+    LUST4TRANS_TOKEN, LUST4TRANS_PRICE_WEEKLY, LUST4TRANS_PRICE_MONTHLY, LUST4TRANS_PRICE_LIFETIME,
+    LUST4TRANS_PORTAL_RETURN_URL, PAYPAL_LUST4TRANS_WEEKLY, PAYPAL_LUST4TRANS_MONTHLY, PAYPAL_LUST4TRANS_LIFETIME,
+    WELCOME_VIDEO_LUST4TRANS, LUST4TRANS_PROMOTER_ID
+)
+
+logger = logging.getLogger(__name__)
+
+# key -> BaseBot 생성 인자. BOT_REGISTRY_FILE이 없을 때 쓰는 기본 구성
+DEFAULT_BOT_SPECS = {
+    'letmebot': {
+        'token': LETMEBOT_TOKEN,
+        'price_weekly': LETMEBOT_PRICE_WEEKLY,
+        'price_monthly': LETMEBOT_PRICE_MONTHLY,
+        'price_lifetime': LETMEBOT_PRICE_LIFETIME,
+        'paypal_weekly': PAYPAL_LETME_WEEKLY,
+        'paypal_monthly': PAYPAL_LETME_MONTHLY,
+        'paypal_lifetime': PAYPAL_LETME_LIFETIME,
+        'has_weekly': True,
+        'has_monthly': True,
+        'has_lifetime': True,
+        'portal_return_url': LETMEBOT_PORTAL_RETURN_URL,
+    },
+    'morevids': {
+        'token': MOREVIDS_TOKEN,
+        'price_weekly': MOREVIDS_PRICE_WEEKLY,
+        'price_monthly': MOREVIDS_PRICE_MONTHLY,
+        'price_lifetime': MOREVIDS_PRICE_LIFETIME,
+        'welcome_video': WELCOME_VIDEO_MOREVIDS,
+        'paypal_weekly': PAYPAL_MOREVIDS_WEEKLY,
+        'paypal_monthly': PAYPAL_MOREVIDS_MONTHLY,
+        'paypal_lifetime': PAYPAL_MOREVIDS_LIFETIME,
+        'has_weekly': True,
+        'has_monthly': True,
+        'has_lifetime': True,
+        'portal_return_url': MOREVIDS_PORTAL_RETURN_URL,
+    },
+    'onlytrns': {
+        'token': ONLYTRNS_TOKEN,
+        'price_lifetime': ONLYTRNS_PRICE_LIFETIME,
+        'welcome_video': WELCOME_VIDEO_ONLYTRNS,
+        'paypal_lifetime': PAYPAL_ONLYTRNS,
+        'has_monthly': False,
+        'has_lifetime': True,
+        'portal_return_url': ONLYTRNS_PORTAL_RETURN_URL,
+    },
+    'tswrld': {
+        'token': TSWRLDBOT_TOKEN,
+        'price_lifetime': TSWRLDBOT_PRICE_LIFETIME,
+        'welcome_video': WELCOME_VIDEO_TSWRLD,
+        'paypal_lifetime': PAYPAL_TSWRLD,
+        'has_monthly': False,
+        'has_lifetime': True,
+        'portal_return_url': TSWRLDBOT_PORTAL_RETURN_URL,
+        'promoter_id': TSWRLDBOT_PROMOTER_ID,
+    },
+    'lust4trans': {
+        'token': LUST4TRANS_TOKEN,
+        'price_weekly': LUST4TRANS_PRICE_WEEKLY,
+        'price_monthly': LUST4TRANS_PRICE_MONTHLY,
+        'price_lifetime': LUST4TRANS_PRICE_LIFETIME,
+        'welcome_video': WELCOME_VIDEO_LUST4TRANS,
+        'paypal_weekly': PAYPAL_LUST4TRANS_WEEKLY,
+        'paypal_monthly': PAYPAL_LUST4TRANS_MONTHLY,
+        'paypal_lifetime': PAYPAL_LUST4TRANS_LIFETIME,
+        'has_weekly': True,
+        'has_monthly': True,
+        'has_lifetime': True,
+        'portal_return_url': LUST4TRANS_PORTAL_RETURN_URL,
+        'promoter_id': LUST4TRANS_PROMOTER_ID,
+    },
+}
+
+def _resolve_spec(key, spec):
+    """'xxx_env' 필드는 환경변수 값으로 치환 (토큰 등 비밀값을 파일에 두지 않기 위함)"""
+    resolved = {}
+    for field, value in spec.items():
+        if field.endswith('_env'):
+            resolved[field[:-len('_env')]] = os.getenv(value)
+        else:
+            resolved[field] = value
+    resolved['bot_name'] = key
+    resolved.setdefault('plan_prices', PLAN_PRICES.get(key))
+    if resolved.get('promoter_id'):
+        resolved['promoter_id'] = int(resolved['promoter_id'])
+    return resolved
+
+def load_bot_specs(path=BOT_REGISTRY_FILE):
+    """BOT_REGISTRY_FILE 예시:
+    {"letmebot": {"token_env": "LETMEBOT_TOKEN", "price_monthly_env": "LETMEBOT_PRICE_MONTHLY",
+                  "has_monthly": true, "plan_prices": {"monthly": "$20"}, "promoter_id": 123}}
+    """
+    if path:
+        with open(path) as f:
+            raw = json.load(f)
+    else:
+        raw = DEFAULT_BOT_SPECS
+
+    specs = {}
+    for key, spec in raw.items():
+        spec = _resolve_spec(key, spec)
+        if not spec.get('token'):
+            logger.warning(f"Bot {key} has no token configured, skipping")
+            continue
+        specs[key] = spec
+    return specs
+
+
+class SharedHTTPXRequest(HTTPXRequest):
+    """모든 Bot이 공유하는 커넥션 풀. 개별 Bot/Application shutdown에서는 닫지 않고 close()로만 닫음"""
+
+    async def shutdown(self):
+        pass
+
+    async def close(self):
+        await super().shutdown()
+
+    async def do_request(self, url, method, *args, **kwargs):
+        # 모든 Bot API 호출(핸들러의 reply, outbound 큐 전송 모두)이 여기를 지나므로 API 메서드별로 측정
+        api_method = url.rsplit('/', 1)[-1]
+        started = time.perf_counter()
+        outcome = 'error'
+        try:
+            async with span(f"telegram.{api_method}"):
+                code, payload = await super().do_request(url, method, *args, **kwargs)
+            outcome = str(code)
+            return code, payload
+        finally:
+            TELEGRAM_API_SECONDS.observe(time.perf_counter() - started, api_method)
+            TELEGRAM_API_TOTAL.inc(api_method, outcome)
+
+
+class BotRegistry:
+    """봇 구성(spec)으로 Bot/BaseBot을 만들고, Application은 첫 webhook 요청 때 초기화"""
+
+    def __init__(self, specs, configure, pool_size=BOT_HTTP_POOL_SIZE):
+        self.specs = specs
+        self._configure = configure
+        self._request = SharedHTTPXRequest(connection_pool_size=pool_size)
+        self.instances = {}
+        self.bots = {}
+        self.applications = {}
+        self.init_timings = {}
+        self._locks = {}
+        for key, spec in specs.items():
+            self.instances[key] = BaseBot(**spec)
+            # webhook만 쓰므로 get_updates용 요청 객체도 공유 풀로 대체
+            self.bots[key] = Bot(spec['token'], request=self._request, get_updates_request=self._request)
+
+    def __contains__(self, key):
+        return key in self.bots
+
+    def keys(self):
+        return list(self.bots.keys())
+
+    def get_bot(self, key):
+        return self.bots.get(key)
+
+    def spec(self, key):
+        return self.specs.get(key, {})
+
+    async def initialize(self):
+        await self._request.initialize()
+
+    async def get_application(self, key):
+        telegram_app = self.applications.get(key)
+        if telegram_app is not None:
+            return telegram_app
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            telegram_app = self.applications.get(key)
+            if telegram_app is None:
+                telegram_app = await self._build_application(key)
+                self.applications[key] = telegram_app
+        return telegram_app
+
+    async def _build_application(self, key):
+        started = time.perf_counter()
+        # 주기 작업은 bot_core.scheduler가 담당하므로 봇별 JobQueue는 만들지 않음
+        # webhook은 update_queue에 넣기만 하고, 처리는 유저별 순서를 지키며 동시에 진행
+        telegram_app = (
+            Application.builder()
+            .bot(self.bots[key])
+            .updater(None)
+            .job_queue(None)
+            .update_queue(asyncio.Queue(maxsize=UPDATE_QUEUE_SIZE))
+            .concurrent_updates(OrderedUpdateProcessor(UPDATE_CONCURRENCY, bot_key=key))
+            .build()
+        )
+        self._configure(key, telegram_app, self.instances[key])
+        await telegram_app.initialize()
+        await telegram_app.start()
+        elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+        self.init_timings[key] = elapsed_ms
+        logger.info(f"{key} application initialized in {elapsed_ms}ms")
+        return telegram_app
+
+    async def stop_applications(self):
+        """새 update 처리를 멈추고 update_queue에 이미 들어온 것은 마저 처리"""
+        for key, telegram_app in self.applications.items():
+            if not telegram_app.running:
+                continue
+            try:
+                await telegram_app.stop()
+            except Exception as e:
+                logger.error(f"Stop failed for {key}: {e}")
+
+    async def shutdown(self):
+        for key, telegram_app in self.applications.items():
+            try:
+                if telegram_app.running:
+                    await telegram_app.stop()
+                await telegram_app.shutdown()
+            except Exception as e:
+                logger.error(f"Shutdown failed for {key}: {e}")
+        self.applications.clear()
+        await self._request.close()
@@ -0,0 +1,151 @@
+# bot_core/scheduler.py
+import asyncio
+import datetime
+import logging
+import os
+import socket
+import time
+from bot_core.db import get_pool, acquire
+from config import SCHEDULER_LEASE_SECONDS, SCHEDULER_MISFIRE_GRACE
+
+logger = logging.getLogger(__name__)
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+
+class Job:
+    """interval(초) 또는 daily_at(UTC datetime.time) 중 하나로 실행 시각(slot)을 정함"""
+
+    def __init__(self, name, func, interval=None, daily_at=None, lease=SCHEDULER_LEASE_SECONDS):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.daily_at = daily_at
+        self.lease = lease
+
+    def latest_slot(self, now):
+        if self.interval:
+            elapsed = (now - _EPOCH).total_seconds()
+            return _EPOCH + datetime.timedelta(seconds=elapsed // self.interval * self.interval)
+        slot = datetime.datetime.combine(now.date(), self.daily_at)
+        return slot if slot <= now else slot - datetime.timedelta(days=1)
+
+    def next_slot(self, now):
+        if self.interval:
+            return self.latest_slot(now) + datetime.timedelta(seconds=self.interval)
+        return self.latest_slot(now) + datetime.timedelta(days=1)
+
+
+class Scheduler:
+    """job_runs 테이블의 slot/lease로 replica가 여러 개여도 slot당 한 번만 실행"""
+
+    def __init__(self):
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self.jobs = {}
+        self._tasks = []
+
+    def add_interval(self, name, func, seconds):
+        self.jobs[name] = Job(name, func, interval=seconds)
+
+    def add_daily(self, name, func, hour, minute=0):
+        self.jobs[name] = Job(name, func, daily_at=datetime.time(hour=hour, minute=minute))
+
+    async def _claim(self, pool, job, slot):
+        async with acquire(pool) as conn:
+            await conn.execute(
+                'INSERT INTO job_runs (job_name) VALUES ($1) ON CONFLICT (job_name) DO NOTHING',
+                job.name
+            )
+            return await conn.fetchval('''
+                UPDATE job_runs
+                SET last_slot = $2,
+                    lease_owner = $3,
+                    lease_until = NOW() + $4 * INTERVAL '1 second',
+                    last_started_at = NOW()
+                WHERE job_name = $1
+                  AND (last_slot IS NULL OR last_slot < $2)
+                  AND (lease_until IS NULL OR lease_until < NOW())
+                RETURNING TRUE
+            ''', job.name, slot, self.owner, job.lease)
+
+    async def _renew_lease(self, pool, job):
+        """실행이 lease보다 길어져도 다른 replica가 다음 slot을 겹쳐 실행하지 않도록 lease의 1/3마다 연장"""
+        while True:
+            await asyncio.sleep(max(job.lease / 3, 1))
+            try:
+                async with acquire(pool) as conn:
+                    await conn.execute('''
+                        UPDATE job_runs SET lease_until = NOW() + $3 * INTERVAL '1 second'
+                        WHERE job_name = $1 AND lease_owner = $2
+                    ''', job.name, self.owner, job.lease)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Scheduled job {job.name} lease renewal failed: {e}")
+
+    async def _finish(self, pool, job, duration_ms, error):
+        async with acquire(pool) as conn:
+            await conn.execute('''
+                UPDATE job_runs
+                SET lease_until = NULL,
+                    last_duration_ms = $2,
+                    last_error = $3,
+                    last_success_at = CASE WHEN $3::text IS NULL THEN NOW() ELSE last_success_at END,
+                    run_count = run_count + 1,
+                    failure_count = failure_count + CASE WHEN $3::text IS NULL THEN 0 ELSE 1 END
+                WHERE job_name = $1
+            ''', job.name, duration_ms, error)
+
+    async def run_slot(self, job, slot):
+        pool = await get_pool()
+        if not await self._claim(pool, job, slot):
+            return False
+        started = time.perf_counter()
+        error = None
+        heartbeat = asyncio.create_task(self._renew_lease(pool, job), name=f"job-{job.name}-lease")
+        try:
+            await job.func()
+        except Exception as e:
+            error = repr(e)[:1000]
+            logger.error(f"Scheduled job {job.name} failed: {e}")
+        finally:
+            heartbeat.cancel()
+        duration_ms = (time.perf_counter() - started) * 1000
+        await self._finish(pool, job, duration_ms, error)
+        logger.info(f"Scheduled job {job.name} slot {slot:%Y-%m-%d %H:%M:%S} finished in {duration_ms:.0f}ms")
+        return True
+
+    async def _loop(self, job):
+        while True:
+            now = datetime.datetime.utcnow()
+            slot = job.latest_slot(now)
+            # 재시작 등으로 놓친 slot은 grace 안이면 늦게라도 실행
+            if (now - slot).total_seconds() <= SCHEDULER_MISFIRE_GRACE:
+                try:
+                    await self.run_slot(job, slot)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Scheduler could not run {job.name}: {e}")
+            delay = (job.next_slot(datetime.datetime.utcnow()) - datetime.datetime.utcnow()).total_seconds()
+            await asyncio.sleep(max(delay, 1))
+
+    def start(self):
+        for job in self.jobs.values():
+            self._tasks.append(asyncio.create_task(self._loop(job), name=f"job-{job.name}"))
+        logger.info(f"Scheduler started ({self.owner}): {list(self.jobs)}")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+async def job_status(pool):
+    async with acquire(pool) as conn:
+        rows = await conn.fetch('''
+            SELECT job_name, last_slot, lease_owner, lease_until, last_started_at, last_success_at,
+                   last_duration_ms, last_error, run_count, failure_count
+            FROM job_runs ORDER BY job_name
+        ''')
+    return [dict(r) for r in rows]
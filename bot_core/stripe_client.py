@@ -0,0 +1,105 @@
+# bot_core/stripe_client.py
+import asyncio
+import functools
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+import stripe
+from bot_core.cache import TTLCache
+from bot_core.metrics import STRIPE_API_SECONDS, STRIPE_API_TOTAL
+from bot_core.tracing import span
+from config import (
+    STRIPE_SECRET_KEY, STRIPE_MAX_WORKERS, STRIPE_HTTP_TIMEOUT,
+    STRIPE_CALL_TIMEOUT, STRIPE_MAX_NETWORK_RETRIES,
+    CHECKOUT_SESSION_TTL, CHECKOUT_SESSION_CACHE_SIZE
+)
+
+logger = logging.getLogger(__name__)
+
+stripe.api_key = STRIPE_SECRET_KEY
+stripe.max_network_retries = STRIPE_MAX_NETWORK_RETRIES
+# requests 기반 클라이언트는 스레드마다 keep-alive 세션을 재사용함
+stripe.default_http_client = stripe.RequestsClient(timeout=STRIPE_HTTP_TIMEOUT)
+
+# 동기 Stripe SDK 호출은 전부 이 executor에서 실행 (이벤트 루프 블로킹 방지)
+_executor = ThreadPoolExecutor(max_workers=STRIPE_MAX_WORKERS, thread_name_prefix="stripe")
+
+_stats = {}
+
+def _record(name, elapsed_ms, ok):
+    stat = _stats.get(name)
+    if stat is None:
+        stat = _stats[name] = {'calls': 0, 'errors': 0, 'total_ms': 0.0, 'max_ms': 0.0}
+    stat['calls'] += 1
+    stat['total_ms'] += elapsed_ms
+    stat['max_ms'] = max(stat['max_ms'], elapsed_ms)
+    if not ok:
+        stat['errors'] += 1
+    STRIPE_API_SECONDS.observe(elapsed_ms / 1000, name)
+    STRIPE_API_TOTAL.inc(name, 'ok' if ok else 'error')
+
+def stripe_stats():
+    return {
+        name: {**stat, 'avg_ms': round(stat['total_ms'] / stat['calls'], 1) if stat['calls'] else 0.0}
+        for name, stat in _stats.items()
+    }
+
+async def call(name, fn, *args, timeout=STRIPE_CALL_TIMEOUT, **kwargs):
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    ok = False
+    try:
+        async with span(f"stripe.{name}"):
+            result = await asyncio.wait_for(
+                loop.run_in_executor(_executor, functools.partial(fn, *args, **kwargs)),
+                timeout=timeout
+            )
+        ok = True
+        return result
+    finally:
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        _record(name, elapsed_ms, ok)
+        if not ok:
+            logger.warning(f"Stripe call {name} failed after {elapsed_ms:.0f}ms")
+
+async def create_checkout_session(**params):
+    return await call('checkout.Session.create', stripe.checkout.Session.create, **params)
+
+# (user_id, bot_name, plan) -> 아직 열려 있는 checkout session URL
+# 만료 직전 URL을 내주지 않도록 Stripe expires_at보다 1분 먼저 캐시에서 빠짐
+_checkout_sessions = TTLCache(maxsize=CHECKOUT_SESSION_CACHE_SIZE, ttl=max(CHECKOUT_SESSION_TTL - 60, 0))
+
+async def get_or_create_checkout_session(user_id, bot_name, plan, **params):
+    """같은 유저/봇/플랜의 미완료 세션이 있으면 그 URL을 재사용"""
+    key = (user_id, bot_name, plan)
+    url = _checkout_sessions.get(key)
+    if url:
+        return url
+    session = await create_checkout_session(
+        expires_at=int(time.time()) + CHECKOUT_SESSION_TTL,
+        **params
+    )
+    _checkout_sessions.set(key, session.url)
+    return session.url
+
+def invalidate_checkout_session(user_id, bot_name, plan=None):
+    if plan is None:
+        return _checkout_sessions.pop_where(lambda key: key[0] == user_id and key[1] == bot_name)
+    return 1 if _checkout_sessions.pop((user_id, bot_name, plan)) else 0
+
+async def iter_payment_intents(timeout=STRIPE_CALL_TIMEOUT, **params):
+    """PaymentIntent.list 페이지를 하나씩 executor에서 가져오는 async generator"""
+    params.setdefault('limit', 100)
+    while True:
+        page = await call('PaymentIntent.list', stripe.PaymentIntent.list, timeout=timeout, **params)
+        for pi in page.data:
+            yield pi
+        if not page.has_more or not page.data:
+            break
+        params['starting_after'] = page.data[-1].id
+
+async def retrieve_subscription(subscription_id, timeout=STRIPE_CALL_TIMEOUT):
+    return await call('Subscription.retrieve', stripe.Subscription.retrieve, subscription_id, timeout=timeout)
+
+def shutdown():
+    _executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,213 @@
+# bot_core/stripe_inbox.py
+import asyncio
+import json
+import logging
+import time
+import zlib
+from bot_core.cache import TTLCache
+from bot_core.db import get_pool, acquire
+from bot_core.metrics import STRIPE_EVENT_SECONDS, STRIPE_EVENTS_TOTAL
+from bot_core.tracing import start_trace
+from config import (
+    STRIPE_WORKER_CONCURRENCY, STRIPE_WORKER_POLL_INTERVAL, STRIPE_WORKER_MAX_ATTEMPTS,
+    STRIPE_WORKER_BACKOFF_BASE, STRIPE_WORKER_BACKOFF_MAX, STRIPE_WORKER_LOCK_TIMEOUT,
+    STRIPE_EVENT_CACHE_SIZE, STRIPE_EVENT_CACHE_TTL, STRIPE_EVENT_RETENTION_DAYS
+)
+
+logger = logging.getLogger(__name__)
+
+# 상태: pending -> processing -> done / (재시도 시 pending) / dead
+# stripe_events의 PK(event id)가 곧 idempotency key. done 행은 보존 기간 동안 남겨 재전송을 걸러냄
+_wakeup = None
+_workers = []
+
+# 같은 프로세스로 재전송된 이벤트는 DB 조회 없이 바로 스킵
+_recent_event_ids = TTLCache(maxsize=STRIPE_EVENT_CACHE_SIZE, ttl=STRIPE_EVENT_CACHE_TTL)
+
+def _get_wakeup():
+    global _wakeup
+    if _wakeup is None:
+        _wakeup = asyncio.Event()
+    return _wakeup
+
+async def store_event(pool, event_id, event_type, payload):
+    """검증된 이벤트를 inbox에 저장. 이미 받은 이벤트면 False"""
+    if event_id in _recent_event_ids:
+        return False
+    async with acquire(pool) as conn:
+        async with conn.transaction():
+            inserted = await conn.fetchval('''
+                INSERT INTO stripe_events (id, type, payload)
+                VALUES ($1, $2, $3::jsonb)
+                ON CONFLICT (id) DO NOTHING
+                RETURNING TRUE
+            ''', event_id, event_type, payload)
+            if inserted:
+                # inbox는 보존 기간 후 지워지므로 리플레이/재현용 원본은 압축해서 따로 영구 보관
+                await conn.execute('''
+                    INSERT INTO stripe_event_store (id, type, payload, encoding)
+                    VALUES ($1, $2, $3, 'zlib')
+                    ON CONFLICT (id) DO NOTHING
+                ''', event_id, event_type, zlib.compress(payload.encode('utf-8')))
+    _recent_event_ids.set(event_id, True)
+    if inserted:
+        _get_wakeup().set()
+    return bool(inserted)
+
+async def _claim_event(pool):
+    async with acquire(pool) as conn:
+        return await conn.fetchrow('''
+            UPDATE stripe_events
+            SET status = 'processing',
+                attempts = attempts + 1,
+                locked_until = NOW() + $1 * INTERVAL '1 second'
+            WHERE id = (
+                SELECT id FROM stripe_events
+                WHERE (status = 'pending' AND next_attempt_at <= NOW())
+                   OR (status = 'processing' AND locked_until < NOW())
+                ORDER BY next_attempt_at
+                FOR UPDATE SKIP LOCKED
+                LIMIT 1
+            )
+            RETURNING id, type, payload, attempts
+        ''', STRIPE_WORKER_LOCK_TIMEOUT)
+
+async def _mark_done(pool, event_id):
+    async with acquire(pool) as conn:
+        await conn.execute('''
+            UPDATE stripe_events
+            SET status = 'done', processed_at = NOW(), locked_until = NULL, last_error = NULL
+            WHERE id = $1
+        ''', event_id)
+
+async def _mark_failed(pool, event_id, attempts, error):
+    if attempts >= STRIPE_WORKER_MAX_ATTEMPTS:
+        status, delay = 'dead', 0
+    else:
+        status = 'pending'
+        delay = min(STRIPE_WORKER_BACKOFF_BASE * (2 ** (attempts - 1)), STRIPE_WORKER_BACKOFF_MAX)
+    async with acquire(pool) as conn:
+        await conn.execute('''
+            UPDATE stripe_events
+            SET status = $2,
+                next_attempt_at = NOW() + $3 * INTERVAL '1 second',
+                locked_until = NULL,
+                last_error = $4
+            WHERE id = $1
+        ''', event_id, status, delay, error[:1000])
+    return status, delay
+
+async def _worker_loop(worker_id, handler):
+    wakeup = _get_wakeup()
+    while True:
+        # claim 전에 clear 해야 그 사이 들어온 이벤트 알림을 놓치지 않음
+        wakeup.clear()
+        try:
+            pool = await get_pool()
+            row = await _claim_event(pool)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Stripe inbox worker {worker_id} claim failed: {e}")
+            row = None
+
+        if row is None:
+            try:
+                await asyncio.wait_for(wakeup.wait(), timeout=STRIPE_WORKER_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            continue
+
+        event_id = row['id']
+        started = time.perf_counter()
+        try:
+            event = json.loads(row['payload'])
+            try:
+                async with start_trace('stripe.event', type=row['type'], event_id=event_id, attempt=row['attempts']):
+                    result = await handler(event)
+            finally:
+                STRIPE_EVENT_SECONDS.observe(time.perf_counter() - started, row['type'])
+            await _mark_done(pool, event_id)
+            STRIPE_EVENTS_TOTAL.inc(row['type'], result if isinstance(result, str) else 'ok')
+            logger.info(f"Stripe event {event_id} ({row['type']}) processed: {result}")
+        except asyncio.CancelledError:
+            # 처리 중 종료되면 lock timeout 이후 다른 워커가 회수
+            raise
+        except Exception as e:
+            STRIPE_EVENTS_TOTAL.inc(row['type'], 'error')
+            try:
+                status, delay = await _mark_failed(pool, event_id, row['attempts'], repr(e))
+                if status == 'dead':
+                    logger.error(f"Stripe event {event_id} moved to dead-letter after {row['attempts']} attempts: {e}")
+                else:
+                    logger.warning(f"Stripe event {event_id} failed (attempt {row['attempts']}), retry in {delay:.0f}s: {e}")
+            except Exception as mark_error:
+                logger.error(f"Stripe event {event_id} failure could not be recorded: {mark_error}")
+
+async def prune_events(pool, retention_days=STRIPE_EVENT_RETENTION_DAYS, batch_size=5000):
+    """보존 기간이 지난 done 이벤트 삭제. 긴 락을 피하려고 배치 단위로 지움"""
+    total = 0
+    while True:
+        async with acquire(pool) as conn:
+            result = await conn.execute('''
+                DELETE FROM stripe_events
+                WHERE id IN (
+                    SELECT id FROM stripe_events
+                    WHERE status = 'done' AND processed_at < NOW() - $1 * INTERVAL '1 day'
+                    LIMIT $2
+                )
+            ''', retention_days, batch_size)
+        deleted = int(result.split()[-1])
+        total += deleted
+        if deleted < batch_size:
+            return total
+
+def start_workers(handler, concurrency=STRIPE_WORKER_CONCURRENCY):
+    for i in range(concurrency):
+        _workers.append(asyncio.create_task(_worker_loop(i, handler), name=f"stripe-inbox-{i}"))
+    # 재시작 전에 쌓여 있던 이벤트를 바로 처리
+    _get_wakeup().set()
+    logger.info(f"Started {concurrency} Stripe inbox workers")
+
+async def stop_workers():
+    for task in _workers:
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+
+async def requeue_dead_events(pool):
+    async with acquire(pool) as conn:
+        result = await conn.execute('''
+            UPDATE stripe_events
+            SET status = 'pending', attempts = 0, next_attempt_at = NOW(), last_error = NULL
+            WHERE status = 'dead'
+        ''')
+    _get_wakeup().set()
+    return int(result.split()[-1])
+
+async def inbox_stats(pool):
+    async with acquire(pool) as conn:
+        rows = await conn.fetch('SELECT status, COUNT(*) AS cnt FROM stripe_events GROUP BY status')
+    return {r['status']: r['cnt'] for r in rows}
+
+def decode_stored_event(payload, encoding):
+    if encoding == 'zlib':
+        payload = zlib.decompress(payload)
+    return json.loads(payload)
+
+async def iter_stored_events(pool, event_type=None, since=None, limit=None, fetch_size=500):
+    """stripe_event_store를 받은 순서대로 읽어 dict 이벤트로 돌려주는 async generator"""
+    conditions, params = [], []
+    if event_type:
+        params.append(event_type)
+        conditions.append(f"type = ${len(params)}")
+    if since:
+        params.append(since)
+        conditions.append(f"received_at >= ${len(params)}")
+    query = f"SELECT payload, encoding FROM stripe_event_store {'WHERE ' + ' AND '.join(conditions) if conditions else ''} ORDER BY received_at, id"
+    if limit:
+        query += f" LIMIT {int(limit)}"
+    async with acquire(pool) as conn:
+        async with conn.transaction():
+            async for row in conn.cursor(query, *params, prefetch=fetch_size):
+                yield decode_stored_event(row['payload'], row['encoding'])
@@ -0,0 +1,115 @@
+# bot_core/stripe_sync.py
+import datetime
+import decimal
+import logging
+import time
+from bot_core.db import acquire, insert_logs, log_record, log_action
+from bot_core.stripe_client import iter_payment_intents
+from config import STRIPE_SYNC_LOOKBACK, STRIPE_SYNC_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+SYNC_NAME = 'payment_intents'
+
+# PaymentIntent id 기준 멱등 upsert. 처음 들어온 행만 inserted=TRUE (xmax = 0)로 돌려받아 daily_logs에 기록
+_UPSERT_PAYMENTS_SQL = '''
+    INSERT INTO stripe_payments AS p (payment_intent_id, user_id, bot_name, action, amount, currency, created_at, source)
+    SELECT * FROM unnest($1::TEXT[], $2::BIGINT[], $3::TEXT[], $4::TEXT[], $5::NUMERIC[], $6::TEXT[], $7::TIMESTAMP[], $8::TEXT[])
+    ON CONFLICT (payment_intent_id) DO UPDATE SET last_synced_at = CURRENT_TIMESTAMP
+    RETURNING p.payment_intent_id, (xmax = 0) AS inserted
+'''
+
+async def _upsert_payments(conn, payments, source, log_since=datetime.datetime.min):
+    """payments: [(pi_id, user_id, bot_name, action, amount, currency, created_at)]. 새로 들어온 결제 중
+    created_at >= log_since인 것만 daily_logs에 기록 (None이면 기록하지 않음). (새 행 수, 기록한 수) 반환"""
+    columns = [list(col) for col in zip(*payments)]
+    rows = await conn.fetch(_UPSERT_PAYMENTS_SQL, *columns, [source] * len(payments))
+    inserted = {r['payment_intent_id'] for r in rows if r['inserted']}
+    records = [
+        log_record(user_id, action, amount, bot_name, created_at)
+        for pi_id, user_id, bot_name, action, amount, currency, created_at in payments
+        if pi_id in inserted and log_since is not None and created_at >= log_since
+    ]
+    if records:
+        await insert_logs(conn, records)
+    return len(inserted), len(records)
+
+async def record_payment(pool, payment_intent_id, user_id, action, amount, bot_name, currency=None, source='webhook'):
+    """webhook 경로용: PaymentIntent 단위로 한 번만 daily_logs에 기록. 이미 기록된 결제면 False"""
+    if not payment_intent_id:
+        await log_action(pool, user_id, action, amount, bot_name)
+        return True
+    payment = (payment_intent_id, user_id, bot_name, action, decimal.Decimal(str(amount)), currency, datetime.datetime.utcnow())
+    async with acquire(pool) as conn:
+        async with conn.transaction():
+            return (await _upsert_payments(conn, [payment], source))[1] > 0
+
+async def _write_batch(pool, batch, log_since):
+    async with acquire(pool) as conn:
+        async with conn.transaction():
+            return await _upsert_payments(conn, batch, 'sync', log_since)
+
+def _add_counts(stats, counts):
+    new_rows, logged = counts
+    stats['inserted'] += logged
+    stats['backfilled'] += new_rows - logged
+
+async def reconcile_payments(pool, full=False, lookback=STRIPE_SYNC_LOOKBACK, batch_size=STRIPE_SYNC_BATCH_SIZE):
+    """high-water mark(마지막으로 본 created) 이후 PaymentIntent만 가져와 반영.
+    생성 후 늦게 succeeded 되는 결제를 놓치지 않도록 lookback 초만큼 겹쳐서 조회 (중복은 upsert가 걸러냄).
+    high-water가 없는 첫 실행이나 full 실행에서 그 이전 구간의 결제는 stripe_payments에만 채우고
+    daily_logs에는 쓰지 않음 (이미 webhook으로 기록된 과거 매출이 두 번 집계되지 않도록)"""
+    started = time.perf_counter()
+    async with acquire(pool) as conn:
+        high_water = await conn.fetchval('SELECT high_water FROM stripe_sync_state WHERE name = $1', SYNC_NAME)
+
+    params = {'limit': 100}
+    log_since = None
+    if high_water:
+        since = max(0, high_water - int(lookback))
+        log_since = datetime.datetime.utcfromtimestamp(since)
+        if not full:
+            params['created'] = {'gte': since}
+
+    stats = {'fetched': 0, 'succeeded': 0, 'skipped': 0, 'inserted': 0, 'backfilled': 0}
+    newest = high_water or 0
+    batch = []
+    async for pi in iter_payment_intents(**params):
+        stats['fetched'] += 1
+        newest = max(newest, pi.created)
+        if pi.status != 'succeeded':
+            continue
+        stats['succeeded'] += 1
+        user_id_str = pi.metadata.get('user_id')
+        bot_name = pi.metadata.get('bot_name', 'unknown')
+        if not user_id_str or bot_name == 'unknown':
+            stats['skipped'] += 1
+            continue
+        plan = pi.metadata.get('plan', 'monthly')
+        batch.append((
+            pi.id, int(user_id_str), bot_name, f'payment_stripe_{plan}', decimal.Decimal(pi.amount) / 100, pi.currency,
+            datetime.datetime.utcfromtimestamp(pi.created),
+        ))
+        if len(batch) >= batch_size:
+            _add_counts(stats, await _write_batch(pool, batch, log_since))
+            batch = []
+    if batch:
+        _add_counts(stats, await _write_batch(pool, batch, log_since))
+
+    # 전체 페이지를 다 반영한 뒤에만 high-water를 올림 (중간 실패 시 다음 실행이 같은 구간부터 다시)
+    async with acquire(pool) as conn:
+        await conn.execute('''
+            INSERT INTO stripe_sync_state (name, high_water, last_run_at, last_fetched, last_inserted)
+            VALUES ($1, $2, CURRENT_TIMESTAMP, $3, $4)
+            ON CONFLICT (name) DO UPDATE SET
+                high_water = GREATEST(stripe_sync_state.high_water, EXCLUDED.high_water),
+                last_run_at = EXCLUDED.last_run_at,
+                last_fetched = EXCLUDED.last_fetched,
+                last_inserted = EXCLUDED.last_inserted
+        ''', SYNC_NAME, newest, stats['fetched'], stats['inserted'])
+
+    stats['high_water'] = newest
+    stats['elapsed_s'] = round(time.perf_counter() - started, 2)
+    if stats['inserted']:
+        logger.info(f"Stripe sync: {stats}")
+    return stats
@@ -0,0 +1,306 @@
+# bot_core/tracing.py
+"""update/Stripe 이벤트 단위 trace. trace id와 현재 span은 contextvar로 전달되므로
+같은 태스크(및 거기서 만든 하위 태스크) 안의 span()은 자동으로 해당 trace에 붙음.
+trace 밖에서 호출된 span()은 아무것도 하지 않음
+
+느린 trace(TRACE_SLOW_THRESHOLD_MS 이상)는 span 내역을 JSON 한 줄로 경고 로그에 남기고,
+TRACE_EXPORT_FILE이 있으면 OTLP/JSON(ExportTraceServiceRequest) 형식으로 한 줄씩 파일에 씀
+(collector 없이 오프라인으로 쌓아 두었다가 otelcol file receiver 등으로 불러올 수 있음)
+"""
+import contextvars
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from config import (
+    TRACE_ENABLED, TRACE_SLOW_THRESHOLD_MS, TRACE_MAX_SPANS, TRACE_EXPORT_FILE, TRACE_EXPORT_SLOW_ONLY,
+    TRACE_EXPORT_QUEUE_SIZE
+)
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = 'newpipe'
+
+_current_trace = contextvars.ContextVar('trace', default=None)
+_current_span = contextvars.ContextVar('span_id', default=None)
+
+# OTLP span kind / status code
+_KIND_INTERNAL = 1
+_KIND_SERVER = 2
+_STATUS_ERROR = 2
+
+
+def _new_id(nbytes):
+    return os.urandom(nbytes).hex()
+
+
+class Trace:
+    __slots__ = ('trace_id', 'span_id', 'name', 'attributes', 'start_ns', 'started', 'duration_ms', 'spans',
+                 'dropped', 'error')
+
+    def __init__(self, name, attributes):
+        self.trace_id = _new_id(16)
+        self.span_id = _new_id(8)
+        self.name = name
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.started = time.perf_counter()
+        self.duration_ms = 0.0
+        self.spans = []
+        self.dropped = 0
+        self.error = None
+
+
+class _Span:
+    __slots__ = ('trace', 'name', 'attributes', 'span_id', 'parent_id', 'offset_ms', 'duration_ms', 'error',
+                 '_started', '_token')
+
+    def __init__(self, trace, name, attributes):
+        self.trace = trace
+        self.name = name
+        self.attributes = attributes
+        self.error = None
+
+    def __enter__(self):
+        self.span_id = _new_id(8)
+        self.parent_id = _current_span.get() or self.trace.span_id
+        self._token = _current_span.set(self.span_id)
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        ended = time.perf_counter()
+        _current_span.reset(self._token)
+        self.offset_ms = (self._started - self.trace.started) * 1000
+        self.duration_ms = (ended - self._started) * 1000
+        if exc_type is not None:
+            self.error = f"{exc_type.__name__}: {exc}"
+        if len(self.trace.spans) < TRACE_MAX_SPANS:
+            self.trace.spans.append(self)
+        else:
+            self.trace.dropped += 1
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+def span(name, **attributes):
+    """with/async with span('db.get_member_status'): ... — 현재 trace에 하위 구간 추가"""
+    trace = _current_trace.get()
+    if trace is None:
+        return _NOOP
+    return _Span(trace, name, attributes)
+
+
+def annotate(**attributes):
+    """현재 trace에 속성 추가 (예: 어떤 핸들러가 처리했는지)"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.attributes.update(attributes)
+
+
+def current_trace_id():
+    trace = _current_trace.get()
+    return trace.trace_id if trace is not None else None
+
+
+class _TraceScope:
+    __slots__ = ('name', 'attributes', 'trace', '_tokens')
+
+    def __init__(self, name, attributes):
+        self.name = name
+        self.attributes = attributes
+
+    def __enter__(self):
+        self.trace = Trace(self.name, self.attributes)
+        self._tokens = (_current_trace.set(self.trace), _current_span.set(None))
+        return self.trace
+
+    def __exit__(self, exc_type, exc, tb):
+        trace = self.trace
+        trace.duration_ms = (time.perf_counter() - trace.started) * 1000
+        _current_trace.reset(self._tokens[0])
+        _current_span.reset(self._tokens[1])
+        if exc_type is not None:
+            trace.error = f"{exc_type.__name__}: {exc}"
+        _finish(trace)
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
+
+
+def start_trace(name, **attributes):
+    """update/이벤트 하나의 처리 구간. 이미 trace 안이면 새로 만들지 않고 span으로 기록"""
+    if not TRACE_ENABLED:
+        return _NOOP
+    if _current_trace.get() is not None:
+        return span(name, **attributes)
+    return _TraceScope(name, attributes)
+
+
+def _finish(trace):
+    slow = trace.duration_ms >= TRACE_SLOW_THRESHOLD_MS
+    if slow:
+        logger.warning(f"Slow trace: {json.dumps(slow_log_record(trace), default=str, ensure_ascii=False)}")
+    if _exporter is not None and (slow or not TRACE_EXPORT_SLOW_ONLY):
+        try:
+            _exporter.export(trace)
+        except Exception as e:
+            logger.error(f"Trace export failed: {e}")
+
+
+def slow_log_record(trace):
+    parents = {s.span_id: s.parent_id for s in trace.spans}
+
+    def depth(span_id):
+        level = 0
+        while span_id in parents:
+            span_id = parents[span_id]
+            level += 1
+        return level
+
+    breakdown = []
+    for s in sorted(trace.spans, key=lambda s: s.offset_ms):
+        entry = {'name': s.name, 'depth': depth(s.span_id), 'start_ms': round(s.offset_ms, 1),
+                 'duration_ms': round(s.duration_ms, 1)}
+        if s.attributes:
+            entry['attributes'] = s.attributes
+        if s.error:
+            entry['error'] = s.error
+        breakdown.append(entry)
+    record = {'trace_id': trace.trace_id, 'name': trace.name, 'duration_ms': round(trace.duration_ms, 1),
+              'attributes': trace.attributes, 'spans': breakdown}
+    if trace.error:
+        record['error'] = trace.error
+    if trace.dropped:
+        record['dropped_spans'] = trace.dropped
+    return record
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def _otlp_attributes(attributes):
+    return [{'key': key, 'value': _otlp_value(value)} for key, value in attributes.items() if value is not None]
+
+
+def _otlp_span(trace, span_id, parent_id, name, kind, start_ns, duration_ms, attributes, error):
+    otlp = {
+        'traceId': trace.trace_id,
+        'spanId': span_id,
+        'name': name,
+        'kind': kind,
+        'startTimeUnixNano': str(start_ns),
+        'endTimeUnixNano': str(start_ns + int(duration_ms * 1_000_000)),
+        'attributes': _otlp_attributes(attributes),
+        'status': {'code': _STATUS_ERROR, 'message': error} if error else {},
+    }
+    if parent_id:
+        otlp['parentSpanId'] = parent_id
+    return otlp
+
+
+def to_otlp(trace):
+    """ExportTraceServiceRequest (OTLP/JSON) 한 건"""
+    spans = [_otlp_span(trace, trace.span_id, None, trace.name, _KIND_SERVER, trace.start_ns, trace.duration_ms,
+                        trace.attributes, trace.error)]
+    for s in trace.spans:
+        spans.append(_otlp_span(trace, s.span_id, s.parent_id, s.name, _KIND_INTERNAL,
+                                trace.start_ns + int(s.offset_ms * 1_000_000), s.duration_ms, s.attributes, s.error))
+    return {'resourceSpans': [{
+        'resource': {'attributes': _otlp_attributes({'service.name': SERVICE_NAME})},
+        'scopeSpans': [{'scope': {'name': __name__}, 'spans': spans}],
+    }]}
+
+
+_CLOSE = object()
+
+
+class FileExporter:
+    """trace마다 OTLP/JSON 한 줄을 파일에 추가 (JSON lines).
+    export()는 끝난 trace를 큐에 넣기만 하고, 직렬화와 파일 쓰기는 별도 스레드가 함 (event loop를 막지 않도록).
+    큐가 가득 차면 해당 trace는 버리고 dropped에 셈"""
+
+    def __init__(self, path, max_queue=TRACE_EXPORT_QUEUE_SIZE):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(path, 'a', encoding='utf-8')
+        self._queue = queue.Queue(maxsize=max_queue)
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, trace):
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            trace = self._queue.get()
+            if trace is _CLOSE:
+                break
+            try:
+                self._file.write(json.dumps(to_otlp(trace), default=str, ensure_ascii=False) + '\n')
+                # 쌓인 게 없을 때만 flush해서 몰릴 때는 한 번에 씀
+                if self._queue.empty():
+                    self._file.flush()
+            except Exception as e:
+                logger.error(f"Trace export failed: {e}")
+        self._file.close()
+
+    def close(self):
+        """남은 trace를 모두 쓰고 파일을 닫음"""
+        self._queue.put(_CLOSE)
+        self._thread.join()
+        if self.dropped:
+            logger.warning(f"Trace exporter dropped {self.dropped} traces (queue full)")
+
+
+_exporter = FileExporter(TRACE_EXPORT_FILE) if TRACE_ENABLED and TRACE_EXPORT_FILE else None
+
+
+def close_exporter():
+    global _exporter
+    if _exporter is not None:
+        exporter, _exporter = _exporter, None
+        exporter.close()
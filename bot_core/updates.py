@@ -0,0 +1,231 @@
+# bot_core/updates.py
+import asyncio
+import collections
+import logging
+import time
+from telegram.ext import BaseUpdateProcessor
+from bot_core.db import get_pool, acquire
+from bot_core.metrics import UPDATE_QUEUE_WAIT_SECONDS
+from bot_core.tracing import start_trace
+from config import UPDATE_DEDUP_BACKEND, UPDATE_DEDUP_WINDOW, UPDATE_DEDUP_RETENTION
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFull(Exception):
+    """봇의 대기 중인 update(큐 + 처리 대기/중)가 한도에 닿음. webhook은 503으로 응답해 Telegram이 나중에 재전송하게 함"""
+
+
+def _ordering_key(update):
+    # 같은 유저(없으면 같은 채팅)의 update는 받은 순서대로 하나씩 처리
+    if update.effective_user is not None:
+        return update.effective_user.id
+    if update.effective_chat is not None:
+        return update.effective_chat.id
+    return None
+
+
+class OrderedUpdateProcessor(BaseUpdateProcessor):
+    """update를 최대 max_concurrent_updates개까지 동시에 처리하되 유저별 순서는 보장.
+    Application.update_queue에서 꺼내진 update마다 PTB가 태스크를 만들어 process_update를 호출함"""
+
+    def __init__(self, max_concurrent_updates, bot_key=None):
+        super().__init__(max_concurrent_updates)
+        self.bot_key = bot_key
+        # PTB 내부 semaphore 대신 직접 관리하는 동시 처리 슬롯
+        self._slots = asyncio.Semaphore(max_concurrent_updates)
+        self._running = 0
+        self._locks = {}  # ordering key -> [Lock, 대기/처리 중인 update 수]
+        self._enqueued_at = {}  # update_id -> perf_counter
+        self.stats = {'enqueued': 0, 'rejected': 0, 'processed': 0, 'in_flight': 0,
+                      'wait_ms_total': 0.0, 'wait_ms_max': 0.0, 'handle_ms_total': 0.0, 'handle_ms_max': 0.0}
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    @property
+    def current_concurrent_updates(self):
+        return self._running
+
+    def mark_enqueued(self, update):
+        self._enqueued_at[update.update_id] = time.perf_counter()
+        self.stats['enqueued'] += 1
+
+    async def process_update(self, update, coroutine):
+        # 유저별 lock을 먼저 잡고 나서 동시 처리 슬롯을 잡음.
+        # 반대 순서면 같은 유저의 뒤 update들이 슬롯을 차지한 채 lock을 기다려 다른 유저 처리가 막힘
+        key = _ordering_key(update)
+        entry = None
+        if key is not None:
+            entry = self._locks.setdefault(key, [asyncio.Lock(), 0])
+            entry[1] += 1
+        self.stats['in_flight'] += 1
+        try:
+            if entry is None:
+                async with self._slots:
+                    await self._run(update, coroutine)
+            else:
+                async with entry[0], self._slots:
+                    await self._run(update, coroutine)
+        finally:
+            self.stats['in_flight'] -= 1
+            if entry is not None:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    self._locks.pop(key, None)
+
+    async def _run(self, update, coroutine):
+        self._running += 1
+        try:
+            await self.do_process_update(update, coroutine)
+        finally:
+            self._running -= 1
+
+    async def do_process_update(self, update, coroutine):
+        started = time.perf_counter()
+        enqueued = self._enqueued_at.pop(update.update_id, None)
+        wait_ms = None
+        if enqueued is not None:
+            wait_ms = (started - enqueued) * 1000
+            self.stats['wait_ms_total'] += wait_ms
+            self.stats['wait_ms_max'] = max(self.stats['wait_ms_max'], wait_ms)
+            UPDATE_QUEUE_WAIT_SECONDS.observe(wait_ms / 1000, self.bot_key)
+        # 핸들러 안의 DB/Stripe/Telegram 호출 span이 이 trace에 붙음
+        async with start_trace('telegram.update', bot=self.bot_key, update_id=update.update_id,
+                               queue_wait_ms=round(wait_ms, 1) if wait_ms is not None else None):
+            await coroutine
+        handle_ms = (time.perf_counter() - started) * 1000
+        self.stats['processed'] += 1
+        self.stats['handle_ms_total'] += handle_ms
+        self.stats['handle_ms_max'] = max(self.stats['handle_ms_max'], handle_ms)
+
+    def snapshot(self, queue_depth, queue_size):
+        processed = self.stats['processed']
+        return {
+            'queue_depth': queue_depth,
+            'queue_size': queue_size,
+            'in_flight': self.stats['in_flight'],
+            'enqueued': self.stats['enqueued'],
+            'rejected': self.stats['rejected'],
+            'processed': processed,
+            'avg_wait_ms': round(self.stats['wait_ms_total'] / processed, 1) if processed else 0.0,
+            'max_wait_ms': round(self.stats['wait_ms_max'], 1),
+            'avg_handle_ms': round(self.stats['handle_ms_total'] / processed, 1) if processed else 0.0,
+            'max_handle_ms': round(self.stats['handle_ms_max'], 1),
+        }
+
+
+def enqueue_update(telegram_app, update):
+    """update를 Application.update_queue에 넣고 바로 반환. 대기 중인 update가 큐 크기만큼 쌓였으면 QueueFull.
+    동시 처리 모드에서는 PTB가 큐에서 바로 꺼내 태스크로 만들기 때문에(슬롯은 태스크 안에서 기다림)
+    큐 길이만으로는 차지 않으므로, 처리 대기/중인 update 수(in_flight)를 함께 셈"""
+    processor = telegram_app.update_processor
+    queue = telegram_app.update_queue
+    ordered = isinstance(processor, OrderedUpdateProcessor)
+    try:
+        if ordered and queue.maxsize > 0 and processor.stats['in_flight'] + queue.qsize() >= queue.maxsize:
+            raise asyncio.QueueFull()
+        queue.put_nowait(update)
+    except asyncio.QueueFull:
+        if ordered:
+            processor.stats['rejected'] += 1
+        raise QueueFull()
+    if isinstance(processor, OrderedUpdateProcessor):
+        processor.mark_enqueued(update)
+
+
+def update_stats(telegram_app):
+    processor = telegram_app.update_processor
+    if not isinstance(processor, OrderedUpdateProcessor):
+        return {}
+    queue = telegram_app.update_queue
+    return processor.snapshot(queue.qsize(), queue.maxsize)
+
+
+class UpdateIdWindow:
+    """봇별 최근 update_id size개를 기억하는 링 버퍼 (오래된 것부터 밀려남)"""
+
+    def __init__(self, size):
+        self.size = size
+        self._windows = {}  # bot_key -> (deque, set)
+
+    def add(self, bot_key, update_id):
+        """처음 보는 update_id면 기록하고 True"""
+        order, seen = self._windows.setdefault(bot_key, (collections.deque(), set()))
+        if update_id in seen:
+            return False
+        order.append(update_id)
+        seen.add(update_id)
+        if len(order) > self.size:
+            seen.discard(order.popleft())
+        return True
+
+    def discard(self, bot_key, update_id):
+        window = self._windows.get(bot_key)
+        if window and update_id in window[1]:
+            window[1].discard(update_id)
+            window[0].remove(update_id)
+
+    def __len__(self):
+        return sum(len(order) for order, _ in self._windows.values())
+
+
+class UpdateDeduplicator:
+    """Telegram 재전송 update를 update_id로 걸러냄. backend='postgres'면 replica 간에도 공유
+    (메모리 창을 먼저 보고, 새 id일 때만 telegram_updates에 INSERT)"""
+
+    def __init__(self, backend=UPDATE_DEDUP_BACKEND, window=UPDATE_DEDUP_WINDOW):
+        self.backend = backend
+        self.window = UpdateIdWindow(window)
+        self.stats = {'checked': 0, 'duplicates': 0, 'duplicates_db': 0, 'db_errors': 0}
+
+    async def claim(self, bot_key, update_id):
+        """처음 받은 update면 True. 중복이면 False"""
+        self.stats['checked'] += 1
+        if not self.window.add(bot_key, update_id):
+            self.stats['duplicates'] += 1
+            return False
+        if self.backend != 'postgres':
+            return True
+        try:
+            async with acquire(await get_pool()) as conn:
+                inserted = await conn.fetchval('''
+                    INSERT INTO telegram_updates (bot_key, update_id) VALUES ($1, $2)
+                    ON CONFLICT DO NOTHING
+                    RETURNING TRUE
+                ''', bot_key, update_id)
+        except Exception as e:
+            # DB 장애로 update를 버리지 않도록 메모리 판정만으로 처리
+            self.stats['db_errors'] += 1
+            logger.error(f"Update dedup lookup failed for {bot_key}/{update_id}: {e}")
+            return True
+        if not inserted:
+            self.stats['duplicates'] += 1
+            self.stats['duplicates_db'] += 1
+            return False
+        return True
+
+    async def release(self, bot_key, update_id):
+        """처리하지 못한 update(503 응답 등)는 Telegram 재전송 때 다시 받도록 기록 취소"""
+        self.window.discard(bot_key, update_id)
+        if self.backend != 'postgres':
+            return
+        try:
+            async with acquire(await get_pool()) as conn:
+                await conn.execute('DELETE FROM telegram_updates WHERE bot_key = $1 AND update_id = $2', bot_key, update_id)
+        except Exception as e:
+            logger.error(f"Update dedup release failed for {bot_key}/{update_id}: {e}")
+
+    def snapshot(self):
+        return {'backend': self.backend, 'window_entries': len(self.window), **self.stats}
+
+
+async def prune_update_ids(pool, retention=UPDATE_DEDUP_RETENTION):
+    async with acquire(pool) as conn:
+        result = await conn.execute(
+            "DELETE FROM telegram_updates WHERE received_at < NOW() - $1 * INTERVAL '1 second'", retention
+        )
+    return int(result.split()[-1])
@@ -1,9 +1,9 @@
 # bot_core/utils.py
 import datetime
 import logging
-from telegram.ext import ContextTypes
 from config import CHANNEL_ID, ADMIN_USER_ID
-from bot_core.db import get_pool
+from bot_core.db import get_pool, acquire, get_daily_stats
+from bot_core import outbound
 
 logger = logging.getLogger(__name__)
 
@@ -11,7 +11,8 @@ async def create_invite_link(bot):
     expire_date = datetime.datetime.utcnow() + datetime.timedelta(minutes=5)
     expire_timestamp = int(expire_date.timestamp())
 
-    link = await bot.create_chat_invite_link(
+    link = await outbound.send(
+        bot, 'create_chat_invite_link', priority=outbound.PRIORITY_USER, per_chat=False,
         chat_id=CHANNEL_ID,
         expire_date=expire_timestamp,
         member_limit=1
@@ -20,23 +21,26 @@ async def create_invite_link(bot):
     return link.invite_link, expiry_str
 
 async def get_near_expiry(pool):
-    async with pool.acquire() as conn:
+    async with acquire(pool) as conn:
         rows = await conn.fetch('''
             SELECT user_id, username, bot_name, (expiry::date - CURRENT_DATE) AS days_left, email
             FROM members
-            WHERE active = TRUE AND NOT is_lifetime AND (expiry::date - CURRENT_DATE) IN (1, 3)
+            WHERE active = TRUE AND NOT is_lifetime
+              AND ((expiry >= CURRENT_DATE + 1 AND expiry < CURRENT_DATE + 2)
+                OR (expiry >= CURRENT_DATE + 3 AND expiry < CURRENT_DATE + 4))
         ''')
     return [(r['user_id'], r['username'] or f"ID{r['user_id']}", r['bot_name'], r['days_left'], r['email'] or 'unknown') for r in rows]
 
 async def get_expired_today(pool):
-    async with pool.acquire() as conn:
+    async with acquire(pool) as conn:
         rows = await conn.fetch('''
             SELECT user_id, username, bot_name, email FROM members
-            WHERE active = TRUE AND NOT is_lifetime AND expiry::date = CURRENT_DATE
+            WHERE active = TRUE AND NOT is_lifetime
+              AND expiry >= CURRENT_DATE AND expiry < CURRENT_DATE + 1
         ''')
     return [(r['user_id'], r['username'] or f"ID{r['user_id']}", r['bot_name'], r['email'] or 'unknown') for r in rows]
 
-async def send_daily_report(context: ContextTypes.DEFAULT_TYPE):
+async def send_daily_report(bot):
     pool = await get_pool()
     today = datetime.datetime.utcnow().strftime("%b %d")
     stats = await get_daily_stats(pool)
@@ -71,6 +75,6 @@ async def send_daily_report(context: ContextTypes.DEFAULT_TYPE):
     message += f"💰 Revenue today: ${stats['total_revenue']:.2f}"
 
     try:
-        await context.bot.send_message(ADMIN_USER_ID, message, parse_mode='HTML')
+        await outbound.send_message(bot, ADMIN_USER_ID, message, priority=outbound.PRIORITY_BULK, parse_mode='HTML')
     except Exception as e:
         logger.error(f"Failed to send daily report: {e}")
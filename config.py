@@ -3,9 +3,52 @@ import os
 # Stripe
 STRIPE_SECRET_KEY = os.getenv("STRIPE_SECRET_KEY")
 STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET")
+STRIPE_MAX_WORKERS = int(os.getenv("STRIPE_MAX_WORKERS", "8"))  # Stripe API 호출용 스레드 수
+STRIPE_HTTP_TIMEOUT = float(os.getenv("STRIPE_HTTP_TIMEOUT", "20"))  # 초, HTTP 클라이언트 타임아웃
+STRIPE_CALL_TIMEOUT = float(os.getenv("STRIPE_CALL_TIMEOUT", "15"))  # 초, 호출 1건 대기 한도
+STRIPE_MAX_NETWORK_RETRIES = int(os.getenv("STRIPE_MAX_NETWORK_RETRIES", "2"))
+CHECKOUT_SESSION_TTL = int(os.getenv("CHECKOUT_SESSION_TTL", "3600"))  # 초, Stripe expires_at (30분~24시간)
+CHECKOUT_SESSION_CACHE_SIZE = int(os.getenv("CHECKOUT_SESSION_CACHE_SIZE", "10000"))
+
+# Stripe event inbox workers
+STRIPE_WORKER_CONCURRENCY = int(os.getenv("STRIPE_WORKER_CONCURRENCY", "4"))
+STRIPE_WORKER_POLL_INTERVAL = float(os.getenv("STRIPE_WORKER_POLL_INTERVAL", "5"))  # 초
+STRIPE_WORKER_MAX_ATTEMPTS = int(os.getenv("STRIPE_WORKER_MAX_ATTEMPTS", "8"))  # 초과 시 dead
+STRIPE_WORKER_BACKOFF_BASE = float(os.getenv("STRIPE_WORKER_BACKOFF_BASE", "5"))  # 초
+STRIPE_WORKER_BACKOFF_MAX = float(os.getenv("STRIPE_WORKER_BACKOFF_MAX", "3600"))  # 초
+STRIPE_WORKER_LOCK_TIMEOUT = int(os.getenv("STRIPE_WORKER_LOCK_TIMEOUT", "300"))  # 초, processing 상태 회수 기준
+
+# Stripe event idempotency (event id 기준)
+STRIPE_EVENT_CACHE_SIZE = int(os.getenv("STRIPE_EVENT_CACHE_SIZE", "10000"))
+STRIPE_EVENT_CACHE_TTL = float(os.getenv("STRIPE_EVENT_CACHE_TTL", "3600"))  # 초
+STRIPE_EVENT_RETENTION_DAYS = int(os.getenv("STRIPE_EVENT_RETENTION_DAYS", "30"))  # Stripe 재전송 기간(3일)보다 길게
+STRIPE_EVENT_PRUNE_INTERVAL = float(os.getenv("STRIPE_EVENT_PRUNE_INTERVAL", "3600"))  # 초
+
+# Stripe payment reconciliation (/sync_stripe + 주기 작업)
+STRIPE_SYNC_INTERVAL = float(os.getenv("STRIPE_SYNC_INTERVAL", "3600"))  # 초
+STRIPE_SYNC_LOOKBACK = float(os.getenv("STRIPE_SYNC_LOOKBACK", "86400"))  # 초, high-water 이전으로 겹쳐 조회할 구간
+STRIPE_SYNC_BATCH_SIZE = int(os.getenv("STRIPE_SYNC_BATCH_SIZE", "200"))
 
 # Database
 DATABASE_URL = os.getenv("DATABASE_URL")
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))  # pgbouncer transaction mode면 0
+DB_ACQUIRE_TIMEOUT = float(os.getenv("DB_ACQUIRE_TIMEOUT", "10"))  # 초
+DB_COMMAND_TIMEOUT = float(os.getenv("DB_COMMAND_TIMEOUT", "30"))  # 초
+DB_MAX_INACTIVE_CONNECTION_LIFETIME = float(os.getenv("DB_MAX_INACTIVE_CONNECTION_LIFETIME", "300"))  # 초
+MEMBER_CACHE_SIZE = int(os.getenv("MEMBER_CACHE_SIZE", "50000"))
+MEMBER_CACHE_TTL = float(os.getenv("MEMBER_CACHE_TTL", "60"))  # 초
+LOG_BUFFER_MAX_ROWS = int(os.getenv("LOG_BUFFER_MAX_ROWS", "500"))  # 이만큼 쌓이면 바로 flush
+LOG_BUFFER_FLUSH_INTERVAL = float(os.getenv("LOG_BUFFER_FLUSH_INTERVAL", "2"))  # 초
+LOG_BUFFER_MAX_PENDING = int(os.getenv("LOG_BUFFER_MAX_PENDING", "50000"))  # DB 장애 시 메모리에 보관할 최대 행 수
+LOG_PARTITION_MONTHS_AHEAD = int(os.getenv("LOG_PARTITION_MONTHS_AHEAD", "3"))  # daily_logs 월 파티션을 미리 만들어 둘 개월 수
+LOG_RETENTION_DAYS = int(os.getenv("LOG_RETENTION_DAYS", "180"))  # 결제 외 로그(start 등) 보존 기간, 0이면 삭제 안 함
+LOG_ARCHIVE_DIR = os.getenv("LOG_ARCHIVE_DIR", "archives/daily_logs")  # 보존 기간 지난 파티션 gzip CSV 보관 위치
+LOG_MAINTENANCE_INTERVAL = float(os.getenv("LOG_MAINTENANCE_INTERVAL", "21600"))  # 초
+ROLLUP_USER_SET_DAYS = int(os.getenv("ROLLUP_USER_SET_DAYS", "7"))  # 일별 고유 유저 판정용 user_id 집합 보관 일수
+EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", "1"))  # /transactions 파일 생성 프로세스 수
+EXPORT_FETCH_SIZE = int(os.getenv("EXPORT_FETCH_SIZE", "5000"))  # 서버 사이드 커서에서 한 번에 가져올 행 수
 
 # Telegram Bots Tokens
 LETMEBOT_TOKEN = os.getenv("LETMEBOT_TOKEN")
@@ -65,6 +108,67 @@ WELCOME_VIDEO_LUST4TRANS = os.getenv("WELCOME_VIDEO_LUST4TRANS")
 # Render External URL (웹훅용 - 필수!)
 RENDER_EXTERNAL_URL = os.getenv("RENDER_EXTERNAL_URL")
 
+# Bot registry
+BOT_REGISTRY_FILE = os.getenv("BOT_REGISTRY_FILE")  # JSON 파일. 없으면 아래 기본 5개 봇 사용
+BOT_HTTP_POOL_SIZE = int(os.getenv("BOT_HTTP_POOL_SIZE", "64"))  # 모든 봇이 공유하는 Telegram API 커넥션 수
+ADMIN_BOT_KEY = os.getenv("ADMIN_BOT_KEY", "letmebot")  # 관리자 알림/리포트를 보내는 봇
+
+# Scheduler (클러스터 전체에서 job당 1회 실행)
+DAILY_REPORT_HOUR = int(os.getenv("DAILY_REPORT_HOUR", "9"))  # UTC
+DAILY_REPORT_MINUTE = int(os.getenv("DAILY_REPORT_MINUTE", "0"))
+SCHEDULER_LEASE_SECONDS = int(os.getenv("SCHEDULER_LEASE_SECONDS", "600"))  # 실행 중 job 리스 기간
+SCHEDULER_MISFIRE_GRACE = int(os.getenv("SCHEDULER_MISFIRE_GRACE", "3600"))  # 초, 놓친 실행을 늦게라도 돌리는 한도
+
+# Outbound Telegram send queue
+OUTBOUND_WORKERS = int(os.getenv("OUTBOUND_WORKERS", "8"))
+OUTBOUND_GLOBAL_RATE = float(os.getenv("OUTBOUND_GLOBAL_RATE", "25"))  # 초당 전체 호출 수 (Telegram 한도 30/s)
+OUTBOUND_PER_CHAT_RATE = float(os.getenv("OUTBOUND_PER_CHAT_RATE", "1"))  # 초당 같은 채팅 메시지 수
+OUTBOUND_GROUP_RATE = float(os.getenv("OUTBOUND_GROUP_RATE", "0.33"))  # 그룹/채널은 분당 20개
+OUTBOUND_MAX_RETRIES = int(os.getenv("OUTBOUND_MAX_RETRIES", "5"))
+OUTBOUND_QUEUE_SIZE = int(os.getenv("OUTBOUND_QUEUE_SIZE", "10000"))
+
+# Admin notification coalescing
+NOTIFY_COALESCE_WINDOW = float(os.getenv("NOTIFY_COALESCE_WINDOW", "10"))  # 초, 같은 구독 알림을 모으는 시간
+NOTIFY_DIGEST_THRESHOLD = int(os.getenv("NOTIFY_DIGEST_THRESHOLD", "3"))  # 창 안에 구독이 이 수 이상이면 digest 1건으로
+NOTIFY_CLAIM_TIMEOUT = int(os.getenv("NOTIFY_CLAIM_TIMEOUT", "300"))  # 초, 전송 중 크래시하면 이 시간 뒤 다른 replica가 다시 보냄
+NOTIFY_SWEEP_INTERVAL = int(os.getenv("NOTIFY_SWEEP_INTERVAL", "60"))  # 초, 못 보낸 알림 재전송 주기
+NOTIFY_MAX_ATTEMPTS = int(os.getenv("NOTIFY_MAX_ATTEMPTS", "8"))  # 일시 오류로 이만큼 실패하면 버림
+NOTIFY_BACKOFF_BASE = float(os.getenv("NOTIFY_BACKOFF_BASE", "30"))  # 초, 실패할 때마다 2배
+NOTIFY_BACKOFF_MAX = float(os.getenv("NOTIFY_BACKOFF_MAX", "3600"))  # 초
+
+# Expiry enforcement (만료 회원 자동 추방)
+ENFORCEMENT_DRY_RUN = os.getenv("ENFORCEMENT_DRY_RUN", "true").lower() == "true"  # true면 대상만 집계하고 추방/DB 변경 없음
+ENFORCEMENT_GRACE_HOURS = float(os.getenv("ENFORCEMENT_GRACE_HOURS", "24"))  # 만료 후 유예 시간
+ENFORCEMENT_INTERVAL = int(os.getenv("ENFORCEMENT_INTERVAL", "900"))  # 초
+ENFORCEMENT_BATCH_SIZE = int(os.getenv("ENFORCEMENT_BATCH_SIZE", "500"))
+ENFORCEMENT_CONCURRENCY = int(os.getenv("ENFORCEMENT_CONCURRENCY", "10"))
+ENFORCEMENT_RATE = float(os.getenv("ENFORCEMENT_RATE", "20"))  # 초당 ban/unban 호출 수
+ENFORCEMENT_UNBAN = os.getenv("ENFORCEMENT_UNBAN", "true").lower() == "true"  # ban 후 unban해서 재결제 시 다시 입장 가능하게
+
+# Bot startup
+BOT_STARTUP_CONCURRENCY = int(os.getenv("BOT_STARTUP_CONCURRENCY", "5"))
+BOT_STARTUP_TIMEOUT = float(os.getenv("BOT_STARTUP_TIMEOUT", "30"))  # 초, 봇 1개 기준
+
+# Telegram update 처리 (봇별)
+UPDATE_QUEUE_SIZE = int(os.getenv("UPDATE_QUEUE_SIZE", "1000"))  # 봇별 대기+처리 중 update 한도. 넘으면 webhook이 503 반환
+UPDATE_CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY", "32"))  # 동시에 처리할 update 수 (같은 유저는 순서대로)
+UPDATE_DEDUP_BACKEND = os.getenv("UPDATE_DEDUP_BACKEND", "memory")  # memory | postgres (replica 여러 개일 때)
+UPDATE_DEDUP_WINDOW = int(os.getenv("UPDATE_DEDUP_WINDOW", "10000"))  # 봇별로 기억할 최근 update_id 수
+UPDATE_DEDUP_RETENTION = float(os.getenv("UPDATE_DEDUP_RETENTION", "86400"))  # 초, postgres 기록 보존 (Telegram은 24시간 재전송)
+
+# Tracing (update/Stripe 이벤트 단위 span)
+TRACE_ENABLED = os.getenv("TRACE_ENABLED", "true").lower() == "true"
+TRACE_SLOW_THRESHOLD_MS = float(os.getenv("TRACE_SLOW_THRESHOLD_MS", "2000"))  # 이 이상 걸린 trace는 span 내역을 경고 로그로
+TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", "200"))  # trace당 기록할 최대 span 수 (초과분은 개수만 셈)
+TRACE_EXPORT_FILE = os.getenv("TRACE_EXPORT_FILE")  # OTLP/JSON lines 파일 경로. 없으면 내보내지 않음
+TRACE_EXPORT_SLOW_ONLY = os.getenv("TRACE_EXPORT_SLOW_ONLY", "true").lower() == "true"  # false면 모든 trace를 파일로
+TRACE_EXPORT_QUEUE_SIZE = int(os.getenv("TRACE_EXPORT_QUEUE_SIZE", "10000"))  # 파일에 쓰기 전 대기할 최대 trace 수 (넘치면 버림)
+
+# Sampling profiler (/profile)
+PROFILER_INTERVAL = float(os.getenv("PROFILER_INTERVAL", "0.005"))  # 초, 스택 샘플 간격
+PROFILER_LAG_INTERVAL = float(os.getenv("PROFILER_LAG_INTERVAL", "0.05"))  # 초, event loop lag 측정 간격
+PROFILER_MAX_SECONDS = int(os.getenv("PROFILER_MAX_SECONDS", "120"))  # 한 번에 프로파일링할 수 있는 최대 시간
+
 # Plan Prices (View Plans에서 표시)
 PLAN_PRICES = {
     'letmebot': {'weekly': '$10', 'monthly': '$20', 'lifetime': '$50'},
@@ -0,0 +1,119 @@
+# tests/test_expiry_indexes.py
+"""만료/구독 조회가 migration에서 만든 인덱스를 타는지 EXPLAIN으로 확인 (Postgres 필요)
+
+    TEST_DATABASE_URL=postgresql://localhost/newpipe_test python -m pytest tests/test_expiry_indexes.py
+
+임시 스키마에 마이그레이션을 적용하고 members를 채운 뒤 ANALYZE, 끝나면 스키마를 지움
+"""
+import asyncio
+import datetime
+import json
+import os
+import pytest
+
+asyncpg = pytest.importorskip("asyncpg")
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+pytestmark = pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL not set")
+
+from bot_core.db import NEAR_EXPIRY_SQL, EXPIRED_TODAY_SQL  # noqa: E402
+from bot_core.enforcement import _DUE_PASSES  # noqa: E402
+from bot_core.migrations import migrate  # noqa: E402
+
+SCHEMA = "test_expiry_indexes"
+INDEX_NODES = {'Index Scan', 'Index Only Scan', 'Bitmap Index Scan'}
+
+# 20만 명 중 만료일이 하루에 ~500명씩 퍼지도록 (lifetime/비활성 포함)
+_SEED_SQL = '''
+    INSERT INTO members (user_id, bot_name, username, stripe_customer_id, stripe_subscription_id,
+                         is_lifetime, expiry, active, kick_scheduled_at)
+    SELECT g, 'bot' || (g % 5), 'user' || g, 'cus_' || g,
+           CASE WHEN g % 7 = 0 THEN NULL ELSE 'sub_' || g END,
+           g % 7 = 0,
+           CASE WHEN g % 7 = 0 THEN NULL
+                ELSE CURRENT_DATE + ((g % 400) - 30) * INTERVAL '1 day' + (g % 24) * INTERVAL '1 hour' END,
+           g % 10 <> 0,
+           CASE WHEN g % 1000 = 0 THEN NOW() - INTERVAL '1 hour' END
+    FROM generate_series(1, 200000) AS g
+'''
+
+
+@pytest.fixture(scope="module")
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture(scope="module")
+def pool(loop):
+    async def setup():
+        admin = await asyncpg.connect(TEST_DATABASE_URL)
+        await admin.execute(f'DROP SCHEMA IF EXISTS {SCHEMA} CASCADE')
+        await admin.execute(f'CREATE SCHEMA {SCHEMA}')
+        await admin.close()
+        pool = await asyncpg.create_pool(TEST_DATABASE_URL, min_size=1, max_size=2,
+                                         server_settings={'search_path': SCHEMA})
+        await migrate(pool)
+        async with pool.acquire() as conn:
+            await conn.execute(_SEED_SQL)
+            await conn.execute('ANALYZE members')
+        return pool
+
+    async def teardown(pool):
+        await pool.close()
+        admin = await asyncpg.connect(TEST_DATABASE_URL)
+        await admin.execute(f'DROP SCHEMA IF EXISTS {SCHEMA} CASCADE')
+        await admin.close()
+
+    pool = loop.run_until_complete(setup())
+    yield pool
+    loop.run_until_complete(teardown(pool))
+
+
+def _index_scans(plan):
+    """plan 트리에서 (node type, index name) 목록"""
+    found = []
+    if plan.get('Index Name'):
+        found.append((plan['Node Type'], plan['Index Name']))
+    for child in plan.get('Plans', []):
+        found.extend(_index_scans(child))
+    return found
+
+
+def _explain(loop, pool, sql, *args):
+    async def run():
+        async with pool.acquire() as conn:
+            return await conn.fetchval(f'EXPLAIN (FORMAT JSON) {sql}', *args)
+    result = loop.run_until_complete(run())
+    plan = json.loads(result)[0]['Plan']
+    return _index_scans(plan)
+
+
+def _assert_uses(scans, index_name):
+    assert any(node in INDEX_NODES and name == index_name for node, name in scans), scans
+
+
+def test_near_expiry_uses_partial_expiry_index(loop, pool):
+    _assert_uses(_explain(loop, pool, NEAR_EXPIRY_SQL), 'members_active_expiry_idx')
+
+
+def test_expired_today_uses_partial_expiry_index(loop, pool):
+    _assert_uses(_explain(loop, pool, EXPIRED_TODAY_SQL), 'members_active_expiry_idx')
+
+
+def test_enforcement_passes_use_partial_indexes(loop, pool):
+    now = datetime.datetime.utcnow()
+    cutoff = now - datetime.timedelta(hours=24)
+    expected = {'expiry': 'members_active_expiry_idx', 'kick_scheduled_at': 'members_kick_scheduled_idx'}
+    for column, sql in _DUE_PASSES:
+        bound = cutoff if column == 'expiry' else now
+        scans = _explain(loop, pool, sql, bound, datetime.datetime.min, -1, '', 500, cutoff)
+        _assert_uses(scans, expected[column])
+
+
+def test_webhook_lookups_use_stripe_id_indexes(loop, pool):
+    scans = _explain(loop, pool, 'SELECT user_id, bot_name FROM members WHERE stripe_subscription_id = $1', 'sub_12345')
+    _assert_uses(scans, 'members_stripe_subscription_idx')
+    scans = _explain(loop, pool, 'SELECT user_id, bot_name FROM members WHERE stripe_customer_id = $1', 'cus_12345')
+    _assert_uses(scans, 'members_stripe_customer_idx')
@@ -1,86 +1,174 @@
 # transaction_report.py (전체 파일 교체 추천)
-import io
+import asyncio
+import csv
 import datetime
+import multiprocessing
+import os
+import re
+import shutil
+import tempfile
+import time
 import pytz
-import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
 from telegram import Update
 from telegram.ext import ContextTypes
-from bot_core.db import get_pool, log_action
-from config import ADMIN_USER_ID, STRIPE_SECRET_KEY
-import stripe
+from bot_core.db import get_pool, acquire
+from bot_core.export import build_export, XLSX_MAX_ROWS
+from bot_core.stripe_sync import reconcile_payments
+from config import ADMIN_USER_ID, EXPORT_WORKERS, EXPORT_FETCH_SIZE
 import logging
 
 logger = logging.getLogger(__name__)
 
-async def transactions_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user_id = update.effective_user.id
-    if user_id != ADMIN_USER_ID:
-        await update.message.reply_text("Admin only command.")
-        return
-
-    pool = await get_pool()
-    rows = await pool.fetch("""
-        SELECT 
+REPORT_TZ = pytz.timezone('America/Edmonton')
+
+# /transactions에서 bot_name으로 받을 수 있는 봇 키 (startup에서 registry 기준으로 설정)
+_bot_names = frozenset()
+
+# 숫자와 구분자로만 된 인자는 날짜로 보고 파싱 실패 시 오류 (오타가 봇 이름으로 취급되지 않도록)
+_DATE_LIKE = re.compile(r'[\d\-/.]+')
+
+def set_bot_names(names):
+    global _bot_names
+    _bot_names = frozenset(names)
+
+# 파일 생성은 CPU를 오래 쓰므로 별도 프로세스에서 (spawn: 실행 중인 이벤트 루프/스레드를 fork하지 않도록)
+_executor = None
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=EXPORT_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+    return _executor
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+def _local_day_to_utc(day):
+    return REPORT_TZ.localize(datetime.datetime.combine(day, datetime.time())).astimezone(pytz.utc).replace(tzinfo=None)
+
+def parse_export_args(args, bot_names=None):
+    """[YYYY-MM-DD [YYYY-MM-DD]] [bot_name] [xlsx|csv] — 날짜는 Edmonton 기준, 끝 날짜 포함.
+    잘못된 날짜나 등록되지 않은 봇 이름은 ValueError"""
+    bot_names = _bot_names if bot_names is None else bot_names
+    days, bot_name, fmt = [], None, 'xlsx'
+    for arg in args:
+        if arg.lower() in ('xlsx', 'csv'):
+            fmt = arg.lower()
+        elif _DATE_LIKE.fullmatch(arg):
+            try:
+                days.append(datetime.datetime.strptime(arg, "%Y-%m-%d").date())
+            except ValueError:
+                raise ValueError(f"invalid date: {arg}") from None
+        elif arg in bot_names:
+            bot_name = arg
+        else:
+            raise ValueError(f"unknown bot: {arg}")
+    if len(days) > 2:
+        raise ValueError("at most two dates")
+    return days, bot_name, fmt
+
+async def _spool_transactions(pool, path, start=None, end=None, bot_name=None):
+    """결제 로그를 서버 사이드 커서로 EXPORT_FETCH_SIZE씩 읽어 헤더 없는 CSV로 기록. 행 수 반환"""
+    conditions, params = ["dl.action LIKE 'payment_stripe%'"], []
+    if start:
+        params.append(start)
+        conditions.append(f"dl.timestamp >= ${len(params)}")
+    if end:
+        params.append(end)
+        conditions.append(f"dl.timestamp < ${len(params)}")
+    if bot_name:
+        params.append(bot_name)
+        conditions.append(f"dl.bot_name = ${len(params)}")
+    query = f"""
+        SELECT
             dl.timestamp,
             dl.amount,
-            (CASE WHEN dl.action LIKE 'payment_stripe%' THEN 'Success' ELSE 'Unknown' END) AS success,
-            (CASE 
-                WHEN dl.action LIKE 'payment_stripe_renewal%' THEN 'Renewal' 
-                ELSE 'New' 
-            END) AS payment_type,
+            dl.action,
+            dl.bot_name,
             m.email AS email,
             dl.user_id AS telegram_user_id,
             m.username AS telegram_username
         FROM daily_logs dl
         LEFT JOIN members m ON dl.user_id = m.user_id AND dl.bot_name = m.bot_name
-        WHERE dl.action LIKE 'payment_stripe%'
+        WHERE {' AND '.join(conditions)}
         ORDER BY dl.timestamp DESC
-    """)
+    """
+    rows = 0
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        async with acquire(pool) as conn:
+            async with conn.transaction():
+                cursor = await conn.cursor(query, *params)
+                while True:
+                    batch = await cursor.fetch(EXPORT_FETCH_SIZE)
+                    if not batch:
+                        break
+                    lines = [
+                        (r['timestamp'].isoformat(), r['amount'], r['action'], r['bot_name'] or '',
+                         r['email'] or '', r['telegram_user_id'], r['telegram_username'] or '')
+                        for r in batch
+                    ]
+                    # 파일 쓰기는 스레드에서 (배치 단위라 호출 횟수는 적음)
+                    await asyncio.to_thread(writer.writerows, lines)
+                    rows += len(batch)
+    return rows
 
-    if not rows:
-        await update.message.reply_text("No transaction data found.")
+async def transactions_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    if user_id != ADMIN_USER_ID:
+        await update.message.reply_text("Admin only command.")
         return
 
-    # DataFrame 생성 + 컬럼 수동 지정
-    columns = ['timestamp', 'amount', 'success', 'payment_type', 'email', 'telegram_user_id', 'telegram_username']
-    df = pd.DataFrame(rows, columns=columns)
-
-    logger.info(f"Columns in DataFrame: {df.columns.tolist()}")
-
-    # timestamp 컬럼 고정
-    time_col = 'timestamp'
-    if time_col not in df.columns:
-        logger.error("Timestamp column not found.")
-        await update.message.reply_text("내부 오류: 날짜 컬럼 없음.")
+    try:
+        days, bot_name, fmt = parse_export_args(context.args or [])
+    except ValueError as e:
+        await update.message.reply_text(f"{e}\nUsage: /transactions [YYYY-MM-DD [YYYY-MM-DD]] [bot_name] [xlsx|csv]")
         return
 
-    # 시간대 변환
-    edmonton_tz = pytz.timezone('America/Edmonton')
-    df[time_col] = df[time_col].apply(
-        lambda x: x.replace(tzinfo=pytz.utc) if x and getattr(x, 'tzinfo', None) is None else x
-    )
-    df['payment_time_edmonton'] = df[time_col].apply(
-        lambda x: x.astimezone(edmonton_tz).strftime('%Y-%m-%d %H:%M:%S') if x else 'N/A'
-    )
-
-    df['email'] = df['email'].apply(lambda x: x if x and x != 'unknown' else '')
-
-    final_columns = ['payment_time_edmonton', 'amount', 'success', 'payment_type', 'email', 'telegram_user_id', 'telegram_username']
-    available_columns = [col for col in final_columns if col in df.columns]
-    df = df[available_columns]
+    start = _local_day_to_utc(days[0]) if days else None
+    end = _local_day_to_utc(days[-1] + datetime.timedelta(days=1)) if days else None
+    scope = [' ~ '.join(str(d) for d in days)] if days else []
+    if bot_name:
+        scope.append(bot_name)
 
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='Transactions')
-
-    output.seek(0)
-
-    await context.bot.send_document(
-        chat_id=user_id,
-        document=output,
-        filename='transactions.xlsx',
-        caption="Transaction report (Edmonton time, sorted by date DESC)"
-    )
+    started = time.perf_counter()
+    workdir = tempfile.mkdtemp(prefix='transactions-')
+    try:
+        raw_path = os.path.join(workdir, 'raw.csv')
+        count = await _spool_transactions(await get_pool(), raw_path, start, end, bot_name)
+        if not count:
+            await update.message.reply_text("No transaction data found.")
+            return
+        # xlsx 시트 한도를 넘으면 csv.gz로
+        if fmt == 'xlsx' and count > XLSX_MAX_ROWS:
+            fmt = 'csv'
+        filename = 'transactions.xlsx' if fmt == 'xlsx' else 'transactions.csv.gz'
+        out_path = os.path.join(workdir, filename)
+        written = await asyncio.get_running_loop().run_in_executor(
+            _get_executor(), build_export, raw_path, out_path, fmt, REPORT_TZ.zone
+        )
+        elapsed = time.perf_counter() - started
+        with open(out_path, 'rb') as f:
+            await context.bot.send_document(
+                chat_id=user_id,
+                document=f,
+                filename=filename,
+                caption=(
+                    f"Transaction report (Edmonton time, sorted by date DESC)"
+                    f"{' — ' + ', '.join(scope) if scope else ''}\n"
+                    f"{written} rows in {elapsed:.1f}s"
+                )
+            )
+        logger.info(f"/transactions exported {written} rows ({fmt}) in {elapsed:.2f}s")
+    except Exception as e:
+        logger.error(f"/transactions error: {e}")
+        await update.message.reply_text(f"Export failed: {str(e)}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
 
 async def sync_stripe_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
@@ -88,26 +176,16 @@ async def sync_stripe_command(update: Update, context: ContextTypes.DEFAULT_TYPE
         await update.message.reply_text("Admin only command.")
         return
 
-    stripe.api_key = STRIPE_SECRET_KEY
-    pool = await get_pool()
-    synced_count = 0
-
+    # /sync_stripe → 마지막 동기화 이후만, /sync_stripe full → 전체 이력 재확인
+    full = bool(context.args) and context.args[0] == 'full'
     try:
-        payments = stripe.PaymentIntent.list(limit=100, status="succeeded")
-        for pi in payments.auto_paging_iter():
-            user_id_str = pi.metadata.get('user_id')
-            if not user_id_str:
-                continue
-            user_id = int(user_id_str)
-            bot_name = pi.metadata.get('bot_name', 'unknown')
-            plan = pi.metadata.get('plan', 'monthly')
-            amount = pi.amount / 100.0
-
-            if bot_name != 'unknown':
-                await log_action(pool, user_id, f'payment_stripe_{plan}', amount, bot_name)
-                synced_count += 1
-
-        await update.message.reply_text(f"Stripe에서 {synced_count}건의 결제 내역을 DB에 동기화했습니다.")
+        stats = await reconcile_payments(await get_pool(), full=full)
+        await update.message.reply_text(
+            f"Stripe에서 {stats['inserted']}건의 새 결제 내역을 DB에 동기화했습니다.\n\n"
+            f"• 조회: {stats['fetched']} (성공 {stats['succeeded']}, 메타데이터 없음 {stats['skipped']})\n"
+            f"• 과거 결제 대조용 등록 (집계 제외): {stats['backfilled']}\n"
+            f"• 소요: {stats['elapsed_s']}s"
+        )
     except Exception as e:
         logger.error(f"Stripe sync error: {e}")
         await update.message.reply_text(f"동기화 실패: {str(e)}")